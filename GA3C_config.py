@@ -1,4 +1,4 @@
-from gym_collision_avoidance.envs.policies.GA3C_CADRL.network import Actions, Actions_Plus
+from gym_collision_avoidance.envs.policies.GA3C_CADRL.actions import Actions, Actions_Plus
 
 GA3C_config = {
     11:{
@@ -12,7 +12,7 @@ print(f"{'='*140}\n GPU: {tf.config.list_physical_devices('GPU')}\n{'='*140}")
 from gym_collision_avoidance.envs import Config
 from gym_collision_avoidance.experiments.src.env_utils import create_env, run_episode
 from gym_collision_avoidance.envs import test_cases as tc
-from gym_collision_avoidance.envs.policies.GA3C_CADRL.network import Actions, Actions_Plus
+from gym_collision_avoidance.envs.policies.GA3C_CADRL.actions import Actions, Actions_Plus
 from GA3C_config import GA3C_config
 
 start = datetime.datetime.now()
@@ -36,6 +36,7 @@ Config.MAX_NUM_AGENTS_TO_SIM = NUM_AGENTS[-1]
 Config.MAX_NUM_OTHER_AGENTS_OBSERVED = NUM_AGENTS[-1] - 1
 Config.SAVE_EPISODE_PLOTS = False
 Config.TRAIN_SINGLE_AGENT = False
+Config.RECORD_ALL_OBSERVATIONS = True  # every agent's obs goes into the dataset
 Config.setup_obs()
 
 env = create_env()
@@ -64,6 +64,8 @@ def main():
     Config.RECORD_PICKLE_FILES = True
     Config.GENERATE_DATASET = True
     Config.D4RL = True
+    # (the D4RL dataset stores every agent's observation, even RVO agents that ignore theirs)
+    Config.RECORD_ALL_OBSERVATIONS = True
     Config.PLT_LIMITS = [[-8, 8], [-8, 8]]
 
     # REWARD params
@@ -1,9 +1,82 @@
+import hashlib
+import os
+
 import numpy as np
 import imageio
-import scipy.misc
+import scipy.ndimage
+import yaml
+
+from gym_collision_avoidance.envs import Config
+
+# Arrays derived from a map file that get cached on disk (see Map.load_cached_static_map)
+STATIC_MAP_FIELDS = ['static_map', 'static_clearance_sq', 'static_clearance']
+
+def read_map_metadata(map_filename):
+    """ World size of a map file, from the yaml file next to it (e.g., :code:`world_maps/001.yaml` for :code:`world_maps/001.png`)
+
+    The yaml file has keys :code:`x_width`, :code:`y_width` (meters) and :code:`grid_cell_size` (meters/grid cell).
+    Any that are missing (or the whole file) default to Config.STATIC_MAP_X_WIDTH, STATIC_MAP_Y_WIDTH, STATIC_MAP_GRID_CELL_SIZE.
+    Large worlds can also set :code:`tile_size` (and optionally :code:`halo`), to be loaded as a
+    :class:`~gym_collision_avoidance.envs.tiled_map.TiledMap`.
+
+    Args:
+        map_filename (str): path of the map image (or None for an empty map)
+
+    Returns:
+        metadata (dict): keyword args of :class:`Map` (or :class:`~gym_collision_avoidance.envs.tiled_map.TiledMap`)
+
+    """
+    metadata = {}
+    if map_filename is not None:
+        metadata_filename = os.path.splitext(map_filename)[0] + '.yaml'
+        if os.path.isfile(metadata_filename):
+            with open(metadata_filename, 'r') as f:
+                metadata = yaml.safe_load(f) or {}
+    map_args = {
+        'x_width': metadata.get('x_width', Config.STATIC_MAP_X_WIDTH),
+        'y_width': metadata.get('y_width', Config.STATIC_MAP_Y_WIDTH),
+        'grid_cell_size': metadata.get('grid_cell_size', Config.STATIC_MAP_GRID_CELL_SIZE),
+    }
+    for key in ['tile_size', 'halo']:
+        if key in metadata:
+            map_args[key] = metadata[key]
+    return map_args
+
+def map_cache_prefix(map_filename, cache_dir, params):
+    """ Path prefix (in cache_dir) of the files preprocessed from map_filename with params
+
+    The key covers the file's path, size and modification time, so editing the image invalidates its cache entries.
+    """
+    stat = os.stat(map_filename)
+    key = hashlib.sha1(repr((os.path.abspath(map_filename), stat.st_size, stat.st_mtime_ns, params)).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, '{}_{}'.format(os.path.splitext(os.path.basename(map_filename))[0], key))
+
+def nearest_indices(num_in, num_out):
+    """ For each of num_out pixels along an axis resized (nearest neighbor) from num_in pixels, the index of its source pixel
+    """
+    # Source pixel of each output pixel's center, accumulated step by step like PIL does (so ties round the same way)
+    scale = num_in / float(num_out)
+    return np.floor(np.cumsum(np.r_[0.5*scale, np.full(num_out-1, scale)])).astype(int)
+
+def resize_nearest(image, dims):
+    """ Nearest-neighbor resize of a 2D image (same sampling as the old :code:`scipy.misc.imresize(image, dims, interp='nearest')`)
+    """
+    rows = nearest_indices(image.shape[0], dims[0])
+    cols = nearest_indices(image.shape[1], dims[1])
+    return image[rows[:, np.newaxis], cols[np.newaxis, :]]
 
 class Map():
-    def __init__(self, x_width, y_width, grid_cell_size, map_filename=None):
+    """ Occupancy grid of the world: static obstacles (from an image file) and the agents' current footprints
+
+    :param x_width: (float) meters of world covered by the map
+    :param y_width: (float) meters of world covered by the map
+    :param grid_cell_size: (float) meters/grid cell
+    :param map_filename: (str) path of a binary image (black is occupied, white is free), or None for an empty map
+    :param cache_dir: (str) if given, directory where the preprocessed map file (and its clearance fields) are stored as .npy files,
+        which later Maps of the same file memory-map instead of re-reading/processing the image
+
+    """
+    def __init__(self, x_width, y_width, grid_cell_size, map_filename=None, cache_dir=None):
         # Set desired map parameters (regardless of actual image file dims)
         self.x_width = x_width
         self.y_width = y_width
@@ -11,31 +84,108 @@ class Map():
 
         # Load the image file corresponding to the static map, and resize according to desired specs
         dims = (int(self.x_width/self.grid_cell_size),int(self.y_width/self.grid_cell_size))
+        self.dims = dims
+        self.origin_coords = np.array([(self.x_width/2.)/self.grid_cell_size, (self.y_width/2.)/self.grid_cell_size])
         if map_filename is None:
             self.static_map = np.zeros(dims, dtype=bool)
+            self.init_clearance()
+        elif cache_dir is None:
+            self.static_map = self.load_static_map(map_filename, dims)
+            self.init_clearance()
         else:
-            self.static_map = imageio.imread(map_filename)
-            if self.static_map.shape != dims:
-                # print("Resizing map from: {} to {}".format(self.static_map.shape, dims))
-                self.static_map = scipy.misc.imresize(self.static_map, dims, interp='nearest')
-            self.static_map = np.invert(self.static_map).astype(bool)
+            self.load_cached_static_map(map_filename, dims, cache_dir)
 
-        self.origin_coords = np.array([(self.x_width/2.)/self.grid_cell_size, (self.y_width/2.)/self.grid_cell_size])
         self.map = None # This will store the current static+dynamic map at each timestep
+        # self.map is a view into the center of self.padded_map, which has map_padding free cells on every side
+        self.padded_map = None
+        self.map_padding = 0
+        self.map_static_map = None
+        self.init_agent_layer()
+
+    def init_agent_layer(self):
+        """ Set up the bookkeeping of the agents stamped into the map (no agents yet) """
+        # Cell and radius of each agent stamped into the map (None if off the map), as of the last add_agents_to_map
+        self.agent_stamps = None
+        # Centers/radii (in cells) of the agents stamped into the map, as of the last add_agents_to_map
+        self.agent_cells = np.zeros((0, 2), dtype=int)
+        self.agent_cell_radii = np.zeros((0,))
+        # Disc of cells covered by an agent of each radius, keyed by radius
+        self.agent_stencils = {}
+
+    @staticmethod
+    def load_static_map(map_filename, dims):
+        """ Read a map image, resize it to dims (nearest neighbor) and binarize it (True where occupied, i.e., anything but white)
+        """
+        static_map = imageio.imread(map_filename)
+        if static_map.shape != dims:
+            # print("Resizing map from: {} to {}".format(static_map.shape, dims))
+            static_map = resize_nearest(static_map, dims)
+        return np.invert(static_map).astype(bool)
+
+    def load_cached_static_map(self, map_filename, dims, cache_dir):
+        """ Set static_map and its clearance fields from .npy files in cache_dir (memory-mapped, read-only)
+
+        The first time a map file is used at some dims, it gets preprocessed (:meth:`load_static_map`, :meth:`init_clearance`) and saved.
+
+        """
+        prefix = self.cache_prefix(map_filename, cache_dir)
+        filenames = {field: '{}_{}.npy'.format(prefix, field) for field in STATIC_MAP_FIELDS}
+
+        if not all(os.path.isfile(filename) for filename in filenames.values()):
+            self.static_map = self.load_static_map(map_filename, dims)
+            self.init_clearance()
+            # (only readable by this user, as the cached files get memory-mapped as is)
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            for field, filename in filenames.items():
+                # Write to a temp file first so that other processes never memory-map a partial file
+                tmp_filename = '{}.{}.tmp.npy'.format(filename[:-len('.npy')], os.getpid())
+                np.save(tmp_filename, getattr(self, field))
+                os.replace(tmp_filename, filename)
+
+        for field, filename in filenames.items():
+            setattr(self, field, np.load(filename, mmap_mode='r'))
+
+    def cache_prefix(self, map_filename, cache_dir, *params):
+        """ Path prefix (in cache_dir) of the files preprocessed from map_filename for this map (see :func:`map_cache_prefix`)
+
+        The key covers the map's dims and grid_cell_size (clearance fields are stored in meters), plus any extra params.
+        """
+        return map_cache_prefix(map_filename, cache_dir, (self.dims, self.grid_cell_size) + params)
+
+    def init_clearance(self):
+        """ Precompute distance transforms (clearance fields) of static_map, so wall checks are lookups instead of scans of the grid
+
+        - :code:`static_clearance_sq`: for each cell, squared distance (center to center, in cells) to the nearest occupied cell.
+          Those are integers, so they are stored exactly (inf if the map is empty).
+        - :code:`static_clearance`: for each cell, the gap [m] between that cell's square and the nearest occupied square,
+          i.e., how far every point in the cell is guaranteed to be from a wall. (Squares within a cell of each other touch,
+          so that's the center-to-center distance to the nearest cell of static_map grown by one cell in every direction.)
+
+        """
+        if np.any(self.static_map):
+            nearest_i, nearest_j = scipy.ndimage.distance_transform_edt(
+                np.invert(self.static_map), return_distances=False, return_indices=True)
+            i, j = np.indices(self.static_map.shape)
+            self.static_clearance_sq = ((nearest_i - i)**2 + (nearest_j - j)**2).astype(float)
+            grown_map = scipy.ndimage.binary_dilation(self.static_map, structure=np.ones((3, 3), dtype=bool))
+            self.static_clearance = scipy.ndimage.distance_transform_edt(np.invert(grown_map)) * self.grid_cell_size
+        else:
+            self.static_clearance_sq = np.full(self.static_map.shape, np.inf)
+            self.static_clearance = np.full(self.static_map.shape, np.inf)
 
     def world_coordinates_to_map_indices(self, pos):
         # for a single [px, py] -> [gx, gy]
         gx = int(np.floor(self.origin_coords[0]-pos[1]/self.grid_cell_size))
         gy = int(np.floor(self.origin_coords[1]+pos[0]/self.grid_cell_size))
         grid_coords = np.array([gx, gy])
-        in_map = gx >= 0 and gy >= 0 and gx < self.map.shape[0] and gy < self.map.shape[1]
+        in_map = gx >= 0 and gy >= 0 and gx < self.dims[0] and gy < self.dims[1]
         return grid_coords, in_map
 
     def world_coordinates_to_map_indices_vec(self, pos):
         # for a 3d array of [[[px, py]]] -> gx=[...], gy=[...]
         gxs = np.floor(self.origin_coords[0]-pos[:,:,1]/self.grid_cell_size).astype(int)
         gys = np.floor(self.origin_coords[1]+pos[:,:,0]/self.grid_cell_size).astype(int)
-        in_map = np.logical_and.reduce((gxs >= 0, gys >= 0, gxs < self.map.shape[0], gys < self.map.shape[1]))
+        in_map = np.logical_and.reduce((gxs >= 0, gys >= 0, gxs < self.dims[0], gys < self.dims[1]))
         
         # gxs, gys filled to -1 if outside map to ensure you don't query pts outside map
         not_in_map_inds = np.where(in_map == False)
@@ -43,11 +193,231 @@ class Map():
         gys[not_in_map_inds] = -1
         return gxs, gys, in_map
 
+    def world_coordinates_to_cell_coords(self, pos):
+        # for a 2d array of [[px, py]] -> continuous [[gx, gy]], where cell (gx, gy) spans [gx, gx+1) x [gy, gy+1)
+        return np.stack([self.origin_coords[0]-pos[:,1]/self.grid_cell_size,
+                         self.origin_coords[1]+pos[:,0]/self.grid_cell_size], axis=-1)
+
+    def world_coordinates_to_map_indices_arr(self, pos):
+        # for a 2d array of [[px, py]] -> (gx, gy) arrays and in_map, all of shape (N,)
+        cell_coords = np.floor(self.world_coordinates_to_cell_coords(pos)).astype(int)
+        gxs, gys = cell_coords[:,0], cell_coords[:,1]
+        in_map = (gxs >= 0) & (gys >= 0) & (gxs < self.dims[0]) & (gys < self.dims[1])
+        return gxs, gys, in_map
+
+    def lookup(self, field, gxs, gys):
+        """ Gather a per-cell array (:code:`'map'`, :code:`'static_clearance_sq'` or :code:`'static_clearance'`) at cells (gxs, gys)
+
+        All reads of the map's cells go through here (or :meth:`get_windows`), so that other storage backends
+        (e.g., :class:`~gym_collision_avoidance.envs.tiled_map.TiledMap`) only need to override these.
+
+        Args:
+            field (str): name of the per-cell array
+            gxs (np array): row indices (any shape, all in the map)
+            gys (np array): col indices (broadcastable with gxs, all in the map)
+
+        Returns:
+            values (np array): field[gxs, gys]
+
+        """
+        return getattr(self, field)[gxs, gys]
+
+    def occupied(self, gxs, gys):
+        """ Whether each cell (gxs, gys) of self.map is occupied (False for cells off the map)
+        """
+        in_map = (gxs >= 0) & (gys >= 0) & (gxs < self.dims[0]) & (gys < self.dims[1])
+        return in_map & self.lookup('map', np.where(in_map, gxs, 0), np.where(in_map, gys, 0))
+
+    def get_windows(self, i_low, j_low, num_rows, num_cols):
+        """ Cut a (num_rows x num_cols) window out of self.map at each upper-left cell (i_low, j_low) (free space off the map)
+
+        Each window is a plain slice of :meth:`get_padded_map`, so all of them come out of one indexing call on a sliding-window view.
+
+        Args:
+            i_low (np array): (N,) row of each window's upper-left cell
+            j_low (np array): (N,) col of each window's upper-left cell
+            num_rows (int): rows per window
+            num_cols (int): cols per window
+
+        Returns:
+            windows (np array): (N x num_rows x num_cols) bool
+
+        """
+        # Padding as wide as the window: windows that miss the map land entirely in free space
+        padded_map, padding = self.get_padded_map(max(num_rows, num_cols))
+        i_low = np.clip(i_low + padding, 0, padded_map.shape[0] - num_rows)
+        j_low = np.clip(j_low + padding, 0, padded_map.shape[1] - num_cols)
+        return np.lib.stride_tricks.sliding_window_view(padded_map, (num_rows, num_cols))[i_low, j_low]
+
+    def in_static_collision(self, pos, radius):
+        """ Whether each disc overlaps an occupied cell of static_map (same test as :meth:`get_agent_map_indices` masks, in O(1) per disc)
+
+        Args:
+            pos (np array): (N x 2) disc centers in the global frame
+            radius (np array): (N,) disc radii in meters
+
+        Returns:
+            in_collision (np array): (N,) bool, False for discs centered outside the map
+        """
+        gxs, gys, in_map = self.world_coordinates_to_map_indices_arr(pos)
+        clearance_sq = self.lookup('static_clearance_sq', np.where(in_map, gxs, 0), np.where(in_map, gys, 0))
+        return in_map & (clearance_sq < (radius/self.grid_cell_size)**2)
+
+    def agents_within(self, pos, radius):
+        """ Which of the agents in self.agent_cells could cover a cell within :code:`radius` of each point
+
+        Args:
+            pos (np array): (N x 2) points in the global frame
+            radius (float): meters
+
+        Returns:
+            agent_inds (np array): (N x K) indices into self.agent_cells, padded with -1
+
+        """
+        rel = self.world_coordinates_to_cell_coords(pos)[:, np.newaxis, :] - (self.agent_cells[np.newaxis, :, :] + 0.5)
+        reachable = np.sqrt(rel[:,:,0]**2 + rel[:,:,1]**2) - self.agent_cell_radii - np.sqrt(2)/2 <= radius/self.grid_cell_size
+        num_reachable = np.sum(reachable, axis=1)
+        agent_inds = np.full((len(pos), np.max(num_reachable, initial=0)), -1)
+        agent_inds[np.arange(agent_inds.shape[1]) < num_reachable[:, np.newaxis]] = np.nonzero(reachable)[1]
+        return agent_inds
+
+    def clearance_lower_bound(self, pos, agent_inds=None):
+        """ A lower bound on how far [m] each point is from every occupied cell of self.map (walls and agents)
+
+        Walls come from :code:`static_clearance`. Each agent's cells (centers within its cell radius of the center of
+        the agent's cell) are at least that radius + sqrt(2)/2 cells closer to a point than the center of the agent's cell.
+
+        Args:
+            pos (np array): (N x 2) points in the global frame
+            agent_inds (np array): optional (N x K) the only agents (indices into self.agent_cells, -1 for none) that
+                each point needs to stay clear of, e.g., from :meth:`agents_within` (default: all of them)
+
+        Returns:
+            clearance (np array): (N,) meters (may be negative, i.e. no guarantee)
+
+        """
+        cell_coords = self.world_coordinates_to_cell_coords(pos)
+        # Points outside the map are at least as far from every wall as the cell on the border closest to them
+        gxs = np.clip(np.floor(cell_coords[:,0]).astype(int), 0, self.dims[0]-1)
+        gys = np.clip(np.floor(cell_coords[:,1]).astype(int), 0, self.dims[1]-1)
+        clearance = self.lookup('static_clearance', gxs, gys)
+
+        if agent_inds is None:
+            agent_inds = np.broadcast_to(np.arange(len(self.agent_cells)), (len(pos), len(self.agent_cells)))
+        if agent_inds.shape[1] > 0:
+            # (index -1 picks an agent infinitely far away)
+            centers = np.append(self.agent_cells + 0.5, [[np.inf, np.inf]], axis=0)
+            reach = np.append(self.agent_cell_radii + np.sqrt(2)/2, 0.)
+            dx = cell_coords[:, 0, np.newaxis] - centers[agent_inds, 0]
+            dy = cell_coords[:, 1, np.newaxis] - centers[agent_inds, 1]
+            agent_clearance = np.sqrt(dx*dx + dy*dy) - reach[agent_inds]
+            clearance = np.minimum(clearance, np.min(agent_clearance, axis=1) * self.grid_cell_size)
+        return clearance
+
     def add_agents_to_map(self, agents):
-        self.map = self.static_map.copy()
+        """ Bring self.map (static_map + the disc of cells covered by each agent) up to date with the agents' current positions
+
+        Instead of redrawing the whole map, self.agent_counts keeps how many agents cover each cell. Only agents that moved to
+        another cell (or changed radius) since the last call are unstamped from their old cells and stamped at the new ones,
+        and only the cells in those stamps' bounding boxes are refreshed in self.map.
+
+        Args:
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` (each agent is matched with the one at the same index last call)
+
+        """
+        if self.agent_stamps is None or self.map_static_map is not self.static_map:
+            # First call (or static_map was swapped out): start from an empty map
+            self._clear_agents()
+            self.agent_stamps = []
+
+        stamps = []
         for agent in agents:
-            mask = self.get_agent_mask(agent.pos_global_frame, agent.radius)
-            self.map[mask] = 255
+            [gx, gy], in_map = self.world_coordinates_to_map_indices(agent.pos_global_frame)
+            stamps.append((gx, gy, agent.radius) if in_map else None)
+
+        changed_boxes = []
+        for k in range(max(len(stamps), len(self.agent_stamps))):
+            old_stamp = self.agent_stamps[k] if k < len(self.agent_stamps) else None
+            new_stamp = stamps[k] if k < len(stamps) else None
+            if old_stamp == new_stamp:
+                continue
+            if old_stamp is not None:
+                changed_boxes.append(self._stamp_agent(*old_stamp, count=-1))
+            if new_stamp is not None:
+                changed_boxes.append(self._stamp_agent(*new_stamp, count=1))
+        for box in changed_boxes:
+            self._refresh_map(box)
+        self.agent_stamps = stamps
+
+        stamps = [stamp for stamp in stamps if stamp is not None]
+        self.agent_cells = np.array([stamp[:2] for stamp in stamps], dtype=int).reshape(-1, 2)
+        self.agent_cell_radii = np.array([stamp[2]/self.grid_cell_size for stamp in stamps])
+
+    def get_padded_map(self, padding):
+        """ self.map surrounded by (at least) :code:`padding` free cells on every side, so windows around any cell of self.map are plain slices
+
+        The padded map shares memory with self.map (which is updated in place), so it only gets reallocated when more padding is asked for.
+
+        Args:
+            padding (int): min number of free cells needed on each side of self.map
+
+        Returns:
+            padded_map (np array): ((self.map.shape[0] + 2*map_padding) x (self.map.shape[1] + 2*map_padding)) bool
+            map_padding (int): number of free cells on each side (self.map[i, j] is padded_map[i + map_padding, j + map_padding])
+
+        """
+        if padding > self.map_padding or self.padded_map is None:
+            self._allocate_map(max(padding, self.map_padding), self.static_map if self.map is None else self.map)
+        return self.padded_map, self.map_padding
+
+    def _allocate_map(self, padding, contents):
+        # Point self.map at the center of a freshly allocated padded_map (filled with a copy of contents)
+        self.padded_map = np.zeros((self.static_map.shape[0]+2*padding, self.static_map.shape[1]+2*padding), dtype=bool)
+        self.map = self.padded_map[padding:padding+self.static_map.shape[0], padding:padding+self.static_map.shape[1]]
+        self.map[:] = contents
+        self.map_padding = padding
+
+    def _clear_agents(self):
+        # self.map = static_map, with no agents counted anywhere
+        self._allocate_map(self.map_padding, self.static_map)
+        self.map_static_map = self.static_map
+        self.agent_counts = np.zeros(self.static_map.shape, dtype=np.int32)
+
+    def _refresh_map(self, box):
+        # Redraw the cells of self.map in box from static_map and agent_counts
+        self.map[box] = self.static_map[box] | (self.agent_counts[box] > 0)
+
+    def _stamp_agent(self, gx, gy, radius, count):
+        """ Add count to self.agent_counts over the disc of cells that an agent of this radius in cell (gx, gy) covers
+
+        Returns:
+            box (tuple): slices of the stencil's bounding box (clipped to the map)
+        """
+        stencil, box, stencil_box = self._get_stencil(gx, gy, radius)
+        self.agent_counts[box] += count*stencil[stencil_box]
+        return box
+
+    def _get_stencil(self, gx, gy, radius):
+        """ Disc of cells covered by an agent of this radius in cell (gx, gy)
+
+        Returns:
+            stencil (np array): bool square around the agent's cell
+            box (tuple): slices of the stencil's bounding box in the map (clipped to the map)
+            stencil_box (tuple): slices of the stencil that fall in box
+        """
+        stencil = self.agent_stencils.get(radius)
+        if stencil is None:
+            # Same cells as get_agent_map_indices: index distance from the agent's cell < radius (in cells)
+            reach = int(np.ceil(radius/self.grid_cell_size))
+            d = np.arange(-reach, reach+1)
+            stencil = (d[np.newaxis,:])**2 + (d[:,np.newaxis])**2 < (radius/self.grid_cell_size)**2
+            self.agent_stencils[radius] = stencil
+        reach = stencil.shape[0] // 2
+        i_low, i_high = max(gx-reach, 0), min(gx+reach+1, self.dims[0])
+        j_low, j_high = max(gy-reach, 0), min(gy+reach+1, self.dims[1])
+        box = (slice(i_low, i_high), slice(j_low, j_high))
+        stencil_box = (slice(i_low-(gx-reach), i_high-(gx-reach)), slice(j_low-(gy-reach), j_high-(gy-reach)))
+        return stencil, box, stencil_box
 
     def get_agent_map_indices(self, pos, radius):
         x = np.arange(0, self.map.shape[1])
@@ -1,8 +1,64 @@
 import numpy as np
 from gym_collision_avoidance.envs import Config
-from gym_collision_avoidance.envs.util import wrap, find_nearest
+from gym_collision_avoidance.envs.util import wrap, wrap_array, find_nearest
+from gym_collision_avoidance.envs import world_state as ws
+from gym_collision_avoidance.envs.world_state import WorldState
 import operator
 import math
+import ast
+
+def _world_state_property(field):
+    """ Agent attribute stored in row :code:`agent._world_index` of :code:`agent._world_state.<field>` """
+    def fget(self):
+        return getattr(self._world_state, field)[self._world_index]
+    def fset(self, value):
+        getattr(self._world_state, field)[self._world_index] = value
+    return property(fget, fset)
+
+def _status_property(bit):
+    """ Boolean Agent attribute stored as one bit of :code:`agent._world_state.status` """
+    def fget(self):
+        return bool(self._world_state.status[self._world_index] & bit)
+    def fset(self, value):
+        if value:
+            self._world_state.status[self._world_index] |= bit
+        else:
+            self._world_state.status[self._world_index] &= ~np.uint8(bit)
+    return property(fget, fset)
+
+_state_accessors = {}
+
+def get_state_accessor(attr):
+    """ Function of an agent that returns the value described by a :code:`Config.STATE_INFO_DICT[state]['attr']` string
+
+    Each string is only parsed the first time it's seen, so observations don't need to :code:`eval` it on every step.
+
+    Args:
+        attr (str): e.g., :code:`'get_agent_data("radius")'`, evaluated as if it were :code:`"self." + attr`
+
+    Returns:
+        accessor (function): maps an :class:`~gym_collision_avoidance.envs.agent.Agent` to that value
+
+    """
+    if attr not in _state_accessors:
+        _state_accessors[attr] = _compile_state_accessor(attr)
+    return _state_accessors[attr]
+
+def _compile_state_accessor(attr):
+    node = ast.parse(attr, mode='eval').body
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords \
+            and all(isinstance(arg, ast.Constant) for arg in node.args):
+        method = node.func.id
+        args = tuple(arg.value for arg in node.args)
+        if method == 'get_agent_data' and len(args) == 1:
+            return operator.attrgetter(args[0])
+        if method == 'get_agent_data_equiv' and len(args) == 2:
+            getter, value = operator.attrgetter(args[0]), args[1]
+            return lambda agent: getter(agent) == value
+        return lambda agent: getattr(agent, method)(*args)
+    # Anything fancier is still compiled only once
+    code = compile("self." + attr, '<STATE_INFO_DICT>', 'eval')
+    return lambda agent: eval(code, {}, {'self': agent})
 
 class Agent(object):
     """ A disc-shaped object that has a policy, dynamics, sensors, and can move through the environment
@@ -25,9 +81,40 @@ class Agent(object):
     :param near_goal_threshold: (float) once within this distance to goal, say that agent has reached goal
     :param dt_nominal: (float) time in seconds of each simulation step
 
+    The agent's position, velocity, goal, radius, pref speed, heading, ego frame, timers and done-flags live in a
+    :class:`~gym_collision_avoidance.envs.world_state.WorldState`. On its own, an agent owns a 1-row WorldState;
+    once the environment calls :code:`bind_world_state`, those attributes become views into the env's arrays.
+
     """
+
+    pos_global_frame = _world_state_property('pos_global_frame')
+    vel_global_frame = _world_state_property('vel_global_frame')
+    goal_global_frame = _world_state_property('goal_global_frame')
+    radius = _world_state_property('radius')
+    pref_speed = _world_state_property('pref_speed')
+    heading_global_frame = _world_state_property('heading_global_frame')
+    speed_global_frame = _world_state_property('speed_global_frame')
+    delta_heading_global_frame = _world_state_property('delta_heading_global_frame')
+    turning_dir = _world_state_property('turning_dir')
+    dist_to_goal = _world_state_property('dist_to_goal')
+    ref_prll = _world_state_property('ref_prll')
+    ref_orth = _world_state_property('ref_orth')
+    heading_ego_frame = _world_state_property('heading_ego_frame')
+    vel_ego_frame = _world_state_property('vel_ego_frame')
+    t = _world_state_property('t')
+    time_remaining_to_reach_goal = _world_state_property('time_remaining_to_reach_goal')
+
+    is_at_goal = _status_property(ws.AT_GOAL)
+    was_at_goal_already = _status_property(ws.WAS_AT_GOAL_ALREADY)
+    in_collision = _status_property(ws.IN_COLLISION)
+    was_in_collision_already = _status_property(ws.WAS_IN_COLLISION_ALREADY)
+    ran_out_of_time = _status_property(ws.RAN_OUT_OF_TIME)
+    is_done = _status_property(ws.IS_DONE)
+
     def __init__(self, start_x, start_y, goal_x, goal_y, radius,
                  pref_speed, initial_heading, policy, dynamics_model, sensors, id):
+        self.bind_world_state(WorldState(1), 0)
+
         self.policy = policy()
         self.dynamics_model = dynamics_model(self)
         self.sensors = [sensor() for sensor in sensors]
@@ -45,6 +132,9 @@ class Agent(object):
 
         self.num_other_agents_observed = 0
 
+        # Reused by get_observation_dict, keyed by state name
+        self._observation_buffers = {}
+
         self.min_x = -18.0
         self.max_x = 18.0
         self.min_y = -18.0
@@ -139,14 +229,40 @@ class Agent(object):
 
 
     def __deepcopy__(self, memo):
-        """ Copy every attribute about the agent except its policy (since that may contain MBs of DNN weights) """
+        """ Copy every attribute about the agent except its policy (since that may contain MBs of DNN weights)
+
+        The copy gets its own 1-row WorldState, so it keeps this agent's state even after the env's arrays change.
+        """
         cls = self.__class__
         obj = cls.__new__(cls)
         for k, v in self.__dict__.items():
             if k != 'policy':
                 setattr(obj, k, v)
+        obj.bind_world_state(WorldState(1), 0)
         return obj
 
+    def bind_world_state(self, world_state, index):
+        """ Store this agent's state in row :code:`index` of :code:`world_state` (copying over its current state, if any).
+
+        Args:
+            world_state (:class:`~gym_collision_avoidance.envs.world_state.WorldState`): arrays that should hold this agent's state
+            index (int): which row of those arrays belongs to this agent
+
+        """
+        if '_world_state' in self.__dict__:
+            world_state.copy_row(index, self._world_state, self._world_index)
+        self._world_state = world_state
+        self._world_index = index
+
+    @property
+    def world_state(self):
+        """ The :class:`~gym_collision_avoidance.envs.world_state.WorldState` holding this agent's state (row :code:`self.world_index`) """
+        return self._world_state
+
+    @property
+    def world_index(self):
+        return self._world_index
+
     def _check_if_at_goal(self):
         """ Set :code:`self.is_at_goal` if norm(pos_global_frame - goal_global_frame) <= near_goal_threshold """
         is_near_goal = (self.pos_global_frame[0] - self.goal_global_frame[0])**2 + (self.pos_global_frame[1] - self.goal_global_frame[1])**2 <= self.near_goal_threshold**2
@@ -197,7 +313,27 @@ class Agent(object):
             dt (float): time in seconds to execute :code:`action`
 
         """
+        if not self.prepare_action(action):
+            return
+
+        # In the case of ExternalDynamics, this call does nothing,
+        # but set_state should have been called instead
+        self.dynamics_model.step(action, dt)
+
+        self.dynamics_model.update_ego_frame()
+
+        self.finish_action(dt)
+
+    def prepare_action(self, action):
+        """ First part of :meth:`take_action` (before the dynamics update): stop if done, otherwise store action and current ego frame.
+
+        Args:
+            action (list): the command this agent is about to take
 
+        Returns:
+            moving (bool): False if the agent is done (and should ignore action), True if the dynamics should be stepped
+
+        """
         # Agent is done if any of these conditions hold (at goal, out of time, in collision). Stop moving if so & ignore the action.
         if self.is_at_goal or self.ran_out_of_time or self.in_collision:
             if self.is_at_goal:
@@ -206,7 +342,7 @@ class Agent(object):
                 self.was_in_collision_already = True
             self.vel_global_frame = np.array([0.0, 0.0])
             self._store_past_velocities()
-            return
+            return False
 
         # Store past actions
         self.past_actions = np.roll(self.past_actions, 1, axis=0)
@@ -217,13 +353,15 @@ class Agent(object):
         theta = np.arctan2(goal_direction[1], goal_direction[0])
         self.T_global_ego = np.array([[np.cos(theta), -np.sin(theta), self.pos_global_frame[0]], [np.sin(theta), np.cos(theta), self.pos_global_frame[1]], [0,0,1]])
         self.ego_to_global_theta = theta
+        return True
 
-        # In the case of ExternalDynamics, this call does nothing,
-        # but set_state should have been called instead
-        self.dynamics_model.step(action, dt)
+    def finish_action(self, dt):
+        """ Last part of :meth:`take_action` (after the dynamics and ego frame were updated): store history, check if done, advance timers.
 
-        self.dynamics_model.update_ego_frame()
+        Args:
+            dt (float): time in seconds the action was executed for
 
+        """
         if Config.STORE_HISTORY:
             self._update_state_history()
 
@@ -238,21 +376,63 @@ class Agent(object):
         if self.time_remaining_to_reach_goal <= 0.0:
             self.ran_out_of_time = True
 
-        return
+    def finish_coast(self, num_steps, dt, pos_before):
+        """ Bookkeeping after the agent held its velocity for :code:`num_steps` steps of dt seconds at once (see the env's adaptive time stepping).
+
+        Its dynamics already moved it (:code:`coast_batch`) and its ego frame was refreshed. This does what :meth:`take_action` would have
+        done on each of those steps with a [speed, 0] action: the state history gets one row per step, interpolated along the straight line.
+
+        Args:
+            num_steps (int): number of steps of dt seconds the agent coasted for
+            dt (float): time in seconds of each step
+            pos_before (np array): (2,) agent's position before coasting
+
+        """
+        action = np.array([self.speed_global_frame, 0.0])
+        for _ in range(min(num_steps, self.num_actions_to_store)):
+            self.past_actions = np.roll(self.past_actions, 1, axis=0)
+            self.past_actions[0, :] = action
+            self._store_past_velocities()
 
-    def sense(self, agents, agent_index, top_down_map):
+        if Config.STORE_HISTORY:
+            # (like _update_state_history, each row has the time at the start of that step and the state at its end)
+            steps = np.arange(num_steps)
+            t = self.t + dt * steps
+            pos = pos_before + (dt * (steps + 1))[:, np.newaxis] * self.vel_global_frame
+            goal_direction = self.goal_global_frame - pos
+            rows = slice(self.step_num, self.step_num + num_steps)
+            self.global_state_history[rows, 0] = t
+            self.global_state_history[rows, 1:3] = pos
+            self.global_state_history[rows, 3:] = self.to_vector()[0][3:]
+            self.ego_state_history[rows, 0] = t
+            self.ego_state_history[rows, 1] = np.sqrt(goal_direction[:, 0]**2 + goal_direction[:, 1]**2)
+            self.ego_state_history[rows, 2] = wrap_array(
+                self.heading_global_frame - np.arctan2(goal_direction[:, 1], goal_direction[:, 0]))
+
+        self._check_if_at_goal()
+
+        self.time_remaining_to_reach_goal -= num_steps * dt
+        self.t += num_steps * dt
+        self.step_num += num_steps
+        if self.time_remaining_to_reach_goal <= 0.0:
+            self.ran_out_of_time = True
+
+    def sense(self, agents, agent_index, top_down_map, sensor_data=None):
         """ Call the sense method of each Sensor in self.sensors, store in self.sensor_data dict keyed by sensor.name.
 
         Args:
             agents (list): all :class:`~gym_collision_avoidance.envs.agent.Agent` in the environment
             agent_index (int): index of this agent (the one with this sensor) in :code:`agents`
             top_down_map (2D np array): binary image with 0 if that pixel is free space, 1 if occupied
+            sensor_data (dict): measurements already computed for this agent (e.g., in a batch with other agents), keyed by sensor.name -- those sensors are skipped
 
         """
         self.sensor_data = {}
         for sensor in self.sensors:
-            sensor_data = sensor.sense(agents, agent_index, top_down_map)
-            self.sensor_data[sensor.name] = sensor_data
+            if sensor_data is not None and sensor.name in sensor_data:
+                self.sensor_data[sensor.name] = sensor_data[sensor.name]
+                continue
+            self.sensor_data[sensor.name] = sensor.sense(agents, agent_index, top_down_map)
 
     def _update_state_history(self):
         global_state, ego_state = self.to_vector()
@@ -318,12 +498,35 @@ class Agent(object):
             result of self.attribute and value comparison (bool)
 
         """
-        return eval("self."+attribute) == value
+        return operator.attrgetter(attribute)(self) == value
+
+    def get_observation_dict(self, agents, out=None):
+        """ Look up each of Config.STATES_IN_OBS (as described in Config.STATE_INFO_DICT) for this agent.
+
+        The arrays are this agent's own buffers, which get overwritten by the next call (copy them to keep an old observation around).
+
+        Args:
+            agents (list): all :class:`~gym_collision_avoidance.envs.agent.Agent` in the environment
+            out (dict): if provided, {state: np array} to write each state into (e.g., views into the env's flat observation array) instead
+
+        Returns:
+            observation (dict): {state: np array} for each state in Config.STATES_IN_OBS
+
+        """
+        if out is not None:
+            for state in Config.STATES_IN_OBS:
+                out[state][...] = get_state_accessor(Config.STATE_INFO_DICT[state]['attr'])(self)
+            return out
 
-    def get_observation_dict(self, agents):
         observation = {}
         for state in Config.STATES_IN_OBS:
-            observation[state] = np.array(eval("self." + Config.STATE_INFO_DICT[state]['attr']))
+            value = np.asarray(get_state_accessor(Config.STATE_INFO_DICT[state]['attr'])(self))
+            buf = self._observation_buffers.get(state)
+            if buf is None or buf.shape != value.shape or buf.dtype != value.dtype:
+                buf = self._observation_buffers[state] = value.copy()
+            else:
+                buf[...] = value
+            observation[state] = buf
         return observation
 
     def get_ref(self):
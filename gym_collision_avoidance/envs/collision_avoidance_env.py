@@ -6,7 +6,6 @@ MIT Aerospace Controls Lab
 
 import copy
 import inspect
-import itertools
 import os
 import sys
 import pickle
@@ -17,20 +16,31 @@ import numpy as np
 
 from gym_collision_avoidance.envs import Config
 from gym_collision_avoidance.envs import test_cases as tc
-from gym_collision_avoidance.envs.agent import Agent
-from gym_collision_avoidance.envs.Map import Map
+from gym_collision_avoidance.envs.agent import Agent, get_state_accessor
+from gym_collision_avoidance.envs.Map import Map, read_map_metadata
+from gym_collision_avoidance.envs.tiled_map import TiledMap
+from gym_collision_avoidance.envs.vector_map import VectorMap
+from gym_collision_avoidance.envs.sensors.OtherAgentsStatesSensor import OtherAgentsStatesSensor
+from gym_collision_avoidance.envs.sensors.LaserScanSensor import LaserScanSensor
+from gym_collision_avoidance.envs.sensors.OccupancyGridSensor import OccupancyGridSensor
+from gym_collision_avoidance.envs.dynamics.Dynamics import Dynamics
+from gym_collision_avoidance.envs.spatial_hash import NeighborList
+from gym_collision_avoidance.envs import world_state as ws
+from gym_collision_avoidance.envs.world_state import WorldState
 from gym_collision_avoidance.envs.util import (
     find_nearest,
     l2norm,
     makedirs,
+    pairwise_dists,
     rgba2rgb,
+    swept_disc_time_of_impact,
 )
 from gym_collision_avoidance.envs.visualize import (
     animate_episode,
     plot_episode,
 )
 
-from gym_collision_avoidance.envs.policies.GA3C_CADRL.network import Actions, Actions_Plus
+from gym_collision_avoidance.envs.policies.GA3C_CADRL.actions import Actions, Actions_Plus
 
 class CollisionAvoidanceEnv(gym.Env):
     """Gym Environment for multiagent collision avoidance
@@ -39,6 +49,10 @@ class CollisionAvoidanceEnv(gym.Env):
 
     :param agents: (list) A list of :class:`~gym_collision_avoidance.envs.agent.Agent` objects that represent the dynamic objects in the scene.
     :param num_agents: (int) The maximum number of agents in the environment.
+    :param world_state: (:class:`~gym_collision_avoidance.envs.world_state.WorldState`) arrays holding every agent's state (agents are views into it).
+    :param observation_array: (np array) (num_agents x obs_length) float32 array of every agent's observation, laid out by :code:`observation_slices` (only filled in if Config.USE_FLAT_OBSERVATION_BUFFER)
+    :param observation_slices: (dict) {state: slice} where each of Config.STATES_IN_OBS sits in a row of :code:`observation_array`
+    :param time_of_impact: (np array) fraction of the last step at which each agent first touched another agent, inf if it didn't (only computed if Config.CONTINUOUS_COLLISION_DETECTION)
     """
 
     # Attributes:
@@ -65,6 +79,15 @@ class CollisionAvoidanceEnv(gym.Env):
         self.collision_dist = Config.COLLISION_DIST
         self.getting_close_range = Config.GETTING_CLOSE_RANGE
         self.reacher = Config.REACHER
+        self.continuous_collision_detection = Config.CONTINUOUS_COLLISION_DETECTION
+        # Fraction of the last step at which each agent first touched another agent (inf if it didn't),
+        # only computed if continuous_collision_detection
+        self.time_of_impact = None
+
+        # Adaptive Time Stepping Parameters
+        self.adaptive_time_stepping = Config.ADAPTIVE_TIME_STEPPING
+        self.max_macro_step_ratio = Config.MAX_MACRO_STEP_RATIO
+        self.interaction_range = Config.INTERACTION_RANGE
 
         # Plotting Parameters
         self.evaluate = Config.EVALUATE_MODE
@@ -141,13 +164,43 @@ class CollisionAvoidanceEnv(gym.Env):
                     * np.ones((Config.STATE_INFO_DICT[state]["size"])),
                     dtype=Config.STATE_INFO_DICT[state]["dtype"],
                 )
+            # Parse the state's 'attr' string now, rather than on the first step
+            get_state_accessor(Config.STATE_INFO_DICT[state]["attr"])
+
+        # Flat layout of the same observation: one row per agent, with that agent's
+        # states (in Config.STATES_IN_OBS order) side by side
+        self.observation_slices = {}
+        obs_length = 0
+        for state in Config.STATES_IN_OBS:
+            size = int(np.prod(Config.STATE_INFO_DICT[state]["size"]))
+            self.observation_slices[state] = slice(obs_length, obs_length + size)
+            obs_length += size
+        self.observation_array = np.zeros(
+            (Config.MAX_NUM_AGENTS_IN_ENVIRONMENT, obs_length), dtype=np.float32
+        )
+        self.use_flat_observation_buffer = Config.USE_FLAT_OBSERVATION_BUFFER
+        if self.use_flat_observation_buffer:
+            # The dict observation's arrays are views into self.observation_array
+            # (scalar states are 0-d, as in the non-flat dict observation)
+            for agent in range(Config.MAX_NUM_AGENTS_IN_ENVIRONMENT):
+                for state in Config.STATES_IN_OBS:
+                    shape = self.observation_space.spaces[agent][state].shape
+                    if shape == (1,):
+                        shape = ()
+                    self.observation[agent][state] = self.observation_array[
+                        agent, self.observation_slices[state]
+                    ].reshape(shape)
 
         self.agents = None
+        self.observing_agents = []
+        self.world_state = None
         self.default_agents = None
         self.prev_episode_agents = None
 
         self.static_map_filename = None
         self.map = None
+        # Maps loaded so far, keyed by filename (reused by later episodes)
+        self.maps = {}
 
         self.episode_step_number = None
         self.episode_number = 0
@@ -192,6 +245,15 @@ class CollisionAvoidanceEnv(gym.Env):
         # Collect rewards
         rewards = self._compute_rewards()
 
+        # In sparse scenes, keep everyone driving straight for a few more steps (nothing can happen in the meantime)
+        num_coast_steps = self._num_coast_steps(dt)
+        if num_coast_steps > 0:
+            # (agents still earn each coasted step's reward)
+            coast_rewards = self._coast_rewards(num_coast_steps, dt)
+            rewards = rewards + (coast_rewards[0] if Config.TRAIN_SINGLE_AGENT else coast_rewards)
+            self._coast(num_coast_steps, dt)
+            self.episode_step_number += num_coast_steps
+
         # Take observation
         next_observations = self._get_obs()
         if (
@@ -224,16 +286,26 @@ class CollisionAvoidanceEnv(gym.Env):
             which_agents_learning_dict[agent.id] = (
                 agent.policy.is_still_learning
             )
+        info = {
+            "which_agents_done": which_agents_done_dict,
+            "which_agents_learning": which_agents_learning_dict,
+        }
+        if self.adaptive_time_stepping:
+            # number of DT steps this call advanced the simulation by
+            info["num_steps"] = 1 + num_coast_steps
+        if self.time_of_impact is not None:
+            # seconds into this step at which each agent collided (inf if it didn't)
+            info["time_of_impact"] = {
+                agent.id: self.time_of_impact[i] * dt
+                for i, agent in enumerate(self.agents)
+            }
 
         return (
             next_observations,
             rewards,
             game_over,
             False,
-            {
-                "which_agents_done": which_agents_done_dict,
-                "which_agents_learning": which_agents_learning_dict,
-            },
+            info,
         )
 
     def reset(self):
@@ -273,15 +345,20 @@ class CollisionAvoidanceEnv(gym.Env):
             self.episode_number += 1
         self.begin_episode = True
         self.episode_step_number = 0
+        self.time_of_impact = None
         self._init_agents()
         if Config.USE_STATIC_MAP:
             self._init_static_map()
-        for state in Config.STATES_IN_OBS:
-            for agent in range(Config.MAX_NUM_AGENTS_IN_ENVIRONMENT):
-                self.observation[agent][state] = np.zeros(
-                    (Config.STATE_INFO_DICT[state]["size"]),
-                    dtype=Config.STATE_INFO_DICT[state]["dtype"],
-                )
+        self._update_neighbor_list()
+        if self.use_flat_observation_buffer:
+            self.observation_array[:] = 0.0
+        else:
+            for state in Config.STATES_IN_OBS:
+                for agent in range(Config.MAX_NUM_AGENTS_IN_ENVIRONMENT):
+                    self.observation[agent][state] = np.zeros(
+                        (Config.STATE_INFO_DICT[state]["size"]),
+                        dtype=Config.STATE_INFO_DICT[state]["dtype"],
+                    )
         return self._get_obs(), {}
 
     def _take_action(self, actions, dt):
@@ -309,25 +386,231 @@ class CollisionAvoidanceEnv(gym.Env):
             (len(self.agents), num_actions_per_agent), dtype=np.float32
         )
 
-        # Agents set their action (either from external or w/ find_next_action)
-        for agent_index, agent in enumerate(self.agents):
-            if agent.is_done:
-                continue
-            elif agent.policy.is_external:
+        # Agents set their action (either from external or w/ find_next_actions)
+        not_done = np.flatnonzero(~self.world_state.flag(ws.IS_DONE))
+        internal_policy_groups = {}
+        for agent_index in not_done:
+            agent = self.agents[agent_index]
+            if agent.policy.is_external:
                 all_actions[agent_index, :] = (
                     agent.policy.external_action_to_action( 
                         agent, actions[agent_index]
                     )
                 )
             else:
-                dict_obs = self.observation[agent_index]
-                all_actions[agent_index, :] = agent.policy.find_next_action(
-                    dict_obs, self.agents, agent_index
-                )
+                internal_policy_groups.setdefault(
+                    agent.policy.batch_key(), []
+                ).append(agent_index)
+
+        # One query per group of agents whose policies can be batched (e.g., same network checkpoint)
+        for agent_indices in internal_policy_groups.values():
+            # (agents that weren't observed may not have an entry, but their policies ignore obs anyway)
+            obs_batch = [self.observation.get(i) for i in agent_indices]
+            all_actions[agent_indices, :] = self.agents[
+                agent_indices[0]
+            ].policy.find_next_actions(obs_batch, self.agents, agent_indices)
 
         # After all agents have selected actions, run one dynamics update
-        for i, agent in enumerate(self.agents):
-            agent.take_action(all_actions[i, :], dt)
+        # (each group of agents whose dynamics can be batched is stepped at once, straight in self.world_state)
+        moving = [
+            i for i, agent in enumerate(self.agents)
+            if agent.prepare_action(all_actions[i, :])
+        ]
+        if self.continuous_collision_detection:
+            pos_before_step = self.world_state.pos_global_frame.copy()
+        dynamics_groups = {}
+        for agent_index in moving:
+            dynamics_groups.setdefault(
+                self.agents[agent_index].dynamics_model.batch_key(), []
+            ).append(agent_index)
+        for agent_indices in dynamics_groups.values():
+            self.agents[agent_indices[0]].dynamics_model.step_batch(
+                self.agents, agent_indices, all_actions[agent_indices, :], dt
+            )
+        step_fraction = np.ones(len(self.agents))
+        if self.continuous_collision_detection:
+            # Agents that touched someone mid-step only get as far as the point of contact
+            self.time_of_impact = self._compute_time_of_impact(pos_before_step)
+            step_fraction = np.minimum(self.time_of_impact, 1.0)
+            rewound = [i for i in moving if step_fraction[i] < 1.0]
+            self.world_state.pos_global_frame[rewound] = (
+                pos_before_step[rewound]
+                + step_fraction[rewound, np.newaxis]
+                * (self.world_state.pos_global_frame[rewound] - pos_before_step[rewound])
+            )
+        Dynamics.update_ego_frames(self.world_state, moving)
+        for agent_index in moving:
+            self.agents[agent_index].finish_action(dt * step_fraction[agent_index])
+
+    def _num_coast_steps(self, dt):
+        """How many more steps of dt seconds every agent can keep driving straight at its current velocity without anything happening.
+
+        With adaptive time stepping, that's the largest number of steps (below max_macro_step_ratio) after which every pair of agents is
+        still more than interaction_range apart (even if both drove straight at each other), and no agent has reached its goal or run out of time.
+        Only nominal steps in scenes without static obstacles, external agents or the reacher rewards are extended.
+
+        Args:
+            dt (float): time in seconds of the step that was just taken
+
+        Returns:
+            num_coast_steps (int): 0 if the next step should be taken as usual (querying the policies)
+        """
+        if (
+            not self.adaptive_time_stepping
+            or dt != self.dt_nominal
+            or self.reacher
+            or Config.USE_STATIC_MAP
+        ):
+            return 0
+        state = self.world_state
+        moving = ~state.flag(ws.AT_GOAL | ws.IN_COLLISION | ws.RAN_OUT_OF_TIME)
+        if not np.any(moving) or any(
+            self.agents[i].policy.is_external for i in np.flatnonzero(moving)
+        ):
+            return 0
+
+        max_steps = float(self.max_macro_step_ratio - 1)
+        speed = np.where(
+            moving,
+            np.sqrt(state.vel_global_frame[:, 0]**2 + state.vel_global_frame[:, 1]**2),
+            0.0,
+        )
+        near_goal_threshold = np.array([agent.near_goal_threshold for agent in self.agents])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Stop coasting 1 step before anyone could reach its goal or run out of time
+            steps_to_goal = np.ceil((state.dist_to_goal - near_goal_threshold) / (speed * dt)) - 1
+            steps_to_timeout = np.ceil(state.time_remaining_to_reach_goal / dt) - 1
+            max_steps = min(
+                max_steps,
+                np.min(np.where(moving & (speed > 0), steps_to_goal, np.inf)),
+                np.min(np.where(moving, steps_to_timeout, np.inf)),
+            )
+            if max_steps < 1:
+                return 0
+
+            # Every pair must stay out of each other's interaction range while closing in at their combined speed
+            if state.neighbor_list is not None:
+                # (pairs further apart than this can't get within range before max_steps)
+                i, j = state.neighbor_list.query_pairs(
+                    2 * np.max(state.radius) + self.interaction_range + 2 * np.max(speed) * max_steps * dt
+                )
+                rel_pos = state.pos_global_frame[i] - state.pos_global_frame[j]
+                gaps = np.sqrt(rel_pos[:, 0]**2 + rel_pos[:, 1]**2) - state.radius[i] - state.radius[j]
+                closing_speeds = speed[i] + speed[j]
+            else:
+                dists_btwn, combined_radii = pairwise_dists(state.pos_global_frame, state.radius)
+                not_self = ~np.eye(len(self.agents), dtype=bool)
+                gaps = (dists_btwn - combined_radii)[not_self]
+                closing_speeds = (speed[:, np.newaxis] + speed[np.newaxis, :])[not_self]
+            if np.any(gaps <= self.interaction_range):
+                return 0
+            steps_to_interaction = np.floor((gaps - self.interaction_range) / (closing_speeds * dt))
+            max_steps = min(max_steps, np.min(steps_to_interaction, initial=np.inf))
+        return int(max(max_steps, 0))
+
+    def _coast(self, num_steps, dt):
+        """Advance the simulation by num_steps steps of dt seconds, where every agent that isn't done holds its current velocity (no policy queries).
+
+        Agents' dynamics move them in closed form and each agent fills in its history at every step (see :meth:`~gym_collision_avoidance.envs.agent.Agent.finish_coast`),
+        agents that are done stay put, as they would have over that many steps.
+
+        Args:
+            num_steps (int): from :meth:`_num_coast_steps`
+            dt (float): time in seconds of each step
+        """
+        state = self.world_state
+        pos_before = state.pos_global_frame.copy()
+        moving = np.flatnonzero(
+            ~state.flag(ws.AT_GOAL | ws.IN_COLLISION | ws.RAN_OUT_OF_TIME)
+        )
+        for agent_index in np.flatnonzero(
+            state.flag(ws.AT_GOAL | ws.IN_COLLISION | ws.RAN_OUT_OF_TIME)
+        ):
+            for _ in range(num_steps):
+                # (agents that are done just stop, ignoring the action)
+                self.agents[agent_index].prepare_action(np.zeros(2))
+        dynamics_groups = {}
+        for agent_index in moving:
+            dynamics_groups.setdefault(
+                self.agents[agent_index].dynamics_model.batch_key(), []
+            ).append(agent_index)
+        for agent_indices in dynamics_groups.values():
+            self.agents[agent_indices[0]].dynamics_model.coast_batch(
+                self.agents, agent_indices, num_steps, dt
+            )
+        Dynamics.update_ego_frames(state, moving)
+        for agent_index in moving:
+            self.agents[agent_index].finish_coast(num_steps, dt, pos_before[agent_index])
+        # (observations & policies are computed from the coasted positions)
+        self._update_neighbor_list()
+
+    def _coast_rewards(self, num_steps, dt):
+        """Sum of the rewards each agent would have earned on the num_steps steps that :meth:`_coast` is about to skip.
+
+        Nothing noteworthy can happen while coasting (see :meth:`_num_coast_steps`), so each of those steps earns the time step reward
+        (at that step's clock, which only advances for agents that aren't done), plus the wiggly penalty for agents that are done but
+        can still collide (they keep their last action, while coasting agents don't turn).
+
+        Args:
+            num_steps (int): from :meth:`_num_coast_steps`
+            dt (float): time in seconds of each step
+
+        Returns:
+            coast_rewards (np array): (num_agents,) summed rewards
+        """
+        state = self.world_state
+        moving = ~state.flag(ws.AT_GOAL | ws.IN_COLLISION | ws.RAN_OUT_OF_TIME)
+        # (num_steps x num_agents) time spent by each agent by the end of each step
+        elapsed = np.arange(1, num_steps + 1)[:, np.newaxis] * dt * moving
+        rewards = self._time_step_rewards(
+            state.t + elapsed, state.time_remaining_to_reach_goal - elapsed
+        )
+        if np.isfinite(self.wiggly_behavior_threshold):
+            delta_headings = np.array([a.past_actions[0, 1] for a in self.agents])
+            can_collide = ~state.flag(ws.AT_GOAL | ws.IN_COLLISION | ws.WAS_IN_COLLISION_ALREADY)
+            wiggly = ~moving & can_collide & (np.abs(delta_headings) > self.wiggly_behavior_threshold)
+            rewards[:, wiggly] += self.reward_wiggly_behavior
+        return np.sum(
+            np.clip(rewards, self.min_possible_reward, self.max_possible_reward), axis=0
+        )
+
+    def _compute_time_of_impact(self, pos_before_step):
+        """Sweep each agent's disc along its straight-line motion during the last step and find when it first touched another agent.
+
+        Every pair of agents is checked at once (or only nearby pairs, if the neighbor list is in use).
+        Each pair is assumed to keep moving for the whole step, so a collision later in the step than an agent's first one is still reported.
+
+        Args:
+            pos_before_step (np array): (num_agents x 2) every agent's position before the dynamics update (self.world_state has the position after it)
+
+        Returns:
+            time_of_impact (np array): (num_agents,) fraction of the step in [0, 1] at which each agent first touched another agent (inf if it didn't)
+        """
+        state = self.world_state
+        num_agents = len(self.agents)
+        disp = state.pos_global_frame - pos_before_step
+        time_of_impact = np.full(num_agents, np.inf)
+        if state.neighbor_list is not None:
+            # Discs that touch mid-step started within combined radius + both displacements of each other
+            # (the list was last updated with the positions from before the step)
+            max_disp = np.max(np.sqrt(disp[:, 0]**2 + disp[:, 1]**2))
+            i, j = state.neighbor_list.query_pairs(2 * np.max(state.radius) + 2 * max_disp)
+            pair_time_of_impact = swept_disc_time_of_impact(
+                pos_before_step[i] - pos_before_step[j],
+                disp[i] - disp[j],
+                state.radius[i] + state.radius[j],
+            )
+            np.minimum.at(time_of_impact, i, pair_time_of_impact)
+            np.minimum.at(time_of_impact, j, pair_time_of_impact)
+        else:
+            pair_time_of_impact = swept_disc_time_of_impact(
+                pos_before_step[:, np.newaxis, :] - pos_before_step[np.newaxis, :, :],
+                disp[:, np.newaxis, :] - disp[np.newaxis, :, :],
+                state.radius[:, np.newaxis] + state.radius[np.newaxis, :],
+            )
+            pair_time_of_impact[np.eye(num_agents, dtype=bool)] = np.inf
+            time_of_impact = np.min(pair_time_of_impact, axis=1)
+        return time_of_impact
 
     def _update_top_down_map(self):
         """After agents have moved, call this to update the map with their new occupancies."""
@@ -364,16 +647,30 @@ class CollisionAvoidanceEnv(gym.Env):
         else:
             self.agents = self.default_agents
 
+        # Move every agent's state into one set of arrays owned by the env
+        self.world_state = WorldState(len(self.agents))
+        self.world_state.bind_agents(self.agents)
+
         # Make every agent respect the same env-wide limits on actions (this probably should live elsewhere...)
         for agent in self.agents:
             agent.max_heading_change = self.max_heading_change
             agent.max_speed = self.max_speed
 
+        # Only these agents' observations get used (or recorded), so only they need to sense the world
+        self.observing_agents = [
+            i for i, agent in enumerate(self.agents)
+            if Config.RECORD_ALL_OBSERVATIONS
+            or agent.policy.is_external
+            or agent.policy.is_still_learning
+            or agent.policy.uses_obs
+        ]
+
     def set_static_map(self, map_filename):
         """If you want to have static obstacles, provide the path to the map image file that should be loaded.
 
         Args:
-            map_filename (str or list): full path of a binary png file corresponding to the environment prior map
+            map_filename (str or list): full path of a binary png file corresponding to the environment prior map,
+                or of a yaml file of line segments/polygons (see :func:`~gym_collision_avoidance.envs.vector_map.load_obstacles`)
                 (or list of candidate map paths to randomly choose btwn each episode)
         """
         self.static_map_filename = map_filename
@@ -381,7 +678,7 @@ class CollisionAvoidanceEnv(gym.Env):
     def _init_static_map(self):
         """Load the map based on its pre-provided filename, and initialize a :class:`~gym_collision_avoidance.envs.Map.Map` object
 
-        Currently the dimensions of the world map are hard-coded.
+        The dimensions of the world map come from the map file's metadata (see :func:`~gym_collision_avoidance.envs.Map.read_map_metadata`).
 
         """
         if isinstance(self.static_map_filename, list):
@@ -389,10 +686,22 @@ class CollisionAvoidanceEnv(gym.Env):
         else:
             static_map_filename = self.static_map_filename
 
-        x_width = 16  # meters
-        y_width = 16  # meters
-        grid_cell_size = 0.1  # meters/grid cell
-        self.map = Map(x_width, y_width, grid_cell_size, static_map_filename)
+        # Each map file is only loaded once per env (and preprocessed once per Config.STATIC_MAP_CACHE_DIR)
+        if static_map_filename not in self.maps:
+            map_args = read_map_metadata(static_map_filename)
+            if static_map_filename is not None and static_map_filename.endswith('.yaml'):
+                # Line segments and polygons (see vector_map.load_obstacles)
+                map_class = VectorMap
+                map_args.pop('tile_size', None)
+                map_args.pop('halo', None)
+            elif 'tile_size' in map_args:
+                # Worlds too large to hold in memory are split into tiles
+                map_class = TiledMap
+            else:
+                map_class = Map
+            self.maps[static_map_filename] = map_class(
+                map_filename=static_map_filename, cache_dir=Config.STATIC_MAP_CACHE_DIR, **map_args)
+        self.map = self.maps[static_map_filename]
 
     def _compute_rewards(self):
         """Check for collisions and reaching of the goal here, and also assign the corresponding rewards based on those calculations.
@@ -402,72 +711,52 @@ class CollisionAvoidanceEnv(gym.Env):
                       is a list of scalars if we are training on mult agents
         """
 
+        state = self.world_state
+
         # if nothing noteworthy happened in that timestep, reward = -0.01
-        time_remaining = np.array([a.time_remaining_to_reach_goal for a in self.agents])
-        time = np.array([a.t for a in self.agents])
-        rewards = self.reward_time_step * np.ones(len(self.agents)) * 1 / (time+time_remaining * (1/Config.DT))
-       
+        rewards = self._time_step_rewards(state.t, state.time_remaining_to_reach_goal)
+
         (
             collision_with_agent,
             collision_with_wall,
             entered_norm_zone,
             dist_btwn_nearest_agent,
         ) = self._check_for_collisions()
+        at_goal = state.flag(ws.AT_GOAL)
         if self.reacher:
-            radii = np.array([a.radius for a in self.agents])
-            reward_goal_dist = np.array([l2norm(
-                a.pos_global_frame,
-                a.goal_global_frame,
-            ) for a in self.agents]) - radii - Config.NEAR_GOAL_THRESHOLD
-            
+            reward_goal_dist = np.linalg.norm(
+                state.pos_global_frame - state.goal_global_frame, axis=1
+            ) - state.radius - Config.NEAR_GOAL_THRESHOLD
+
             reward_agent_dist = dist_btwn_nearest_agent
 
             rewards = -reward_goal_dist + reward_agent_dist
-
-            for i, agent in enumerate(self.agents):
-                if agent.is_at_goal:
-                    rewards[i] = 0
+            rewards[at_goal] = 0
         else:
-            for i, agent in enumerate(self.agents):
-                if agent.is_at_goal:
-                    if agent.was_at_goal_already is False:
-                        # agents should only receive the goal reward once
-                        rewards[i] = self.reward_at_goal
-                        # print("Agent %i: Arrived at goal!"
-                        # % agent.id)
-                else:
-                    # agents at their goal shouldn't be penalized if someone else
-                    # bumps into them
-                    if agent.was_in_collision_already is False:
-                        if collision_with_agent[i]:
-                            rewards[i] = self.reward_collision_with_agent
-                            agent.in_collision = True
-                            # print("Agent %i: Collision with another agent!"
-                            #       % agent.id)
-                        elif collision_with_wall[i]:
-                            rewards[i] = self.reward_collision_with_wall
-                            agent.in_collision = True
-                            # print("Agent %i: Collision with wall!"
-                            # % agent.id)
-                        else:
-                            # There was no collision
-                            if (
-                                dist_btwn_nearest_agent[i]
-                                <= Config.GETTING_CLOSE_RANGE
-                            ):
-                                rewards[i] = (
-                                    self.reward_getting_close + dist_btwn_nearest_agent[i] / 2.0
-                                )
-                                # print("Agent %i: Got close to another agent!"
-                                #       % agent.id)
-                            if (
-                                abs(agent.past_actions[0, 1])
-                                > self.wiggly_behavior_threshold
-                            ):
-                                # Slightly penalize wiggly behavior
-                                rewards[i] += self.reward_wiggly_behavior
-                            # elif entered_norm_zone[i]:
-                            #     rewards[i] = self.reward_entered_norm_zone
+            # agents should only receive the goal reward once
+            first_time_at_goal = at_goal & ~state.flag(ws.WAS_AT_GOAL_ALREADY)
+            rewards[first_time_at_goal] = self.reward_at_goal
+
+            # agents at their goal shouldn't be penalized if someone else
+            # bumps into them
+            can_collide = ~at_goal & ~state.flag(ws.WAS_IN_COLLISION_ALREADY)
+            hit_agent = can_collide & collision_with_agent
+            hit_wall = can_collide & ~collision_with_agent & collision_with_wall
+            rewards[hit_agent] = self.reward_collision_with_agent
+            rewards[hit_wall] = self.reward_collision_with_wall
+            state.set_flag(ws.IN_COLLISION, hit_agent | hit_wall)
+
+            # There was no collision
+            no_collision = can_collide & ~collision_with_agent & ~collision_with_wall
+            getting_close = no_collision & (dist_btwn_nearest_agent <= Config.GETTING_CLOSE_RANGE)
+            rewards[getting_close] = self.reward_getting_close + dist_btwn_nearest_agent[getting_close] / 2.0
+            if np.isfinite(self.wiggly_behavior_threshold):
+                # Slightly penalize wiggly behavior
+                delta_headings = np.array([a.past_actions[0, 1] for a in self.agents])
+                wiggly = no_collision & (np.abs(delta_headings) > self.wiggly_behavior_threshold)
+                rewards[wiggly] += self.reward_wiggly_behavior
+            # elif entered_norm_zone[i]:
+            #     rewards[i] = self.reward_entered_norm_zone
             rewards = np.clip(
                 rewards, self.min_possible_reward, self.max_possible_reward
             )
@@ -475,55 +764,72 @@ class CollisionAvoidanceEnv(gym.Env):
             rewards = rewards[0]
         return rewards
 
+    def _time_step_rewards(self, t, time_remaining_to_reach_goal):
+        """Reward for a step where nothing noteworthy happened, scaled by the length of each agent's episode
+
+        Args:
+            t (np array): each agent's time so far (any shape)
+            time_remaining_to_reach_goal (np array): each agent's time left (same shape as t)
+
+        Returns:
+            rewards (np array): same shape as t
+        """
+        return self.reward_time_step * np.ones(np.shape(t)) * 1 / (t+time_remaining_to_reach_goal * (1/Config.DT))
+
     def _check_for_collisions(self):
         """Check whether each agent has collided with another agent or a static obstacle in the map
 
         This method doesn't compute social zones currently!!!!!
 
         Returns:
-            - collision_with_agent (list): for each agent, bool True if that agent is in collision with another agent
-            - collision_with_wall (list): for each agent, bool True if that agent is in collision with object in map
-            - entered_norm_zone (list): for each agent, bool True if that agent entered another agent's social zone
-            - dist_btwn_nearest_agent (list): for each agent, float closest distance to another agent
+            - collision_with_agent (np array): for each agent, bool True if that agent is in collision with another agent
+            - collision_with_wall (np array): for each agent, bool True if that agent is in collision with object in map
+            - entered_norm_zone (np array): for each agent, bool True if that agent entered another agent's social zone
+            - dist_btwn_nearest_agent (np array): for each agent, float closest distance to another agent (boundary to boundary)
 
         """
-        collision_with_agent = [False for _ in self.agents]
-        collision_with_wall = [False for _ in self.agents]
-        entered_norm_zone = [False for _ in self.agents]
-        dist_btwn_nearest_agent = [np.inf for _ in self.agents]
-        agent_shapes = []
-        agent_front_zones = []
-        agent_inds = list(range(len(self.agents)))
-        agent_pairs = list(itertools.combinations(agent_inds, 2))
-        for i, j in agent_pairs:
-            dist_btwn = l2norm(
-                self.agents[i].pos_global_frame,
-                self.agents[j].pos_global_frame,
-            )
-            combined_radius = self.agents[i].radius + self.agents[j].radius
-            dist_btwn_nearest_agent[i] = min(
-                dist_btwn_nearest_agent[i], dist_btwn - combined_radius
-            )
-            dist_btwn_nearest_agent[j] = min(
-                dist_btwn_nearest_agent[j], dist_btwn - combined_radius
+        state = self.world_state
+        num_agents = len(self.agents)
+        collision_with_wall = np.zeros(num_agents, dtype=bool)
+        entered_norm_zone = np.zeros(num_agents, dtype=bool)
+
+        # Agents have moved, so check whether the neighbor list is still valid (if the crowd is large enough to use one)
+        neighbor_list = self._update_neighbor_list()
+        if neighbor_list is not None and not self.reacher:
+            # Broadphase: only pairs in the neighbor list can be colliding/getting close.
+            # (Agents with nobody within that range get dist_btwn_nearest_agent = inf.)
+            i, j = neighbor_list.query_pairs(self._collision_query_radius())
+            rel_pos = state.pos_global_frame[i] - state.pos_global_frame[j]
+            dists_btwn = np.sqrt(rel_pos[:, 0]**2 + rel_pos[:, 1]**2)
+            combined_radii = state.radius[i] + state.radius[j]
+            gaps = dists_btwn - combined_radii
+            dist_btwn_nearest_agent = np.full(num_agents, np.inf)
+            np.minimum.at(dist_btwn_nearest_agent, i, gaps)
+            np.minimum.at(dist_btwn_nearest_agent, j, gaps)
+            # Collision with another agent!
+            in_collision = dists_btwn <= combined_radii
+            collision_with_agent = np.zeros(num_agents, dtype=bool)
+            collision_with_agent[i[in_collision]] = True
+            collision_with_agent[j[in_collision]] = True
+        else:
+            # Every pair at once: (num_agents x num_agents) distances, ignoring the diagonal (agent vs. itself)
+            dists_btwn, combined_radii = pairwise_dists(
+                state.pos_global_frame, state.radius
             )
-            if dist_btwn <= combined_radius:
-                # Collision with another agent!
-                collision_with_agent[i] = True
-                collision_with_agent[j] = True
+            is_self = np.eye(num_agents, dtype=bool)
+            # Collision with another agent!
+            in_collision_with = (dists_btwn <= combined_radii) & ~is_self
+            collision_with_agent = np.any(in_collision_with, axis=1)
+            gaps = np.where(is_self, np.inf, dists_btwn - combined_radii)
+            dist_btwn_nearest_agent = np.min(gaps, axis=1)
+        if self.time_of_impact is not None:
+            # Touched someone during the step (agents stopped at the point of contact may be a rounding error apart)
+            collision_with_agent |= np.isfinite(self.time_of_impact)
         if Config.USE_STATIC_MAP:
-            for i in agent_inds:
-                agent = self.agents[i]
-                [pi, pj], in_map = self.map.world_coordinates_to_map_indices(
-                    agent.pos_global_frame
-                )
-                mask = self.map.get_agent_map_indices([pi, pj], agent.radius)
-                # plt.figure('static map')
-                # plt.imshow(self.map.static_map + mask)
-                # plt.pause(0.1)
-                if in_map and np.any(self.map.static_map[mask]):
-                    # Collision with wall!
-                    collision_with_wall[i] = True
+            # Collision with wall! (one lookup per agent in the map's precomputed clearance)
+            collision_with_wall = self.map.in_static_collision(
+                state.pos_global_frame, state.radius
+            )
         return (
             collision_with_agent,
             collision_with_wall,
@@ -531,6 +837,32 @@ class CollisionAvoidanceEnv(gym.Env):
             dist_btwn_nearest_agent,
         )
 
+    def _collision_query_radius(self):
+        """Largest center-to-center distance at which a pair of agents can be colliding or getting close."""
+        return 2 * np.max(self.world_state.radius) + self.getting_close_range
+
+    def _update_neighbor_list(self):
+        """Bring the neighbor list up to date with the agents' current positions, if there are enough agents for it to pay off.
+
+        The list covers every pair that collision checks, sensing and policies (within Config.SENSING_HORIZON) ask about,
+        and is only rebuilt once some agent has moved more than half of Config.NEIGHBOR_LIST_SKIN.
+        Below Config.SPATIAL_HASH_MIN_NUM_AGENTS, the list is dropped and collision checks/sensing use brute force.
+
+        Returns:
+            neighbor_list (:class:`~gym_collision_avoidance.envs.spatial_hash.NeighborList` or None): the up-to-date list (also stored in self.world_state)
+        """
+        state = self.world_state
+        if len(self.agents) < Config.SPATIAL_HASH_MIN_NUM_AGENTS:
+            state.neighbor_list = None
+            return None
+        cutoff = self._collision_query_radius()
+        if np.isfinite(Config.SENSING_HORIZON):
+            cutoff = max(cutoff, Config.SENSING_HORIZON)
+        if state.neighbor_list is None:
+            state.neighbor_list = NeighborList(Config.NEIGHBOR_LIST_SKIN)
+        state.neighbor_list.update(state.pos_global_frame, cutoff)
+        return state.neighbor_list
+
     def _check_which_agents_done(self):
         """Check if any agents have reached goal, run out of time, or collided.
 
@@ -538,22 +870,10 @@ class CollisionAvoidanceEnv(gym.Env):
             - which_agents_done (list): for each agent, True if agent is done, o.w. False
             - game_over (bool): depending on mode, True if all agents done, True if 1st agent done, True if all learning agents done
         """
-        at_goal_condition = np.array([a.is_at_goal for a in self.agents])
-        ran_out_of_time_condition = np.array(
-            [a.ran_out_of_time for a in self.agents]
-        )
-        in_collision_condition = np.array(
-            [a.in_collision for a in self.agents]
+        which_agents_done = self.world_state.flag(
+            ws.AT_GOAL | ws.RAN_OUT_OF_TIME | ws.IN_COLLISION
         )
-        which_agents_done = np.logical_or.reduce(
-            (
-                at_goal_condition,
-                ran_out_of_time_condition,
-                in_collision_condition,
-            )
-        )
-        for agent_index, agent in enumerate(self.agents):
-            agent.is_done = which_agents_done[agent_index]
+        self.world_state.assign_flag(ws.IS_DONE, which_agents_done)
 
         if Config.EVALUATE_MODE:
             # Episode ends when every agent is done
@@ -575,22 +895,45 @@ class CollisionAvoidanceEnv(gym.Env):
     def _get_obs(self):
         """Update the map now that agents have moved, have each agent sense the world, and fill in their observations
 
+        Only the agents in :code:`self.observing_agents` sense & get a new observation (every agent when :code:`Config.RECORD_ALL_OBSERVATIONS` is set),
+        since the others' policies (e.g., RVO, Non-Cooperative) read the agents list directly.
+
         Returns: 
             observation (list): for each agent, a dictionary observation.
 
         """
+        observing_agents = self.observing_agents
+        if len(observing_agents) == 0:
+            return self.observation
 
         if Config.USE_STATIC_MAP:
             # Agents have moved (states have changed), so update the map view
             self._update_top_down_map()
 
+        # Relative states of other agents are measured for the whole crowd at once
+        batched_sensor_data = {}
+        if Config.BATCH_OTHER_AGENTS_STATES_SENSOR:
+            for i, other_agents_states in OtherAgentsStatesSensor.sense_all(self.agents, observing_agents).items():
+                batched_sensor_data[i] = {'other_agents_states': other_agents_states}
+        # ... and so are every agent's laserscans and occupancy grids
+        if Config.USE_STATIC_MAP:
+            for i, laserscan in LaserScanSensor.sense_all(self.agents, self.map, observing_agents).items():
+                batched_sensor_data.setdefault(i, {})['laserscan'] = laserscan
+            for i, og_map in OccupancyGridSensor.sense_all(self.agents, self.map, observing_agents).items():
+                batched_sensor_data.setdefault(i, {})['occupancy_grid'] = og_map
+
         # Agents collect a reading from their map-based sensors
-        for i, agent in enumerate(self.agents):
-            agent.sense(self.agents, i, self.map)
+        for i in observing_agents:
+            self.agents[i].sense(self.agents, i, self.map, batched_sensor_data.get(i))
 
         # Agents fill in their element of the multiagent observation vector
-        for i, agent in enumerate(self.agents):
-            self.observation[i] = agent.get_observation_dict(self.agents)
+        for i in observing_agents:
+            agent = self.agents[i]
+            if self.use_flat_observation_buffer:
+                # (writes straight into this agent's row of self.observation_array)
+                agent.get_observation_dict(self.agents, out=self.observation[i])
+            else:
+                self.observation[i] = agent.get_observation_dict(self.agents)
 
         return self.observation
 
@@ -1,5 +1,7 @@
+import os
+
 import numpy as np
-from gym_collision_avoidance.envs.policies.GA3C_CADRL.network import Actions, Actions_Plus
+from gym_collision_avoidance.envs.policies.GA3C_CADRL.actions import Actions, Actions_Plus
 
 class Config(object): 
     def __init__(self):
@@ -27,6 +29,12 @@ class Config(object):
 
         if not hasattr(self, "USE_STATIC_MAP"):
             self.USE_STATIC_MAP = False
+        self.STATIC_MAP_X_WIDTH = 16 # meters (for map files without a .yaml next to them, see Map.read_map_metadata)
+        self.STATIC_MAP_Y_WIDTH = 16 # meters
+        self.STATIC_MAP_GRID_CELL_SIZE = 0.1 # meters/grid cell
+        # Preprocessed map files, in this user's cache dir (None to re-read the images; tiled maps always need one)
+        self.STATIC_MAP_CACHE_DIR = os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'gym_collision_avoidance', 'maps')
         
         ### TRAIN / PLAY / EVALUATE
         self.TRAIN_MODE           = False # Enable to see the trained agent in action (for testing)
@@ -54,6 +62,24 @@ class Config(object):
         self.NEAR_GOAL_THRESHOLD = 0.2
         self.MAX_TIME_RATIO = 2. # agent has this number times the straight-line-time to reach its goal before "timing out"
         self.MAX_EP_LEN = 1000
+        # Check for agent-agent collisions along each agent's straight-line motion during a step (not just at its end),
+        # so fast agents can't pass through each other at large DT. Agents that collide are stopped at the point of contact.
+        self.CONTINUOUS_COLLISION_DETECTION = False
+        # While every pair of agents would stay more than INTERACTION_RANGE apart (boundary to boundary) even if they all kept
+        # driving straight at their current speed, env.step holds each agent's action for up to MAX_MACRO_STEP_RATIO DT steps
+        # without querying the policies again (agents' state histories are still filled in at every DT, and the macro step's reward
+        # adds up what each agent would have earned on every DT step it covers, e.g. REWARD_TIME_STEP per step)
+        self.ADAPTIVE_TIME_STEPPING = False
+        self.MAX_MACRO_STEP_RATIO = 10
+        self.INTERACTION_RANGE = 2.0
+
+        ### NEIGHBOR SEARCH
+        # With at least this many agents, collision checks, sensing & policies only look at agents in a
+        # neighbor list (built from a uniform grid, or spatial hash) instead of every pair of agents
+        self.SPATIAL_HASH_MIN_NUM_AGENTS = 50
+        # The neighbor list keeps pairs up to this much [m] further apart than needed, so it only has to be
+        # rebuilt once some agent has moved more than half of this
+        self.NEIGHBOR_LIST_SKIN = 2.0
         
         ### TEST CASE SETTINGS
         self.TEST_CASE_FN = "get_testcase_random"
@@ -87,18 +113,35 @@ class Config(object):
         # self.SENSING_HORIZON  = 3.0
         self.LASERSCAN_LENGTH = 512 # num range readings in one scan
         self.LASERSCAN_NUM_PAST = 3 # num range readings in one scan
+        self.OCCUPANCY_GRID_WIDTH = 5.0 # meters (square gridmap centered on the agent)
+        self.OCCUPANCY_GRID_CELL_SIZE = 0.1 # meters per gridmap cell (a whole multiple of the map's grid_cell_size)
+        self.OCCUPANCY_GRID_EGO_FRAME = False # rotate gridmap so its columns point along the agent's heading
         self.NUM_STEPS_IN_OBS_HISTORY = 1 # number of time steps to store in observation vector
         self.NUM_PAST_ACTIONS_IN_STATE = 0
+        self.BATCH_OTHER_AGENTS_STATES_SENSOR = True # compute every agent's other_agents_states at once (vs. one OtherAgentsStatesSensor.sense per agent)
 
         ### RVO AGENTS
         self.RVO_TIME_HORIZON = 5.0
         self.RVO_COLLAB_COEFF = 0.5
         self.RVO_ANTI_COLLAB_T = 1.0
+        self.RVO_BACKEND = "auto" # "rvo2", "numpy" (policies/orca.py, no extra dependencies), or "auto" (rvo2 if it's installed, else numpy)
+
+        ### GA3C-CADRL AGENTS
+        # Run the network in numpy (from the checkpoint's .npz, see policies/GA3C_CADRL/export_npz.py) instead of tensorflow
+        self.GA3C_CADRL_NUMPY_NETWORK = False
 
         ### STORAGE
         self.STORE_HISTORY = True
 
         ### OBSERVATION VECTOR
+        # Keep every agent's observation in one (MAX_NUM_AGENTS_IN_ENVIRONMENT x obs_length) float32 array (env.observation_array),
+        # which the dict observation's arrays are views into & the wrappers can copy in one go
+        # (or read without copying, through native_observation_array, until the next step overwrites it)
+        self.USE_FLAT_OBSERVATION_BUFFER = False
+        # Sense & fill in every agent's observation, even if the agent's policy ignores it (set this to record observations,
+        # e.g. in a D4RL dataset; otherwise, only agents with an external policy or one that uses its obs get sensed,
+        # the rest keep all-zero observations)
+        self.RECORD_ALL_OBSERVATIONS = False
         self.setup_obs()
     
         # self.AGENT_SORTING_METHOD = "closest_last"
@@ -171,6 +214,12 @@ class Config(object):
                 'std': 5.*np.ones((self.LASERSCAN_NUM_PAST, self.LASERSCAN_LENGTH), dtype=np.float32),
                 'mean': 5.*np.ones((self.LASERSCAN_NUM_PAST, self.LASERSCAN_LENGTH), dtype=np.float32)
                 },
+            'occupancy_grid': {
+                'dtype': np.float32,
+                'size': (int(round(self.OCCUPANCY_GRID_WIDTH/self.OCCUPANCY_GRID_CELL_SIZE)), int(round(self.OCCUPANCY_GRID_WIDTH/self.OCCUPANCY_GRID_CELL_SIZE))),
+                'bounds': [0., 1.],
+                'attr': 'get_sensor_data("occupancy_grid")',
+                },
             'is_learning': {
                 'dtype': np.float32,
                 'size': 1,
@@ -326,6 +375,7 @@ class DataGeneration(EvaluateConfig):
         self.NUM_AGENTS_TO_TEST = range(2,11)
         self.RECORD_PICKLE_FILES = True
         self.GENERATE_DATASET = True
+        self.RECORD_ALL_OBSERVATIONS = True
 
         self.TEST_CASE_ARGS = {
             'policy_to_ensure': 'RVO',
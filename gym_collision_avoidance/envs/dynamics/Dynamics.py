@@ -1,6 +1,5 @@
 import numpy as np
-import math
-from gym_collision_avoidance.envs.util import wrap
+from gym_collision_avoidance.envs.util import wrap_array
 
 
 class Dynamics(object):
@@ -21,21 +20,87 @@ class Dynamics(object):
         """
         raise NotImplementedError
 
+    def batch_key(self):
+        """ Agents whose dynamics return equal keys are stepped by one :meth:`step_batch` call (on the first such agent's dynamics).
+
+        By default, only this exact Dynamics object is grouped with itself.
+        Sub-classes whose state update can be computed for many agents at once should return a key describing that (e.g., their class).
+
+        Returns:
+            key (hashable): which group of agents this dynamics model can be batched with
+        """
+        return self
+
+    def step_batch(self, agents, indices, actions, dt):
+        """ Take a step for each of several agents at once
+
+        By default, just calls :code:`step` of each agent's own dynamics model.
+
+        Args:
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects
+            indices (list): index of agents list corresponding to each agent in the batch (these agents' dynamics all have the same :meth:`batch_key`)
+            actions (np array): (len(indices) x 2) [speed, delta heading angle] command for each agent in the batch
+            dt (float): time in seconds to execute the actions
+
+        """
+        for action, i in zip(actions, indices):
+            agents[i].dynamics_model.step(action, dt)
+
+    def coast_batch(self, agents, indices, num_steps, dt):
+        """ Keep each agent in the batch driving straight at its current velocity for :code:`num_steps` steps of :code:`dt` seconds
+
+        Used by the env's adaptive time stepping in place of that many :meth:`step_batch` calls with a [speed, 0] action
+        (position is advanced in closed form). Sub-classes with extra state that evolves on every step should also advance it.
+
+        Args:
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects
+            indices (list): index of agents list corresponding to each agent in the batch (these agents' dynamics all have the same :meth:`batch_key`)
+            num_steps (int): number of steps to hold the current velocity for
+            dt (float): time in seconds of each step
+
+        """
+        world_state = agents[indices[0]].world_state
+        rows = np.array([agents[i].world_index for i in indices], dtype=int)
+        world_state.pos_global_frame[rows] += (num_steps * dt) * world_state.vel_global_frame[rows]
+        world_state.delta_heading_global_frame[rows] = 0.0
+
     def update_ego_frame(self):
         """ Update agent's heading and velocity by converting those values from the global to ego frame.
 
         This should be run every time :code:`step` is called (add to :code:`step`?)
 
         """
+        Dynamics.update_ego_frames(self.agent.world_state, [self.agent.world_index])
+
+    @staticmethod
+    def update_ego_frames(world_state, rows):
+        """ Same as :meth:`update_ego_frame`, for every agent in :code:`rows` of :code:`world_state` at once
+
+        Args:
+            world_state (:class:`~gym_collision_avoidance.envs.world_state.WorldState`): arrays holding the agents' states (updated in place)
+            rows (list): which rows of world_state to update
+
+        """
+        rows = np.asarray(rows, dtype=int)
+        if len(rows) == 0:
+            return
+
         # Compute heading w.r.t. ref_prll, ref_orthog coordinate axes
-        self.agent.ref_prll, self.agent.ref_orth = self.agent.get_ref()
-        ref_prll_angle_global_frame = np.arctan2(self.agent.ref_prll[1],
-                                                 self.agent.ref_prll[0])
-        self.agent.heading_ego_frame = wrap(self.agent.heading_global_frame -
-                                      ref_prll_angle_global_frame)
+        goal_direction = world_state.goal_global_frame[rows] - world_state.pos_global_frame[rows]
+        dist_to_goal = np.sqrt(goal_direction[:, 0]**2 + goal_direction[:, 1]**2)
+        far_from_goal = dist_to_goal > 1e-8
+        ref_prll = goal_direction
+        ref_prll[far_from_goal] /= dist_to_goal[far_from_goal, np.newaxis]
+        ref_orth = np.stack([-ref_prll[:, 1], ref_prll[:, 0]], axis=1)  # rotate by 90 deg
+        ref_prll_angle_global_frame = np.arctan2(ref_prll[:, 1], ref_prll[:, 0])
+        heading_ego_frame = wrap_array(world_state.heading_global_frame[rows] - ref_prll_angle_global_frame)
 
         # Compute velocity w.r.t. ref_prll, ref_orthog coordinate axes
-        cur_speed = math.sqrt(self.agent.vel_global_frame[0]**2 + self.agent.vel_global_frame[1]**2) # much faster than np.linalg.norm
-        v_prll = cur_speed * np.cos(self.agent.heading_ego_frame)
-        v_orthog = cur_speed * np.sin(self.agent.heading_ego_frame)
-        self.agent.vel_ego_frame = np.array([v_prll, v_orthog])
\ No newline at end of file
+        vel = world_state.vel_global_frame[rows]
+        cur_speed = np.sqrt(vel[:, 0]**2 + vel[:, 1]**2)
+        world_state.dist_to_goal[rows] = dist_to_goal
+        world_state.ref_prll[rows] = ref_prll
+        world_state.ref_orth[rows] = ref_orth
+        world_state.heading_ego_frame[rows] = heading_ego_frame
+        world_state.vel_ego_frame[rows, 0] = cur_speed * np.cos(heading_ego_frame)
+        world_state.vel_ego_frame[rows, 1] = cur_speed * np.sin(heading_ego_frame)
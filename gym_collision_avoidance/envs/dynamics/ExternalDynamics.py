@@ -11,3 +11,8 @@ class ExternalDynamics(Dynamics):
         """ Return with no changes, since the agent's state was already updated
         """
         return
+
+    def coast_batch(self, agents, indices, num_steps, dt):
+        """ Return with no changes, since the agents' states are updated externally
+        """
+        return
@@ -1,7 +1,6 @@
 import numpy as np
 from gym_collision_avoidance.envs.dynamics.Dynamics import Dynamics
-from gym_collision_avoidance.envs.util import wrap, find_nearest
-import math
+from gym_collision_avoidance.envs.util import wrap_array
 
 class UnicycleDynamics(Dynamics):
     """ Convert a speed & heading to a new state according to Unicycle Kinematics model.
@@ -24,24 +23,68 @@ class UnicycleDynamics(Dynamics):
             dt (float): time in seconds to execute :code:`action`
     
         """
-        selected_speed = action[0]
-        selected_heading = wrap(action[1] + self.agent.heading_global_frame)
+        self.step_batch([self.agent], [0], np.array([action]), dt)
 
-        dx = selected_speed * np.cos(selected_heading) * dt
-        dy = selected_speed * np.sin(selected_heading) * dt
-        self.agent.pos_global_frame += np.array([dx, dy])
+    def batch_key(self):
+        """ Every UnicycleDynamics agent can be stepped together """
+        return type(self)
 
-        self.agent.vel_global_frame[0] = selected_speed * np.cos(selected_heading)
-        self.agent.vel_global_frame[1] = selected_speed * np.sin(selected_heading)
-        self.agent.speed_global_frame = selected_speed
-        self.agent.delta_heading_global_frame = wrap(selected_heading -
-                                               self.agent.heading_global_frame)
-        self.agent.heading_global_frame = selected_heading
+    def step_batch(self, agents, indices, actions, dt):
+        """ Same as :meth:`step`, for every agent in the batch at once (written straight into their WorldState) """
+        actions = np.asarray(actions, dtype=np.float64)
+        world_state = agents[indices[0]].world_state
+        rows = np.array([agents[i].world_index for i in indices], dtype=int)
+        selected_heading = unicycle_step(world_state, rows, actions[:, 0], actions[:, 1], dt)
 
         # turning dir: needed for cadrl value fn
-        if abs(self.agent.turning_dir) < 1e-5:
-            self.agent.turning_dir = 0.11 * np.sign(selected_heading)
-        elif self.agent.turning_dir * selected_heading < 0:
-            self.agent.turning_dir = max(-np.pi, min(np.pi, -self.agent.turning_dir + selected_heading))
-        else:
-            self.agent.turning_dir = np.sign(self.agent.turning_dir) * max(0.0, abs(self.agent.turning_dir)-0.1)
\ No newline at end of file
+        world_state.turning_dir[rows] = update_turning_dir(world_state.turning_dir[rows], selected_heading)
+
+    def coast_batch(self, agents, indices, num_steps, dt):
+        """ Same as :meth:`Dynamics.coast_batch`, and also update the turning direction as if each step were taken """
+        Dynamics.coast_batch(self, agents, indices, num_steps, dt)
+        world_state = agents[indices[0]].world_state
+        rows = np.array([agents[i].world_index for i in indices], dtype=int)
+        heading = world_state.heading_global_frame[rows]
+        for _ in range(num_steps):
+            world_state.turning_dir[rows] = update_turning_dir(world_state.turning_dir[rows], heading)
+
+
+def update_turning_dir(turning_dir, selected_heading):
+    """ Each agent's new turning direction (only used by CADRL), after it turned to selected_heading """
+    return np.where(
+        np.abs(turning_dir) < 1e-5,
+        0.11 * np.sign(selected_heading),
+        np.where(
+            turning_dir * selected_heading < 0,
+            np.clip(-turning_dir + selected_heading, -np.pi, np.pi),
+            np.sign(turning_dir) * np.maximum(0.0, np.abs(turning_dir)-0.1)))
+
+
+def unicycle_step(world_state, rows, selected_speed, delta_heading, dt):
+    """ Turn each agent in rows by delta_heading, then move it forward at selected_speed for dt seconds
+
+    Args:
+        world_state (:class:`~gym_collision_avoidance.envs.world_state.WorldState`): arrays holding the agents' states (updated in place)
+        rows (np array): which rows of world_state to update
+        selected_speed (np array): (len(rows),) speed command of each agent
+        delta_heading (np array): (len(rows),) change in heading angle of each agent
+        dt (float): time in seconds to execute the commands
+
+    Returns:
+        selected_heading (np array): (len(rows),) new heading of each agent
+
+    """
+    heading = world_state.heading_global_frame[rows]
+    selected_heading = wrap_array(delta_heading + heading)
+
+    vx = selected_speed * np.cos(selected_heading)
+    vy = selected_speed * np.sin(selected_heading)
+    world_state.pos_global_frame[rows, 0] += vx * dt
+    world_state.pos_global_frame[rows, 1] += vy * dt
+
+    world_state.vel_global_frame[rows, 0] = vx
+    world_state.vel_global_frame[rows, 1] = vy
+    world_state.speed_global_frame[rows] = selected_speed
+    world_state.delta_heading_global_frame[rows] = wrap_array(selected_heading - heading)
+    world_state.heading_global_frame[rows] = selected_heading
+    return selected_heading
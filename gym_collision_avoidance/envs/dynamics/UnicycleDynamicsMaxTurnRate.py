@@ -1,7 +1,6 @@
 import numpy as np
 from gym_collision_avoidance.envs.dynamics.Dynamics import Dynamics
-from gym_collision_avoidance.envs.util import wrap, find_nearest
-import math
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import unicycle_step
 
 class UnicycleDynamicsMaxTurnRate(Dynamics):
     """ Convert a speed & heading to a new state according to Unicycle Kinematics model, but
@@ -20,24 +19,23 @@ class UnicycleDynamicsMaxTurnRate(Dynamics):
         The desired change in heading divided by dt is the desired turning rate.
         Clip this to remain within plus/minus max_turn_rate.
         Then, propagate using the UnicycleDynamics model instead.
-        Should update this to call UnicycleDynamics's step instead of re-writing.
 
         Args:
             action (list): [delta heading angle, speed] command for this agent
             dt (float): time in seconds to execute :code:`action`
         
         """
-        selected_speed = action[0]
-        turning_rate = np.clip(action[1]/dt, -self.max_turn_rate, self.max_turn_rate)
-        selected_heading = wrap(turning_rate*dt + self.agent.heading_global_frame)
+        self.step_batch([self.agent], [0], np.array([action]), dt)
 
-        dx = selected_speed * np.cos(selected_heading) * dt
-        dy = selected_speed * np.sin(selected_heading) * dt
-        self.agent.pos_global_frame += np.array([dx, dy])
+    def batch_key(self):
+        """ Every UnicycleDynamicsMaxTurnRate agent can be stepped together (each with its own max_turn_rate) """
+        return type(self)
 
-        self.agent.vel_global_frame[0] = selected_speed * np.cos(selected_heading)
-        self.agent.vel_global_frame[1] = selected_speed * np.sin(selected_heading)
-        self.agent.speed_global_frame = selected_speed
-        self.agent.delta_heading_global_frame = wrap(selected_heading -
-                                               self.agent.heading_global_frame)
-        self.agent.heading_global_frame = selected_heading
+    def step_batch(self, agents, indices, actions, dt):
+        """ Same as :meth:`step`, for every agent in the batch at once (written straight into their WorldState) """
+        actions = np.asarray(actions, dtype=np.float64)
+        world_state = agents[indices[0]].world_state
+        rows = np.array([agents[i].world_index for i in indices], dtype=int)
+        max_turn_rate = np.array([agents[i].dynamics_model.max_turn_rate for i in indices])
+        turning_rate = np.clip(actions[:, 1]/dt, -max_turn_rate, max_turn_rate)
+        unicycle_step(world_state, rows, actions[:, 0], turning_rate*dt, dt)
@@ -2,6 +2,7 @@ import numpy as np
 import os
 from gym_collision_avoidance.envs.policies.InternalPolicy import InternalPolicy
 from gym_collision_avoidance.envs.policies.CADRL.scripts.multi import nn_navigation_value_multi as nn_nav
+from gym_collision_avoidance.envs.policies.model_registry import registry
 from gym_collision_avoidance.envs import Config
 from gym_collision_avoidance.envs import util
 
@@ -14,6 +15,7 @@ class CADRLPolicy(InternalPolicy):
     """
     def __init__(self):
         InternalPolicy.__init__(self, str="CADRL")
+        self.uses_obs = False
 
         num_agents = 4
         file_dir = os.path.dirname(os.path.realpath(__file__)) + '/CADRL/scripts/multi'
@@ -22,7 +24,12 @@ class CADRLPolicy(InternalPolicy):
         # mode = 'rotate_constr'; passing_side = 'right'; iteration = 1300
         mode = 'no_constr'; passing_side = 'none'; iteration = 1000
         filename="%d_agents_policy_iter_"%num_agents + str(iteration) + ".p"
-        self.value_net = nn_nav.load_NN_navigation_value(file_dir, num_agents, mode, passing_side, filename=filename, ifPrint=False)
+        self.value_net_file = (file_dir, num_agents, mode, passing_side, filename)
+        # Every CADRLPolicy in the process shares one copy of the value_net
+        self.value_net_handle = registry.acquire_for(
+            self, (type(self), self.value_net_file),
+            lambda: nn_nav.load_NN_navigation_value(file_dir, num_agents, mode, passing_side, filename=filename, ifPrint=False))
+        self.value_net = self.value_net_handle.model
 
     def find_next_action(self, obs, agents, i):
         """ Converts environment's agents representation to CADRL format, then queries NN
@@ -40,11 +47,37 @@ class CADRLPolicy(InternalPolicy):
         action = self.query_and_rescale_action(host_agent, agent_state, other_agents_state, other_agents_actions)
         return action
 
+    def batch_key(self):
+        """ Agents whose value networks were loaded from the same file can all be queried through one of them """
+        return (type(self), self.value_net_file)
+
+    def find_next_actions(self, obs_batch, agents, indices):
+        """ Same as find_next_action for several agents, all queried through this policy's value network
+
+        (The value network is a small numpy MLP, so there is no per-query session overhead to amortize;
+        each agent still gets its own look-ahead over its feasible actions.)
+
+        Args:
+            obs_batch (list): ignored
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects
+            indices (list): index of agents list corresponding to each agent in the batch
+
+        Returns:
+            actions (np array): (len(indices) x 2) commanded [heading delta, speed] for each agent
+
+        """
+        actions = np.zeros((len(indices), 2))
+        for j, i in enumerate(indices):
+            host_agent, agent_state, other_agents_state, other_agents_actions = self.parse_agents(agents, i)
+            actions[j, :] = self.query_and_rescale_action(host_agent, agent_state, other_agents_state, other_agents_actions)
+        return actions
+
     def find_next_action_and_value(self, obs, agents, i):
         """ Same as find_next_action but also queries value fn """
         host_agent, agent_state, other_agents_state, other_agents_actions = self.parse_agents(agents, i)
         action = self.query_and_rescale_action(host_agent, agent_state, other_agents_state, other_agents_actions)
-        value = self.value_net.find_states_values(agent_state, other_agents_state)
+        with self.value_net_handle.lock:
+            value = self.value_net.find_states_values(agent_state, other_agents_state)
         return action, value
 
     def parse_agents(self, agents, i):
@@ -63,7 +96,12 @@ class CADRLPolicy(InternalPolicy):
 
         """
         host_agent = agents[i]
-        other_agents = agents[:i]+agents[i+1:]
+        neighbor_list = host_agent.world_state.neighbor_list
+        if neighbor_list is not None and neighbor_list.num_agents == len(agents) and np.isfinite(Config.SENSING_HORIZON):
+            # Only agents in the neighbor list can be within the sensing horizon (kept in the same order)
+            other_agents = [agents[j] for j in neighbor_list.query(i, Config.SENSING_HORIZON)]
+        else:
+            other_agents = agents[:i]+agents[i+1:]
         agent_state = self.convert_host_agent_to_cadrl_state(host_agent)
         other_agents_state, other_agents_actions = self.convert_other_agents_to_cadrl_state(host_agent, other_agents)
         return host_agent, agent_state, other_agents_state, other_agents_actions
@@ -73,7 +111,9 @@ class CADRLPolicy(InternalPolicy):
 
         """
         if len(other_agents_state) > 0:
-            action = self.value_net.find_next_action(agent_state, other_agents_state, other_agents_actions)
+            with self.value_net_handle.lock:
+                # value_net keeps the last query's value around, so queries can't interleave
+                action = self.value_net.find_next_action(agent_state, other_agents_state, other_agents_actions)
             # action[0] /= host_agent.pref_speed
             action[1] = util.wrap(action[1]-host_agent.heading_global_frame)
         else:
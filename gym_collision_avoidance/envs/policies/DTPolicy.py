@@ -5,7 +5,7 @@ import torch
 from gym_collision_avoidance.envs.policies.InternalPolicy import InternalPolicy
 from gym_collision_avoidance.envs import util
 from gym_collision_avoidance.envs import Config
-from gym_collision_avoidance.envs.policies.GA3C_CADRL.network import Actions, Actions_Plus
+from gym_collision_avoidance.envs.policies.GA3C_CADRL.actions import Actions, Actions_Plus
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../../dt-ca')))
 try:
@@ -41,6 +41,7 @@ class DTPolicy(InternalPolicy):
                 resid_pdrop=DTconfig.dropout,
                 attn_pdrop=DTconfig.dropout,
             )
+        self.model_path = model_path
         self.model.load_state_dict(torch.load(model_path, map_location=torch.device(device)), strict=False)
         self.model.eval()
         if device == 'cuda':
@@ -79,9 +80,7 @@ class DTPolicy(InternalPolicy):
             [spd, heading change] command
 
         """
-        # Pad actions and reward for next step
-        self.actions = torch.cat([self.actions, torch.zeros((1, self.act_dim), device=self.device)], dim=0)
-        self.rewards = torch.cat([self.rewards, torch.zeros(1, device=self.device)])
+        self.pad_history()
 
         self.action = self.model.get_action(
             self.states.to(device=self.device, dtype=torch.float32),
@@ -91,7 +90,81 @@ class DTPolicy(InternalPolicy):
             self.timesteps.to(device=self.device, dtype=torch.long),
         )
 
-        action = self.action.detach().cpu().numpy()
+        return self.model_output_to_action(self.action)
+
+    def batch_key(self):
+        """ Agents running the same model file can share one forward pass per step """
+        if getattr(self, 'model_path', None) is None or self.model.max_length is None:
+            return self
+        return (type(self), self.model_path, self.device)
+
+    def find_next_actions(self, obs_batch, agents, indices):
+        """ Same as find_next_action for several agents, with one forward pass of this policy's model
+
+        Each agent's history is truncated/left-padded to the model's context length (as in DecisionTransformer.get_action),
+        then all of the histories are stacked along the batch dimension.
+
+        Args:
+            obs_batch (list): ignored
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects
+            indices (list): index of agents list corresponding to each agent in the batch
+
+        Returns:
+            actions (np array): (len(indices) x 2) [spd, heading change] command for each agent
+
+        """
+        policies = [agents[i].policy for i in indices]
+        for policy in policies:
+            policy.pad_history()
+        states, actions, returns_to_go, timesteps, attention_mask = \
+            [torch.cat(x, dim=0) for x in zip(*[policy.context() for policy in policies])]
+
+        _, action_preds, _ = self.model.forward(
+            states, actions, None, returns_to_go, timesteps, attention_mask=attention_mask)
+
+        next_actions = np.zeros((len(indices), 2))
+        for j, policy in enumerate(policies):
+            policy.action = action_preds[j, -1]
+            next_actions[j, :] = policy.model_output_to_action(policy.action)
+        return next_actions
+
+    def pad_history(self):
+        """ Pad actions and reward for next step """
+        self.actions = torch.cat([self.actions, torch.zeros((1, self.act_dim), device=self.device)], dim=0)
+        self.rewards = torch.cat([self.rewards, torch.zeros(1, device=self.device)])
+
+    def context(self):
+        """ This agent's history as a batch of 1, truncated/left-padded to the model's context length
+
+        Returns:
+            states, actions, returns_to_go, timesteps, attention_mask (torch tensors) to be passed to the model's forward
+        """
+        max_length = self.model.max_length
+        states = self.states.reshape(1, -1, self.state_dim)[:, -max_length:]
+        actions = self.actions.reshape(1, -1, self.act_dim)[:, -max_length:]
+        returns_to_go = self.target_return.reshape(1, -1, 1)[:, -max_length:]
+        timesteps = self.timesteps.reshape(1, -1)[:, -max_length:]
+
+        num_padding = max_length - states.shape[1]
+        attention_mask = torch.cat([torch.zeros(num_padding), torch.ones(states.shape[1])])
+        attention_mask = attention_mask.to(dtype=torch.long, device=self.device).reshape(1, -1)
+        states = torch.cat(
+            [torch.zeros((1, num_padding, self.state_dim), device=self.device), states],
+            dim=1).to(dtype=torch.float32)
+        actions = torch.cat(
+            [torch.zeros((1, num_padding, self.act_dim), device=self.device), actions],
+            dim=1).to(dtype=torch.float32)
+        returns_to_go = torch.cat(
+            [torch.zeros((1, num_padding, 1), device=self.device), returns_to_go],
+            dim=1).to(dtype=torch.float32)
+        timesteps = torch.cat(
+            [torch.zeros((1, num_padding), device=self.device), timesteps],
+            dim=1).to(dtype=torch.long)
+        return states, actions, returns_to_go, timesteps, attention_mask
+
+    def model_output_to_action(self, model_output):
+        """ Convert the model's action prediction (continuous, or scores over Actions/Actions_Plus) into a [spd, heading change] command """
+        action = model_output.detach().cpu().numpy()
         if len(action) == 2:
             pass
         elif len(action) == 11:
@@ -3,7 +3,8 @@ import os
 import operator
 from gym_collision_avoidance.envs.policies.InternalPolicy import InternalPolicy
 from gym_collision_avoidance.envs import util
-from gym_collision_avoidance.envs.policies.GA3C_CADRL import network
+from gym_collision_avoidance.envs.policies.GA3C_CADRL import network_numpy
+from gym_collision_avoidance.envs.policies.model_registry import registry
 from gym_collision_avoidance.envs import Config
 
 class GA3CCADRLPolicy(InternalPolicy):
@@ -18,12 +19,20 @@ class GA3CCADRLPolicy(InternalPolicy):
         self.possible_actions = Config.ACTIONS
         num_actions = self.possible_actions.num_actions
         self.device = '/cpu:0'
-        self.nn = network.NetworkVP_rnn(self.device, 'network', num_actions)
+        self.nn = None
+        self.nn_handle = None
         self.last_action_idx = None
+        self.checkpt_path = None
 
     def initialize_network(self, **kwargs):
         """ Load the model parameters of either a default file, or if provided through kwargs, a specific path and/or tensorflow checkpoint.
 
+        With :code:`Config.GA3C_CADRL_NUMPY_NETWORK`, the checkpoint's weights are read from its .npz instead
+        and the network is run by :class:`~gym_collision_avoidance.envs.policies.GA3C_CADRL.network_numpy.NetworkVP_rnn_numpy` (tensorflow isn't imported).
+
+        Each checkpoint is only loaded once per process: policies that ask for the same one share its network
+        (through :data:`~gym_collision_avoidance.envs.policies.model_registry.registry`), which is closed once none of them are left.
+
         Args:
             kwargs['checkpt_name'] (str): name of checkpoint file to load (without file extension)
             kwargs['checkpt_dir'] (str): path to checkpoint
@@ -45,7 +54,36 @@ class GA3CCADRLPolicy(InternalPolicy):
         else:
             checkpt_dir = os.path.dirname(os.path.realpath(__file__)) + '/GA3C_CADRL/checkpoints/IROS18/'
 
-        self.nn.simple_load(checkpt_dir + checkpt_name)
+        checkpt_path = checkpt_dir + checkpt_name
+        if self.nn_handle is not None and self.checkpt_path == checkpt_path:
+            return
+
+        if Config.GA3C_CADRL_NUMPY_NETWORK:
+            NetworkVP_rnn = network_numpy.NetworkVP_rnn_numpy
+            close = None
+        else:
+            from gym_collision_avoidance.envs.policies.GA3C_CADRL import network
+            NetworkVP_rnn = network.NetworkVP_rnn
+            close = lambda nn: nn.sess.close()
+
+        def load():
+            nn = NetworkVP_rnn(self.device, 'network', self.possible_actions.num_actions)
+            nn.simple_load(checkpt_path)
+            return nn
+
+        nn_handle = registry.acquire_for(self, (type(self), checkpt_path, NetworkVP_rnn), load, close=close)
+        if self.nn_handle is not None:
+            self.nn_handle.release()
+        self.nn_handle = nn_handle
+        self.nn = nn_handle.model
+        self.checkpt_path = checkpt_path
+
+    def batch_key(self):
+        """ Agents whose networks were loaded from the same checkpoint (by the same network class) can share one network query per step """
+        if self.checkpt_path is None:
+            return self
+        # (same parts as the registry key in initialize_network, so a batch only spans policies sharing one network)
+        return (type(self), self.checkpt_path, type(self.nn))
 
     def find_next_action(self, obs, agents, i):
         """ Using only the dictionary obs, convert this to the vector needed for the GA3C-CADRL network, query the network, adjust the actions for this env.
@@ -66,25 +104,56 @@ class GA3CCADRLPolicy(InternalPolicy):
         # new_obs = self.agents_to_ga3c_cadrl_state(host_agent, other_agents)
         # new_obs = np.expand_dims(new_obs[1:], axis=0)
 
-        if type(obs) == dict:
-            # Turn the dict observation into a flattened vector
-            vec_obs = np.array([])
-            for state in Config.STATES_IN_OBS:
-                if state not in Config.STATES_NOT_USED_IN_POLICY:
-                    vec_obs = np.hstack([vec_obs, obs[state].flatten()])
-            vec_obs = np.expand_dims(vec_obs, axis=0)
+        vec_obs = self.obs_to_vec(obs)
 
         # print(obs)
         # print(vec_obs)
         # assert(0)
 
-        predictions = self.nn.predict_p(vec_obs)[0]
+        with self.nn_handle.lock:
+            predictions = self.nn.predict_p(vec_obs)[0]
         action_index = np.argmax(predictions)
         self.last_action_idx = action_index
         raw_action = self.possible_actions.actions[action_index]
         action = np.array([pref_speed*raw_action[0], raw_action[1]])
         return action
 
+    def find_next_actions(self, obs_batch, agents, indices):
+        """ Same as find_next_action, but for several agents with a single query of this policy's network
+
+        Args:
+            obs_batch (list): each agent's observation (dict), in the same order as :code:`indices`
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects
+            indices (list): index of agents list corresponding to each agent in the batch
+
+        Returns:
+            actions (np array): (len(indices) x 2) [spd, heading change] command for each agent
+
+        """
+        vec_obs = np.vstack([self.obs_to_vec(obs) for obs in obs_batch])
+        with self.nn_handle.lock:
+            predictions = self.nn.predict_p(vec_obs)
+        action_indices = np.argmax(predictions, axis=1)
+
+        actions = np.zeros((len(indices), 2))
+        for j, (obs, i) in enumerate(zip(obs_batch, indices)):
+            policy = agents[i].policy
+            policy.last_action_idx = action_indices[j]
+            raw_action = policy.possible_actions.actions[action_indices[j]]
+            actions[j, :] = [obs['pref_speed']*raw_action[0], raw_action[1]]
+        return actions
+
+    def obs_to_vec(self, obs):
+        """ Turn the dict observation into the (1 x obs_length) vector the GA3C-CADRL network takes """
+        if type(obs) == dict:
+            # Turn the dict observation into a flattened vector
+            vec_obs = np.array([])
+            for state in Config.STATES_IN_OBS:
+                if state not in Config.STATES_NOT_USED_IN_POLICY:
+                    vec_obs = np.hstack([vec_obs, obs[state].flatten()])
+            vec_obs = np.expand_dims(vec_obs, axis=0)
+        return vec_obs
+
     # def agents_to_ga3c_cadrl_state(self, host_agent, other_agents):
 
     #     obs = np.zeros((network.Config.FULL_LABELED_STATE_LENGTH))
@@ -0,0 +1,106 @@
+""" Extract the weights of GA3C-CADRL tensorflow checkpoints into .npz files for :mod:`network_numpy`
+
+Usage (converts every checkpoint under ./checkpoints/ if no paths are given)::
+
+    python export_npz.py [checkpoint_path ...]
+
+where each checkpoint_path is given without file extension (e.g., checkpoints/IROS18/network_01900000),
+and the weights are written next to it (e.g., checkpoints/IROS18/network_01900000.npz).
+
+"""
+import argparse
+import glob
+import os
+
+import numpy as np
+import tensorflow.compat.v1 as tf
+from tensorflow.python.framework import tensor_util
+
+# Names of the trained variables, in the order the network applies them
+VARIABLES = [
+    'rnn/lstm_cell/kernel', 'rnn/lstm_cell/bias',
+    'layer1/kernel', 'layer1/bias',
+    'layer2/kernel', 'layer2/bias',
+    'fullyconnected1/kernel', 'fullyconnected1/bias',
+    'logits_p/kernel', 'logits_p/bias',
+    'logits_v/kernel', 'logits_v/bias',
+]
+
+
+def consumer(tensor, op_types):
+    """ The (first) op of one of op_types that takes tensor as its input """
+    for op in tensor.consumers():
+        if op.type in op_types:
+            return op
+    raise ValueError("No {} op reads from {}".format(op_types, tensor.name))
+
+
+def const(tensor):
+    return tensor_util.MakeNdarray(tensor.op.get_attr('value'))
+
+
+def slice_bounds(op):
+    """ [begin, end) of the last axis of a StridedSlice op (end=0 means "to the end") """
+    return const(op.inputs[1])[-1], const(op.inputs[2])[-1]
+
+
+def export_npz(checkpt_path, npz_path=None):
+    """ Read one checkpoint's weights and the preprocessing constants baked into its graph, save them to npz_path
+
+    Args:
+        checkpt_path (str): path to the checkpoint, without file extension
+        npz_path (str): where to write the weights (default: checkpt_path + '.npz')
+
+    Returns:
+        npz_path (str)
+    """
+    if npz_path is None:
+        npz_path = checkpt_path + '.npz'
+
+    graph = tf.Graph()
+    with graph.as_default():
+        with tf.Session(graph=graph) as sess:
+            saver = tf.train.import_meta_graph(checkpt_path + '.meta', clear_devices=True)
+            saver.restore(sess, checkpt_path)
+            weights = {name: sess.run(graph.get_tensor_by_name(name + ':0')) for name in VARIABLES}
+
+            # The graph normalizes X as (X - avg) / std, then splits it into
+            # [num_other_agents, host_agent_state, other_agents_states (reshaped to a sequence)]
+            x = graph.get_tensor_by_name('X:0')
+            sub = consumer(x, ['Sub'])
+            div = consumer(sub.outputs[0], ['RealDiv'])
+            num_other_agents_slice = consumer(x, ['StridedSlice'])
+            normalized_slices = sorted(
+                [op for op in div.outputs[0].consumers() if op.type == 'StridedSlice'],
+                key=lambda op: slice_bounds(op)[0])
+            host_agent_slice, other_agents_slice = normalized_slices
+            reshape = consumer(other_agents_slice.outputs[0], ['Reshape'])
+            forget_bias = [
+                const(op.inputs[1]) for op in graph.get_operations()
+                if op.type in ['Add', 'AddV2'] and 'lstm_cell' in op.name and op.inputs[0].name.endswith('split:2')
+            ]
+
+            weights['input_avg'] = const(sub.inputs[1])
+            weights['input_std'] = const(div.inputs[1])
+            weights['num_other_agents_index'] = np.array(slice_bounds(num_other_agents_slice)[0])
+            weights['host_agent_bounds'] = np.array(slice_bounds(host_agent_slice))
+            weights['other_agents_start'] = np.array(slice_bounds(other_agents_slice)[0])
+            weights['other_agents_shape'] = const(reshape.inputs[1])[1:]
+            weights['forget_bias'] = np.array(forget_bias[0] if len(forget_bias) > 0 else 0., dtype=np.float32)
+
+    np.savez(npz_path, **weights)
+    return npz_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('checkpt_paths', nargs='*')
+    args = parser.parse_args()
+
+    checkpt_paths = args.checkpt_paths
+    if len(checkpt_paths) == 0:
+        checkpt_dir = os.path.dirname(os.path.realpath(__file__)) + '/checkpoints/'
+        checkpt_paths = [path[:-len('.meta')] for path in sorted(glob.glob(checkpt_dir + '*/*.meta'))]
+
+    for checkpt_path in checkpt_paths:
+        print("Wrote", export_npz(checkpt_path))
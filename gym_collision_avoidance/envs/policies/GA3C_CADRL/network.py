@@ -1,35 +1,10 @@
 import numpy as np
 import tensorflow.compat.v1 as tf
 import time
+from gym_collision_avoidance.envs.policies.GA3C_CADRL.actions import Actions, Actions_Plus
 
 np.set_printoptions(precision=3, suppress=True)
 
-class Actions():
-    # Define 11 choices of actions to be:
-    # [v_pref,      [-pi/6, -pi/12, 0, pi/12, pi/6]]
-    # [0.5*v_pref,  [-pi/6, 0, pi/6]]
-    # [0,           [-pi/6, 0, pi/6]]
-    def __init__(self):
-        self.actions = np.mgrid[1.0:1.1:0.5, -np.pi/6:np.pi/6+0.01:np.pi/12].reshape(2, -1).T
-        self.actions = np.vstack([self.actions,np.mgrid[0.5:0.6:0.5, -np.pi/6:np.pi/6+0.01:np.pi/6].reshape(2, -1).T])
-        self.actions = np.vstack([self.actions,np.mgrid[0.0:0.1:0.5, -np.pi/6:np.pi/6+0.01:np.pi/6].reshape(2, -1).T])
-        self.num_actions = len(self.actions)
-
-class Actions_Plus():
-    # Define 29 choices of actions to be:
-    # [v_pref,      [-pi/6, -pi/9, -pi/18, 0, pi/18, pi/9, pi/6]]
-    # [0.75*v_pref, [-pi/6, -pi/9, -pi/18, 0, pi/18, pi/9, pi/6]]
-    # [0.5*v_pref,  [-pi/6, -pi/12, 0, pi/12,  pi/6]]
-    # [0.25*v_pref, [-pi/6, -pi/12, 0, pi/12,  pi/6]]
-    # [0,           [-pi/6, -pi/12, 0, pi/12,  pi/6]]
-    def __init__(self):
-        self.actions = np.mgrid[1.0:1.1:0.5, -np.pi/6:np.pi/6+0.01:np.pi/18].reshape(2, -1).T
-        self.actions = np.vstack([self.actions,np.mgrid[0.75:0.8:0.75, -np.pi/6:np.pi/6+0.01:np.pi/18].reshape(2, -1).T])
-        self.actions = np.vstack([self.actions,np.mgrid[0.5:0.6:0.5, -np.pi/6:np.pi/6+0.01:np.pi/12].reshape(2, -1).T])
-        self.actions = np.vstack([self.actions,np.mgrid[0.25:0.3:0.25, -np.pi/6:np.pi/6+0.01:np.pi/12].reshape(2, -1).T])
-        self.actions = np.vstack([self.actions,np.mgrid[0.0:0.1:0.5, -np.pi/6:np.pi/6+0.01:np.pi/12].reshape(2, -1).T])
-        self.num_actions = len(self.actions)
-
 class NetworkVPCore(object):
     def __init__(self, device, model_name, num_actions):
         self.device = device
@@ -55,6 +30,10 @@ class NetworkVPCore(object):
         # assert(0)
         return self.sess.run(self.softmax_p, feed_dict={self.x: x})
 
+    def predict_v(self, x):
+        x = self.crop_x(x)
+        return self.sess.run(self.v, feed_dict={self.x: x})
+
     def simple_load(self, filename=None):
         if filename is None:
             print("[network.py] Didn't define simple_load filename")
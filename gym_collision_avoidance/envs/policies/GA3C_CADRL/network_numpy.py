@@ -0,0 +1,126 @@
+import numpy as np
+
+
+def sigmoid(x):
+    # (same as 1 / (1 + exp(-x)), but quicker to evaluate)
+    return 0.5 * np.tanh(0.5 * x) + 0.5
+
+
+def relu(x):
+    return np.maximum(x, 0.)
+
+
+class NetworkVP_rnn_numpy(object):
+    """ Pure-numpy version of :class:`~gym_collision_avoidance.envs.policies.GA3C_CADRL.network.NetworkVP_rnn` (no tensorflow needed for inference)
+
+    Loads the weights that :code:`export_npz.py` extracted from a checkpoint, and runs the same forward pass:
+    an LSTM over each row's other agents (only the first num_other_agents of them, so rows in a batch can see different numbers of agents),
+    whose final hidden state is concatenated with the host agent's state and fed through the fully-connected layers into the policy and value heads.
+    Everything is computed in float32, like the tensorflow graph.
+
+    :param device: (str) unused, kept so this can stand in for NetworkVP_rnn
+    :param model_name: (str) unused, kept so this can stand in for NetworkVP_rnn
+    :param num_actions: (int) size of the policy head
+
+    """
+    def __init__(self, device, model_name, num_actions):
+        self.device = device
+        self.model_name = model_name
+        self.num_actions = num_actions
+
+    def simple_load(self, filename=None):
+        """ Load the weights from filename + '.npz' (filename is the checkpoint path, as for NetworkVP_rnn) """
+        if filename is None:
+            print("[network_numpy.py] Didn't define simple_load filename")
+            raise NotImplementedError
+        with np.load(filename + '.npz') as weights:
+            self.input_avg = weights['input_avg']
+            self.input_std = weights['input_std']
+            self.num_other_agents_index = int(weights['num_other_agents_index'])
+            self.host_agent_bounds = tuple(weights['host_agent_bounds'])
+            self.other_agents_start = int(weights['other_agents_start'])
+            self.max_num_other_agents, self.other_agent_length = weights['other_agents_shape']
+            self.forget_bias = weights['forget_bias']
+
+            self.lstm_kernel = weights['rnn/lstm_cell/kernel']
+            self.lstm_bias = weights['rnn/lstm_cell/bias']
+            self.layers = [
+                (weights[layer + '/kernel'], weights[layer + '/bias'])
+                for layer in ['layer1', 'layer2', 'fullyconnected1']
+            ]
+            self.logits_p = (weights['logits_p/kernel'], weights['logits_p/bias'])
+            self.logits_v = (weights['logits_v/kernel'], weights['logits_v/bias'])
+        self.num_lstm_units = self.lstm_bias.shape[0] // 4
+        self.input_length = self.input_avg.shape[0]
+
+    def crop_x(self, x):
+        # each NN might accept diff length observation
+        if x.shape[-1] > self.input_length:
+            x_ = x[:,:self.input_length]
+        elif x.shape[-1] < self.input_length:
+            x_ = np.zeros((x.shape[0], self.input_length))
+            x_[:,:x.shape[1]] = x
+        else:
+            x_ = x
+        return x_
+
+    def lstm(self, other_agents_states, num_other_agents):
+        """ Final hidden state of the LSTM, after each row's first num_other_agents steps (zeros if it has none)
+
+        Args:
+            other_agents_states (np array): (batch x max_num_other_agents x other_agent_length) normalized states
+            num_other_agents (np array): (batch,) sequence length of each row
+
+        """
+        batch_size = other_agents_states.shape[0]
+        # Sort the rows by sequence length (longest first), so the rows still in their sequence at step t are always a prefix
+        order = np.argsort(-num_other_agents, kind='stable')
+        num_other_agents = num_other_agents[order]
+        other_agents_states = other_agents_states[order]
+
+        c = np.zeros((batch_size, self.num_lstm_units), dtype=np.float32)
+        h = np.zeros((batch_size, self.num_lstm_units), dtype=np.float32)
+        for t in range(num_other_agents[0] if batch_size > 0 else 0):
+            n = np.count_nonzero(num_other_agents > t)
+            z = np.matmul(np.hstack([other_agents_states[:n, t], h[:n]]), self.lstm_kernel) + self.lstm_bias
+            i, j, f, o = np.split(z, 4, axis=1)
+            c[:n] = sigmoid(f + self.forget_bias) * c[:n] + sigmoid(i) * np.tanh(j)
+            h[:n] = sigmoid(o) * np.tanh(c[:n])
+        h[order] = h.copy()
+        return h
+
+    def hidden(self, x):
+        """ Output of the last fully-connected layer (shared by the policy and value heads) """
+        x = self.crop_x(x).astype(np.float32)
+        num_other_agents = np.clip(
+            x[:, self.num_other_agents_index].astype(np.int32), 0, self.max_num_other_agents)
+        x_normalized = (x - self.input_avg) / self.input_std
+        host_agent_state = x_normalized[:, self.host_agent_bounds[0]:self.host_agent_bounds[1]]
+        other_agents_states = x_normalized[:, self.other_agents_start:].reshape(
+            -1, self.max_num_other_agents, self.other_agent_length)
+
+        layer = np.hstack([host_agent_state, self.lstm(other_agents_states, num_other_agents)])
+        for kernel, bias in self.layers:
+            layer = relu(np.matmul(layer, kernel) + bias)
+        return layer
+
+    def predict_p(self, x):
+        """ Action probabilities, (batch x num_actions) """
+        return self.policy_head(self.hidden(x))
+
+    def predict_v(self, x):
+        """ State value estimate, (batch,) """
+        return self.value_head(self.hidden(x))
+
+    def predict_p_and_v(self, x):
+        """ Both heads from a single forward pass """
+        layer = self.hidden(x)
+        return self.policy_head(layer), self.value_head(layer)
+
+    def policy_head(self, layer):
+        logits = np.matmul(layer, self.logits_p[0]) + self.logits_p[1]
+        logits = np.exp(logits - np.max(logits, axis=1, keepdims=True))
+        return logits / np.sum(logits, axis=1, keepdims=True)
+
+    def value_head(self, layer):
+        return (np.matmul(layer, self.logits_v[0]) + self.logits_v[1])[:, 0]
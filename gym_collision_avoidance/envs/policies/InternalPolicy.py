@@ -20,4 +20,34 @@ class InternalPolicy(Policy):
         Returns:
             To be implemented by children.
         """
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def batch_key(self):
+        """ Agents whose policies return equal keys get their actions from one :meth:`find_next_actions` call (on the first such agent's policy).
+
+        By default, only agents that share this exact Policy object are grouped together.
+        Sub-classes that can answer for other instances (e.g., loaded from the same network checkpoint) should return a key describing that.
+
+        Returns:
+            key (hashable): which group of agents this policy can be batched with
+        """
+        return self
+
+    def find_next_actions(self, obs_batch, agents, indices):
+        """ Select a commanded action [heading delta, speed] for each of several agents at once
+
+        By default, just calls :code:`find_next_action` for each agent. Sub-classes override this to batch the work
+        (e.g., a single network query for every agent in the group).
+
+        Args:
+            obs_batch (list): each agent's observation (dict), in the same order as :code:`indices`
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects
+            indices (list): index of agents list corresponding to each agent in the batch (these agents' policies all have the same :meth:`batch_key`)
+
+        Returns:
+            actions (np array): (len(indices) x 2) commanded action for each agent in the batch
+        """
+        actions = np.zeros((len(indices), 2))
+        for j, (obs, i) in enumerate(zip(obs_batch, indices)):
+            actions[j, :] = agents[i].policy.find_next_action(obs, agents, i)
+        return actions
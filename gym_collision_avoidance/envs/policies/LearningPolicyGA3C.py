@@ -1,7 +1,6 @@
 import numpy as np
 
 from gym_collision_avoidance.envs.policies.LearningPolicy import LearningPolicy
-from gym_collision_avoidance.envs.policies.GA3C_CADRL import network
 from gym_collision_avoidance.envs.config import Config
 
 class LearningPolicyGA3C(LearningPolicy):
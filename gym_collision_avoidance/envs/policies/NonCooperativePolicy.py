@@ -5,6 +5,7 @@ class NonCooperativePolicy(InternalPolicy):
     """ Non Cooperative Agents simply drive at pref speed toward the goal, ignoring other agents. """
     def __init__(self):
         InternalPolicy.__init__(self, str="NonCooperativePolicy")
+        self.uses_obs = False
 
     def find_next_action(self, obs, agents, i):
         """ Go at pref_speed, apply a change in heading equal to zero out current ego heading (heading to goal)
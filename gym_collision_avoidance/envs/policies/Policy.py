@@ -6,12 +6,14 @@ class Policy(object):
 
     :param is_still_learning: (bool) whether this policy is still being learned (i.e., weights are changing during execution)
     :param is_external: (bool) whether the Policy computes its own actions or relies on an external process to provide an action.
+    :param uses_obs: (bool) whether the Policy reads the observation it's given (if not, e.g. it reads the agents list directly, the env can skip sensing for its agent)
 
     """
     def __init__(self, str="NoPolicy"):
         self.str = str
         self.is_still_learning = False
         self.is_external = False
+        self.uses_obs = True
 
     def near_goal_smoother(self, dist_to_goal, pref_speed, heading, raw_action):
         """ Linearly ramp down speed/turning if agent is near goal, stop if close enough.
@@ -2,105 +2,226 @@ import numpy as np
 from gym_collision_avoidance.envs.policies.InternalPolicy import InternalPolicy
 from gym_collision_avoidance.envs import Config
 from gym_collision_avoidance.envs.util import *
-import rvo2
+from gym_collision_avoidance.envs.policies import orca
+try:
+    import rvo2
+except ImportError:
+    # pypi version of pkg doesn't have RVO installed (the numpy backend is used instead)
+    rvo2 = None
 
 import matplotlib.pyplot as plt
 
+class RVOCoordinator(object):
+    """ One RVO simulator shared by every :class:`RVOPolicy` agent in an environment
+
+    Every step, :meth:`step` copies all agents' states into the simulator, sets each RVO agent's collaboration coefficient,
+    and runs a single RVO step for the whole crowd, which gives every RVO agent its next position at once
+    (rather than each RVOPolicy running the whole crowd through its own simulator, just to read back its own agent).
+
+    The step is run by RVO2 or, if :code:`Config.RVO_BACKEND` says so (or RVO2 isn't installed),
+    by the numpy ORCA solver in :mod:`~gym_collision_avoidance.envs.policies.orca`, which only solves for the agents that need an action.
+
+    :param num_agents: (int) number of agents in the environment (all of them are simulated as RVO agents)
+
+    """
+    def __init__(self, num_agents):
+        self.num_agents = num_agents
+        self.dt = Config.DT
+        self.neighbor_dist = Config.SENSING_HORIZON
+        self.max_neighbors = Config.MAX_NUM_AGENTS_IN_ENVIRONMENT
+
+        # TODO share this parameter with environment
+        self.time_horizon = Config.RVO_TIME_HORIZON # NOTE: bjorn used 1.0 in training for corl19
+
+        self.backend = Config.RVO_BACKEND
+        if self.backend == "auto":
+            self.backend = "numpy" if rvo2 is None else "rvo2"
+        if self.backend == "rvo2":
+            # Initialize RVO simulator
+            self.sim = rvo2.PyRVOSimulator(timeStep=self.dt, neighborDist=self.neighbor_dist, 
+                maxNeighbors=self.max_neighbors, timeHorizon=self.time_horizon, 
+                timeHorizonObst=self.time_horizon, radius=0.0, 
+                maxSpeed=0.0)
+
+            # Init simulation
+            self.rvo_agents = [self.sim.addAgent((0,0)) for a in range(self.num_agents)]
+        elif self.backend != "numpy":
+            raise ValueError("Config.RVO_BACKEND must be 'rvo2', 'numpy' or 'auto', not {}".format(self.backend))
+
+    @staticmethod
+    def for_agents(agents, agent_index):
+        """ The coordinator of the env that agents[agent_index] lives in (created on first use, dropped with the env's WorldState at reset)
+
+        Returns:
+            coordinator (:class:`RVOCoordinator`), or None if agents aren't all bound to one env's WorldState
+
+        """
+        world_state = agents[agent_index].world_state
+        if world_state.num_agents != len(agents):
+            return None
+        coordinator = world_state.policy_coordinators.get(RVOCoordinator)
+        if coordinator is None:
+            coordinator = RVOCoordinator(len(agents))
+            world_state.policy_coordinators[RVOCoordinator] = coordinator
+        return coordinator
+
+    def step(self, agents, agent_indices, collab_coeffs):
+        """ Run one RVO step of the whole crowd
+
+        Args:
+            agents (list): of all :class:`~gym_collision_avoidance.envs.agent.Agent` objects in the env
+            agent_indices (list): index of agents list corresponding to each RVO agent that needs an action
+            collab_coeffs (list): collaboration coefficient of each of those agents
+
+        Returns:
+            new_positions (np array): (len(agent_indices) x 2) where RVO moves each of those agents in one timestep
+
+        """
+        if self.backend == "numpy":
+            return self.step_numpy(agents, agent_indices, collab_coeffs)
+
+        # Share all agent positions and preferred velocities from environment with RVO simulator
+        for a in range(self.num_agents):
+            # Calculate preferred velocity
+            # Assumes non RVO agents are acting like RVO agents
+            pref_vel = agents[a].goal_global_frame - agents[a].pos_global_frame
+            pref_vel = agents[a].pref_speed / np.linalg.norm(pref_vel) * pref_vel
+
+            # Set agent positions and velocities in RVO simulator
+            self.sim.setAgentMaxSpeed(self.rvo_agents[a], agents[a].pref_speed)
+            self.sim.setAgentRadius(self.rvo_agents[a], (1+5e-2)*agents[a].radius)
+            self.sim.setAgentPosition(self.rvo_agents[a], tuple(agents[a].pos_global_frame))
+            self.sim.setAgentVelocity(self.rvo_agents[a], tuple(agents[a].vel_global_frame))
+            self.sim.setAgentPrefVelocity(self.rvo_agents[a], tuple(pref_vel))
+
+        # Each agent's collaborativity only affects its own new velocity
+        for agent_index, collab_coeff in zip(agent_indices, collab_coeffs):
+            self.sim.setAgentCollabCoeff(self.rvo_agents[agent_index], collab_coeff)
+
+        # Execute one step in the RVO simulator
+        self.sim.doStep()
+
+        return np.array([self.sim.getAgentPosition(self.rvo_agents[agent_index]) for agent_index in agent_indices])
+
+    def step_numpy(self, agents, agent_indices, collab_coeffs):
+        """ Same as :meth:`step`, but with the numpy ORCA solver """
+        world_state = agents[agent_indices[0]].world_state
+        if world_state.num_agents == len(agents):
+            # Read the env's arrays directly
+            pos = world_state.pos_global_frame
+            vel = world_state.vel_global_frame
+            goal = world_state.goal_global_frame
+            pref_speed = world_state.pref_speed
+            radius = world_state.radius
+        else:
+            pos = np.array([agent.pos_global_frame for agent in agents])
+            vel = np.array([agent.vel_global_frame for agent in agents])
+            goal = np.array([agent.goal_global_frame for agent in agents])
+            pref_speed = np.array([agent.pref_speed for agent in agents])
+            radius = np.array([agent.radius for agent in agents])
+
+        # Assumes non RVO agents are acting like RVO agents
+        pref_vel = goal - pos
+        pref_vel = (pref_speed / np.linalg.norm(pref_vel, axis=1))[:, None] * pref_vel
+
+        candidates = None
+        neighbor_list = world_state.neighbor_list
+        if neighbor_list is not None and neighbor_list.num_agents == len(agents) and np.isfinite(self.neighbor_dist):
+            # Only agents in the neighbor list can be within neighbor_dist
+            candidates = [neighbor_list.query(i, self.neighbor_dist) for i in agent_indices]
+
+        new_vel = orca.compute_new_velocities(
+            pos, vel, pref_vel, (1+5e-2)*radius, pref_speed, collab_coeffs, agent_indices,
+            self.neighbor_dist, self.max_neighbors, self.time_horizon, self.dt, candidates)
+        return pos[agent_indices] + self.dt * new_vel
+
+
 class RVOPolicy(InternalPolicy):
+    """ Optimal Reciprocal Collision Avoidance (through the `RVO2 <https://github.com/mit-acl/Python-RVO2>`_ library, or the numpy solver in :mod:`~gym_collision_avoidance.envs.policies.orca`)
+
+    All RVO agents in an environment share one simulator (:class:`RVOCoordinator`), which is stepped once per env step.
+
+    """
     def __init__(self):
         InternalPolicy.__init__(self, str="RVO")
+        self.uses_obs = False
 
         self.dt = Config.DT
-        neighbor_dist = Config.SENSING_HORIZON
-        max_neighbors = Config.MAX_NUM_AGENTS_IN_ENVIRONMENT
 
         self.has_fixed_speed = False
         self.heading_noise = False
 
         self.max_delta_heading = np.pi/6
-        
-        # TODO share this parameter with environment
-        time_horizon = Config.RVO_TIME_HORIZON # NOTE: bjorn used 1.0 in training for corl19
-        # Initialize RVO simulator
-        self.sim = rvo2.PyRVOSimulator(timeStep=self.dt, neighborDist=neighbor_dist, 
-            maxNeighbors=max_neighbors, timeHorizon=time_horizon, 
-            timeHorizonObst=time_horizon, radius=0.0, 
-            maxSpeed=0.0)
 
-        self.is_init = False
+        # Only used if this policy's agents aren't in an env (otherwise, the env's RVOCoordinator is used)
+        self.coordinator = None
 
         self.use_non_coop_policy = True
 
-    def init(self):
-        state_dim = 2
-        self.pos_agents = np.empty((self.n_agents, state_dim))
-        self.vel_agents = np.empty((self.n_agents, state_dim))
-        self.goal_agents = np.empty((self.n_agents, state_dim))
-        self.pref_vel_agents = np.empty((self.n_agents, state_dim))
-        self.pref_speed_agents = np.empty((self.n_agents))
-        
-        self.rvo_agents = [None]*self.n_agents
-
-        # Init simulation
-        for a in range(self.n_agents):
-            self.rvo_agents[a] = self.sim.addAgent((0,0))
-        
-        self.is_init = True
+    def batch_key(self):
+        """ Every RVO agent in the env gets its action from the same (shared) RVO step """
+        return type(self)
 
     def find_next_action(self, obs, agents, agent_index):
-        # Initialize vectors on first call to infer number of agents
-        if not self.is_init:
-            self.n_agents = len(agents)
-            self.init()
+        return self.find_next_actions([obs], agents, [agent_index])[0]
 
-        # Share all agent positions and preferred velocities from environment with RVO simulator
-        for a in range(self.n_agents):
-            # Copy current agent positions, goal and preferred speeds into np arrays
-            self.pos_agents[a,:] = agents[a].pos_global_frame[:]
-            self.vel_agents[a,:] = agents[a].vel_global_frame[:]
-            self.goal_agents[a,:] = agents[a].goal_global_frame[:]
-            self.pref_speed_agents[a] = agents[a].pref_speed
+    def find_next_actions(self, obs_batch, agents, indices):
+        """ Run one step of the shared RVO simulator, then turn each agent's new RVO position into a [speed, delta heading] command
 
-            # Calculate preferred velocity
-            # Assumes non RVO agents are acting like RVO agents
-            self.pref_vel_agents[a,:] = self.goal_agents[a,:] - self.pos_agents[a,:]
-            self.pref_vel_agents[a,:] = self.pref_speed_agents[a] / np.linalg.norm(self.pref_vel_agents[a,:]) * self.pref_vel_agents[a,:]
+        Args:
+            obs_batch (list): ignored
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects
+            indices (list): index of agents list corresponding to each RVO agent in the batch
 
-            # Set agent positions and velocities in RVO simulator
-            self.sim.setAgentMaxSpeed(self.rvo_agents[a], agents[a].pref_speed)
-            self.sim.setAgentRadius(self.rvo_agents[a], (1+5e-2)*agents[a].radius)
-            self.sim.setAgentPosition(self.rvo_agents[a], tuple(self.pos_agents[a,:]))
-            self.sim.setAgentVelocity(self.rvo_agents[a], tuple(self.vel_agents[a,:]))
-            self.sim.setAgentPrefVelocity(self.rvo_agents[a], tuple(self.pref_vel_agents[a,:]))
+        Returns:
+            actions (np array): (len(indices) x 2) [speed, delta heading] command for each agent
 
+        """
+        coordinator = RVOCoordinator.for_agents(agents, indices[0])
+        if coordinator is None:
+            # Initialize on first call to infer number of agents
+            if self.coordinator is None:
+                self.coordinator = RVOCoordinator(len(agents))
+            coordinator = self.coordinator
+
+        collab_coeffs = [agents[i].policy.collab_coeff(agents[i]) for i in indices]
+        new_rvo_positions = coordinator.step(agents, indices, collab_coeffs)
+
+        actions = np.zeros((len(indices), 2))
+        for j, i in enumerate(indices):
+            actions[j, :] = agents[i].policy.rvo_position_to_action(agents[i], new_rvo_positions[j])
+        return actions
+
+    def collab_coeff(self, agent):
+        """ This agent's collaborativity for the upcoming RVO step """
         # Set ego agent's collaborativity
         if Config.RVO_COLLAB_COEFF < 0:
             # agent is anti-collaborative ==> every X seconds, it chooses btwn non-coop and adversarial,
             # where the PMF of which policy to run is defined by abs(collab_coeff)\in(0,1].
 
             # if a certain freq, randomly select btwn use non coop policy vs. rvo
-            if round(agents[agent_index].t % Config.RVO_ANTI_COLLAB_T, 3) < Config.DT or \
-                round(Config.RVO_ANTI_COLLAB_T - agents[agent_index].t % Config.RVO_ANTI_COLLAB_T, 3) < Config.DT:
+            if round(agent.t % Config.RVO_ANTI_COLLAB_T, 3) < Config.DT or \
+                round(Config.RVO_ANTI_COLLAB_T - agent.t % Config.RVO_ANTI_COLLAB_T, 3) < Config.DT:
                 self.use_non_coop_policy = np.random.choice([True, False], p=[1-abs(Config.RVO_COLLAB_COEFF), abs(Config.RVO_COLLAB_COEFF)])
             if self.use_non_coop_policy:
-                self.sim.setAgentCollabCoeff(self.rvo_agents[agent_index], 0.0)
+                return 0.0
             else:
-                self.sim.setAgentCollabCoeff(self.rvo_agents[agent_index], Config.RVO_COLLAB_COEFF)
+                return Config.RVO_COLLAB_COEFF
         else:
-            self.sim.setAgentCollabCoeff(self.rvo_agents[agent_index], Config.RVO_COLLAB_COEFF)
+            return Config.RVO_COLLAB_COEFF
 
-        # Execute one step in the RVO simulator
-        self.sim.doStep()
+    def rvo_position_to_action(self, agent, new_rvo_pos):
+        """ [speed, delta heading] command that takes agent towards where RVO moved it """
+        self.new_rvo_pos = new_rvo_pos
 
         # Calculate desired change of heading
-        self.new_rvo_pos = self.sim.getAgentPosition(self.rvo_agents[agent_index])[:]
-        deltaPos = self.new_rvo_pos - self.pos_agents[agent_index,:]
+        deltaPos = self.new_rvo_pos - agent.pos_global_frame
         p1 = deltaPos
         p2 = np.array([1,0]) # Angle zero is parallel to x-axis
         ang1 = np.arctan2(*p1[::-1])
         ang2 = np.arctan2(*p2[::-1])
         new_heading_global_frame = (ang1 - ang2) % (2 * np.pi)
-        delta_heading = wrap(new_heading_global_frame - agents[agent_index].heading_global_frame)
+        delta_heading = wrap(new_heading_global_frame - agent.heading_global_frame)
             
         # Calculate desired speed
         pref_speed = 1/self.dt * np.linalg.norm(deltaPos)
@@ -5,6 +5,7 @@ class RandomPolicy(InternalPolicy):
     """ Random Agents simply drive at random speeds and in random directions, ignoring other agents. """
     def __init__(self):
         InternalPolicy.__init__(self, str="RandomPolicy")
+        self.uses_obs = False
 
     def find_next_action(self, obs, agents, i):
         """ Go at random speed [0,2), apply a random change in heading relative to ego_head to stay within [-2*pi,2*pi]
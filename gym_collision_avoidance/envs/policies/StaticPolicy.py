@@ -5,6 +5,7 @@ class StaticPolicy(InternalPolicy):
     """ For an agent who never moves, useful for confirming algorithms can avoid static objects too """
     def __init__(self):
         InternalPolicy.__init__(self, str="Static")
+        self.uses_obs = False
 
     def find_next_action(self, obs, agents, i):
         """ Static Agents do not move, so just set goal to current pos and action to zero. 
@@ -0,0 +1,92 @@
+import threading
+import weakref
+
+
+class SharedModel(object):
+    """ A handle to one model held by the :class:`ModelRegistry`
+
+    Every policy that loaded the same checkpoint gets its own handle to the same model object.
+    Calls into a model that keeps state between queries should be made while holding :code:`lock`.
+
+    :param key: (hashable) which registry entry this handle refers to
+    :param model: the loaded model, shared with every other handle on this key
+    :param lock: (threading.RLock) serializes queries to this model across threads
+
+    """
+    def __init__(self, registry, key, model, lock):
+        self.registry = registry
+        self.key = key
+        self.model = model
+        self.lock = lock
+        self.released = False
+
+    def release(self):
+        """ Give back this handle (only the first call has any effect) """
+        if not self.released:
+            self.released = True
+            self.registry.release(self.key)
+
+
+class ModelRegistry(object):
+    """ Process-wide cache of loaded models, so that policies loaded from the same checkpoint share one network
+
+    Entries are keyed by (policy type, checkpoint path) and reference-counted: a model is loaded by the first
+    :meth:`acquire` on its key, and closed/dropped once the last handle on that key has been released.
+    Safe to use from several threads.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def acquire(self, key, load, close=None):
+        """ Get a handle to the model for :code:`key`, loading it if no one else is holding it
+
+        Args:
+            key (hashable): e.g., (policy type, checkpoint path)
+            load (function): called with no arguments to build the model, if it is not loaded yet
+            close (function): called with the model once its last handle is released (optional)
+
+        Returns:
+            handle (:class:`SharedModel`): call its :code:`release` when done (or use :meth:`acquire_for`)
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Loading under the lock makes sure each model is only ever built once
+                entry = {'model': load(), 'close': close, 'lock': threading.RLock(), 'refs': 0}
+                self._entries[key] = entry
+            entry['refs'] += 1
+            return SharedModel(self, key, entry['model'], entry['lock'])
+
+    def acquire_for(self, owner, key, load, close=None):
+        """ Same as :meth:`acquire`, but the handle is released automatically when :code:`owner` is garbage collected """
+        handle = self.acquire(key, load, close=close)
+        weakref.finalize(owner, handle.release)
+        return handle
+
+    def release(self, key):
+        """ Drop one reference to the model for :code:`key`, closing it if that was the last one """
+        with self._lock:
+            entry = self._entries[key]
+            entry['refs'] -= 1
+            if entry['refs'] > 0:
+                return
+            del self._entries[key]
+        if entry['close'] is not None:
+            entry['close'](entry['model'])
+
+    def num_references(self, key):
+        """ Number of handles currently held on :code:`key` (0 if not loaded) """
+        with self._lock:
+            entry = self._entries.get(key)
+            return 0 if entry is None else entry['refs']
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+
+#: The registry shared by every policy in this process
+registry = ModelRegistry()
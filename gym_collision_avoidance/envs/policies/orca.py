@@ -0,0 +1,261 @@
+""" Optimal Reciprocal Collision Avoidance in numpy (no RVO2 needed)
+
+Follows RVO2's :code:`Agent::computeNewVelocity` (without static obstacles), but for many agents at once:
+every agent's ORCA half-planes are built in one shot from the (agents x neighbors) relative states,
+and the 2D linear programs (RVO2's linearProgram1/2/3) are solved for all agents together,
+stepping through the half-planes one at a time (each agent's half-planes are processed in the same order as RVO2: nearest neighbor first).
+
+"""
+import numpy as np
+
+EPSILON = 1e-5  # same as RVO2's RVO_EPSILON
+
+
+def det(a, b):
+    """ 2D cross product of the last axis of a and b """
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def dot(a, b):
+    return a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1]
+
+
+def compute_new_velocities(pos, vel, pref_vel, radius, max_speed, collab_coeff, agent_indices,
+                           neighbor_dist, max_neighbors, time_horizon, dt, candidates=None):
+    """ ORCA velocity of each of agent_indices, treating every agent in pos as a (reciprocal) neighbor
+
+    Args:
+        pos (np array): (num_agents x 2) positions
+        vel (np array): (num_agents x 2) current velocities
+        pref_vel (np array): (num_agents x 2) preferred velocities
+        radius (np array): (num_agents,) radii
+        max_speed (np array): (num_agents,) max speeds
+        collab_coeff (np array): (len(agent_indices),) share of each collision avoidance maneuver that
+            each of agent_indices takes on itself (0.5 for standard reciprocal avoidance)
+        agent_indices (np array): which agents to compute new velocities for
+        neighbor_dist (float): only agents closer than this (center to center) are considered
+        max_neighbors (int): at most this many (nearest) neighbors are considered
+        time_horizon (float): how far ahead [s] collisions with other agents are avoided
+        dt (float): simulation timestep [s] (used to resolve collisions that already happened)
+        candidates (list): if provided, for each of agent_indices, sorted indices of the only agents that can be
+            within neighbor_dist of it (e.g., from a :class:`~gym_collision_avoidance.envs.spatial_hash.NeighborList`)
+
+    Returns:
+        new_vel (np array): (len(agent_indices) x 2) new velocity of each of agent_indices
+
+    """
+    agent_indices = np.asarray(agent_indices)
+    num_agents = pos.shape[0]
+
+    # Neighbors of each agent, nearest first (like RVO2's agentNeighbors_)
+    if candidates is None:
+        candidates = np.broadcast_to(np.arange(num_agents), (len(agent_indices), num_agents))
+    else:
+        # Pad each row with the agent itself (which is never its own neighbor)
+        num_candidates = max([len(c) for c in candidates], default=0)
+        padded = np.repeat(agent_indices[:, None], num_candidates, axis=1)
+        for row, c in enumerate(candidates):
+            padded[row, :len(c)] = c
+        candidates = padded
+    rel_pos = pos[candidates] - pos[agent_indices, None, :]
+    dist_sq = dot(rel_pos, rel_pos)
+    dist_sq[candidates == agent_indices[:, None]] = np.inf
+    dist_sq[~(dist_sq < neighbor_dist ** 2)] = np.inf
+    num_neighbors = min(max_neighbors, candidates.shape[1])
+    # (ties stay in index order, as candidates are sorted)
+    columns = np.argsort(dist_sq, axis=1, kind='stable')[:, :num_neighbors]
+    neighbors = np.take_along_axis(candidates, columns, axis=1)
+    dist_sq = np.take_along_axis(dist_sq, columns, axis=1)
+    valid = np.isfinite(dist_sq)
+    dist_sq[~valid] = 1.  # (values of invalid lines are never used)
+
+    rel_pos = np.take_along_axis(rel_pos, columns[:, :, None], axis=1)
+    rel_vel = vel[agent_indices, None, :] - vel[neighbors]
+    combined_radius = radius[agent_indices, None] + radius[neighbors]
+    combined_radius_sq = combined_radius ** 2
+    inv_time_horizon = 1. / time_horizon
+
+    direction = np.zeros(rel_pos.shape)
+    u = np.zeros(rel_pos.shape)
+
+    # No collision: vector from cutoff center to relative velocity
+    w = rel_vel - inv_time_horizon * rel_pos
+    w_length_sq = dot(w, w)
+    dot_product1 = dot(w, rel_pos)
+    no_collision = dist_sq > combined_radius_sq
+    on_cutoff_circle = no_collision & (dot_product1 < 0) & (dot_product1 ** 2 > combined_radius_sq * w_length_sq)
+    on_legs = no_collision & ~on_cutoff_circle
+
+    # ... project on the cut-off circle
+    w_length = np.sqrt(w_length_sq[on_cutoff_circle])
+    unit_w = w[on_cutoff_circle] / w_length[:, None]
+    direction[on_cutoff_circle] = np.stack([unit_w[:, 1], -unit_w[:, 0]], axis=-1)
+    u[on_cutoff_circle] = ((combined_radius[on_cutoff_circle] * inv_time_horizon - w_length)[:, None] * unit_w)
+
+    # ... project on the left or right leg
+    p = rel_pos[on_legs]
+    r = combined_radius[on_legs]
+    leg = np.sqrt(dist_sq[on_legs] - combined_radius_sq[on_legs])
+    left_leg = det(p, w[on_legs]) > 0
+    leg_direction = np.where(
+        left_leg[:, None],
+        np.stack([p[:, 0] * leg - p[:, 1] * r, p[:, 0] * r + p[:, 1] * leg], axis=-1),
+        -np.stack([p[:, 0] * leg + p[:, 1] * r, -p[:, 0] * r + p[:, 1] * leg], axis=-1),
+    ) / dist_sq[on_legs][:, None]
+    direction[on_legs] = leg_direction
+    u[on_legs] = dot(rel_vel[on_legs], leg_direction)[:, None] * leg_direction - rel_vel[on_legs]
+
+    # Collision: project on cut-off circle of time timeStep
+    collision = ~no_collision & valid
+    inv_time_step = 1. / dt
+    w = rel_vel[collision] - inv_time_step * rel_pos[collision]
+    w_length = np.sqrt(dot(w, w))
+    unit_w = w / w_length[:, None]
+    direction[collision] = np.stack([unit_w[:, 1], -unit_w[:, 0]], axis=-1)
+    u[collision] = (combined_radius[collision] * inv_time_step - w_length)[:, None] * unit_w
+
+    point = vel[agent_indices, None, :] + np.asarray(collab_coeff, dtype=float)[:, None, None] * u
+
+    speed = max_speed[agent_indices]
+    new_vel, line_fail = linear_program2(point, direction, valid, speed, pref_vel[agent_indices], False)
+    failed = line_fail < point.shape[1]
+    if np.any(failed):
+        new_vel[failed] = linear_program3(
+            point[failed], direction[failed], valid[failed], line_fail[failed], speed[failed], new_vel[failed])
+    return new_vel
+
+
+def linear_program1(point, direction, valid, line_no, radius, opt_velocity, direction_opt, result, rows):
+    """ Optimize along line line_no of each of rows, subject to that row's (valid) lines before it and the max speed circle
+
+    Updates result[rows] in place where the problem is feasible.
+
+    Returns:
+        feasible (np array): (len(rows),) bool
+
+    """
+    p = point[rows, line_no]
+    d = direction[rows, line_no]
+    r = radius[rows]
+    dot_product = dot(p, d)
+    discriminant = dot_product ** 2 + r ** 2 - dot(p, p)
+    # Max speed circle fully invalidates line line_no
+    feasible = discriminant >= 0
+    sqrt_discriminant = np.sqrt(np.maximum(discriminant, 0.))
+    t_left = -dot_product - sqrt_discriminant
+    t_right = -dot_product + sqrt_discriminant
+
+    if line_no > 0:
+        # Intersect with every earlier line at once
+        p_prev = point[rows, :line_no]
+        d_prev = direction[rows, :line_no]
+        valid_prev = valid[rows, :line_no]
+        denominator = det(d[:, None, :], d_prev)
+        numerator = det(d_prev, p[:, None, :] - p_prev)
+        parallel = np.abs(denominator) <= EPSILON
+        # Lines line_no and i are (almost) parallel, and line_no is fully invalid if numerator < 0
+        feasible &= ~np.any(valid_prev & parallel & (numerator < 0), axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = numerator / denominator
+        # Line i bounds line_no on the right / left
+        t_right = np.minimum(t_right, np.min(np.where(valid_prev & ~parallel & (denominator >= 0), t, np.inf), axis=1))
+        t_left = np.maximum(t_left, np.max(np.where(valid_prev & ~parallel & (denominator < 0), t, -np.inf), axis=1))
+        feasible &= ~(t_left > t_right)
+
+    if direction_opt:
+        # Optimize direction: take right or left extreme
+        t = np.where(dot(opt_velocity[rows], d) > 0, t_right, t_left)
+    else:
+        # Optimize closest point
+        t = np.clip(dot(d, opt_velocity[rows] - p), t_left, t_right)
+    rows = rows[feasible]
+    result[rows] = p[feasible] + t[feasible, None] * d[feasible]
+    return feasible
+
+
+def linear_program2(point, direction, valid, radius, opt_velocity, direction_opt, result=None):
+    """ Closest velocity to opt_velocity (or furthest in its direction, if direction_opt) that satisfies every valid line, within the max speed circle
+
+    Args:
+        point (np array): (batch x num_lines x 2) point on each line
+        direction (np array): (batch x num_lines x 2) unit direction of each line (the allowed side is to its left)
+        valid (np array): (batch x num_lines) which lines each row actually has
+        radius (np array): (batch,) max speed
+        opt_velocity (np array): (batch x 2) preferred velocity (or direction, if direction_opt)
+        direction_opt (bool): whether to optimize direction, rather than closest point
+
+    Returns:
+        result (np array): (batch x 2) optimal velocity (or, for rows that are infeasible, the result before line_fail)
+        line_fail (np array): (batch,) index of the first line that couldn't be satisfied (num_lines if all were)
+
+    """
+    batch_size, num_lines = valid.shape
+    if direction_opt:
+        # Optimize direction. Note that the optimization velocity is of unit length in this case
+        result = opt_velocity * radius[:, None]
+    else:
+        # Optimize closest point and outside circle (project onto it) or inside circle
+        speed_sq = dot(opt_velocity, opt_velocity)
+        outside = speed_sq > radius ** 2
+        result = opt_velocity.copy()
+        result[outside] = opt_velocity[outside] / np.sqrt(speed_sq[outside])[:, None] * radius[outside, None]
+
+    line_fail = np.full(batch_size, num_lines)
+    for i in range(num_lines):
+        # Result does not satisfy constraint i. Compute new optimal result
+        rows = np.flatnonzero(
+            (line_fail == num_lines) & valid[:, i] & (det(direction[:, i], point[:, i] - result) > 0))
+        if len(rows) == 0:
+            continue
+        feasible = linear_program1(point, direction, valid, i, radius, opt_velocity, direction_opt, result, rows)
+        line_fail[rows[~feasible]] = i
+    return result, line_fail
+
+
+def linear_program3(point, direction, valid, begin_line, radius, result):
+    """ Velocity that minimizes the maximum violation of the lines from begin_line on (for rows where linear_program2 was infeasible) """
+    result = result.copy()
+    batch_size, num_lines = valid.shape
+    distance = np.zeros(batch_size)
+    for i in range(num_lines):
+        # Result does not satisfy constraint of line i
+        rows = np.flatnonzero(
+            (i >= begin_line) & valid[:, i] & (det(direction[:, i], point[:, i] - result) > distance))
+        if len(rows) == 0:
+            continue
+
+        if i > 0:
+            # Project every earlier line onto line i
+            p_i = point[rows, i][:, None, :]
+            d_i = direction[rows, i][:, None, :]
+            p_j = point[rows, :i]
+            d_j = direction[rows, :i]
+            proj_valid = valid[rows, :i].copy()
+            determinant = det(d_i, d_j)
+            parallel = np.abs(determinant) <= EPSILON
+            # Line i and line j point in the same direction: skip j
+            proj_valid &= ~(parallel & (dot(d_i, d_j) > 0))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                proj_point = np.where(
+                    parallel[..., None],
+                    # Line i and line j point in opposite direction
+                    0.5 * (p_i + p_j),
+                    p_i + (det(d_j, p_i - p_j) / determinant)[..., None] * d_i,
+                )
+                proj_direction = d_j - d_i
+                proj_direction = proj_direction / np.sqrt(dot(proj_direction, proj_direction))[..., None]
+        else:
+            proj_point = np.zeros((len(rows), 0, 2))
+            proj_direction = np.zeros((len(rows), 0, 2))
+            proj_valid = np.zeros((len(rows), 0), dtype=bool)
+
+        d_i = direction[rows, i]
+        proj_result, line_fail = linear_program2(
+            proj_point, proj_direction, proj_valid, radius[rows],
+            np.stack([-d_i[:, 1], d_i[:, 0]], axis=-1), True)
+        # This should in principle not happen (the result is by definition already in the feasible region of this
+        # linear program); if it fails, it is due to small floating point error, and the current result is kept
+        ok = line_fail >= proj_valid.shape[1]
+        result[rows[ok]] = proj_result[ok]
+        distance[rows] = det(d_i, point[rows, i] - result[rows])
+    return result
@@ -1,6 +1,7 @@
 import numpy as np
 from gym_collision_avoidance.envs.sensors.Sensor import Sensor
 from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs.vector_map import VectorMap
 import matplotlib.pyplot as plt
 
 import time
@@ -40,7 +41,9 @@ class LaserScanSensor(Sensor):
 
         self.debug = False
 
+        # Ring buffer of past laserscans: row newest_row is the latest, the rows before it (wrapping around) are older
         self.measurement_history = np.zeros((self.num_to_store, self.num_beams))
+        self.newest_row = 0
         self.num_measurements_made = 0
 
         if self.debug:
@@ -58,47 +61,119 @@ class LaserScanSensor(Sensor):
             measurement_history (np array): (:code:`num_to_store` x :code:`num_beams`) stacked history of laserscans, where each entry is a range in meters of the nearest obstacle at that angle
 
         """
+        ranges = LaserScanSensor.cast_rays([self], [agents[agent_index]], top_down_map, [agent_index])[0]
+        return self.store_measurement(ranges)
 
+    @staticmethod
+    def sense_all(agents, top_down_map, agent_indices=None):
+        """ Batched :meth:`sense` for every agent in the environment that has a LaserScanSensor (all of their beams are traced together)
 
-        # Approx 200x faster than sense_old (0.002sec per call vs. 0.4sec) :)
-        host_agent = agents[agent_index]
+        Args:
+            agents (list): all :class:`~gym_collision_avoidance.envs.agent.Agent` in the environment
+            top_down_map (:class:`~gym_collision_avoidance.envs.Map.Map`): map of the environment (containing static objects and other agents)
+            agent_indices (list): which agents sense (defaults to every agent)
+
+        Returns:
+            measurements (dict): {agent_index: measurement_history} for each of those agents that has a LaserScanSensor (see :meth:`sense`)
+
+        """
+        # Sensors that sample their beams at the same ranges can be traced together
+        groups = {}
+        if agent_indices is None:
+            agent_indices = range(len(agents))
+        for i in agent_indices:
+            for sensor in agents[i].sensors:
+                if isinstance(sensor, LaserScanSensor):
+                    key = (sensor.ranges.tobytes(), sensor.max_range)
+                    groups.setdefault(key, []).append((i, sensor))
+                    break
 
-        angles = self.angles + host_agent.heading_global_frame
-        ranges = self.ranges
-        angles_ranges_mesh = np.meshgrid(angles, ranges)
-        angles_ranges = np.dstack([angles_ranges_mesh[0], angles_ranges_mesh[1]])
-        beam_coords = np.tile(host_agent.pos_global_frame, (len(angles), len(ranges), 1)).astype(np.float64)
-        beam_coords[:,:,0] += (angles_ranges[:,:,1]*np.cos(angles_ranges[:,:,0])).T
-        beam_coords[:,:,1] += (angles_ranges[:,:,1]*np.sin(angles_ranges[:,:,0])).T
+        measurements = {}
+        for group in groups.values():
+            all_ranges = LaserScanSensor.cast_rays(
+                [sensor for _, sensor in group], [agents[i] for i, _ in group], top_down_map, [i for i, _ in group])
+            for (i, sensor), ranges in zip(group, all_ranges):
+                measurements[i] = sensor.store_measurement(ranges)
+        return measurements
 
-        iis, jjs, in_maps = top_down_map.world_coordinates_to_map_indices_vec(beam_coords)
+    @staticmethod
+    def cast_rays(sensors, host_agents, top_down_map, host_indices):
+        """ Trace every beam of each sensor (all sampled at the same ranges) from its host agent's center at once
 
-        ego_agent_mask = top_down_map.get_agent_mask(host_agent.pos_global_frame, host_agent.radius)
-        lidar_hits = np.logical_and.reduce((top_down_map.map[iis, jjs], np.invert(ego_agent_mask[iis, jjs]), in_maps))
-        lidar_hits_cumsum = np.cumsum(lidar_hits, axis=1)
-        first_hits = np.where(lidar_hits_cumsum == 1)
+        Sphere tracing: rather than checking every range sample, each beam jumps past all the samples closer than
+        top_down_map's clearance at its current sample (none of those can be in an occupied cell).
+        A beam hits the first sample in an occupied cell that its own host agent doesn't cover.
+        With a :class:`~gym_collision_avoidance.envs.vector_map.VectorMap`, beams are intersected with its obstacles and
+        the other agents' circles exactly instead (so ranges aren't rounded to the range samples).
 
-        ranges = self.max_range*np.ones_like(self.angles)
-        ranges[first_hits[0]] = self.ranges[first_hits[1]]
+        Args:
+            sensors (list): of :class:`LaserScanSensor` with identical :code:`ranges` and :code:`max_range`
+            host_agents (list): the :class:`~gym_collision_avoidance.envs.agent.Agent` carrying each sensor
+            top_down_map (:class:`~gym_collision_avoidance.envs.Map.Map`): map of the environment (containing static objects and other agents)
+            host_indices (list): index of each host agent in the agents last added to top_down_map
+
+        Returns:
+            ranges (list): for each sensor, (num_beams,) range [m] of the nearest obstacle along each beam (max_range if none)
+
+        """
+        sample_ranges = sensors[0].ranges
+        max_range = sensors[0].max_range
+        host_pos = np.array([agent.pos_global_frame for agent in host_agents])
+        num_beams = [sensor.num_beams for sensor in sensors]
+
+        # One row per (sensor, beam)
+        owners = np.repeat(np.arange(len(sensors)), num_beams)
+        angles = np.concatenate([sensor.angles + agent.heading_global_frame for sensor, agent in zip(sensors, host_agents)])
+        cos_angles = np.cos(angles)
+        sin_angles = np.sin(angles)
+
+        if isinstance(top_down_map, VectorMap):
+            ranges = top_down_map.cast_rays(host_pos[owners], np.stack([cos_angles, sin_angles], axis=-1), max_range,
+                                            np.asarray(host_indices)[owners])
+            return np.split(ranges, np.cumsum(num_beams)[:-1])
+
+        # Each host agent's own cells don't count as hits
+        ego_gx, ego_gy, ego_in_map = top_down_map.world_coordinates_to_map_indices_arr(host_pos)
+        ego_cell_radius_sq = (np.array([agent.radius for agent in host_agents])/top_down_map.grid_cell_size)**2
+        # Only agents within max_range of a host can get in the way of its beams
+        nearby_agents = top_down_map.agents_within(host_pos, max_range)
+
+        ranges = np.full(len(angles), float(max_range))
+        beams = np.arange(len(angles))
+        samples = np.zeros(len(angles), dtype=int)
+        while len(beams) > 0:
+            owner = owners[beams]
+            r = sample_ranges[samples]
+            beam_coords = np.empty((len(beams), 2))
+            beam_coords[:,0] = host_pos[owner,0] + r*cos_angles[beams]
+            beam_coords[:,1] = host_pos[owner,1] + r*sin_angles[beams]
+            iis, jjs, _ = top_down_map.world_coordinates_to_map_indices_arr(beam_coords)
+            lidar_hits = top_down_map.occupied(iis, jjs)
+            lidar_hits &= ~(ego_in_map[owner] & ((jjs-ego_gy[owner])**2 + (iis-ego_gx[owner])**2 < ego_cell_radius_sq[owner]))
+            ranges[beams[lidar_hits]] = r[lidar_hits]
+
+            # (with a little margin for round-off in the sample coordinates)
+            clearance = top_down_map.clearance_lower_bound(beam_coords, nearby_agents[owner]) - 1e-6
+            samples = np.maximum(samples + 1, np.searchsorted(sample_ranges, r + clearance))
+            keep = ~lidar_hits & (samples < len(sample_ranges))
+            beams = beams[keep]
+            samples = samples[keep]
+        return np.split(ranges, np.cumsum(num_beams)[:-1])
+
+    def store_measurement(self, ranges):
+        """ Add a laserscan to the history (the first one fills the whole history)
 
+        Returns:
+            measurement_history (np array): (:code:`num_to_store` x :code:`num_beams`) copy of the history, newest first
+
+        """
         if self.num_measurements_made == 0:
             self.measurement_history[:,:] = ranges
         else:
-            self.measurement_history = np.roll(self.measurement_history, 1, axis=0)
-            self.measurement_history[0,:] = ranges
-
+            self.newest_row = (self.newest_row + 1) % self.num_to_store
+            self.measurement_history[self.newest_row,:] = ranges
         self.num_measurements_made += 1
-
-        if self.debug:
-            in_map_inds = np.where(in_maps)
-            iis_in_map = iis[in_map_inds]
-            jjs_in_map = jjs[in_map_inds]
-            lidar_map = top_down_map.map.copy()
-            lidar_map[iis_in_map, jjs_in_map] = 1
-            plt.figure('lidar')
-            plt.imshow(lidar_map)
-            plt.pause(0.01)
-        return self.measurement_history.copy()
+        return self.measurement_history[(self.newest_row - np.arange(self.num_to_store)) % self.num_to_store]
 
     def sense_old(self, agents, agent_index, top_down_map):
         host_agent = agents[agent_index]
@@ -1,15 +1,19 @@
 import numpy as np
 from gym_collision_avoidance.envs.sensors.Sensor import Sensor
+from gym_collision_avoidance.envs import Config
 
 import matplotlib.pyplot as plt
 
 class OccupancyGridSensor(Sensor):
     """ OccupancyGrid based on map of the environment (containing static objects and other agents)
 
-    Currently the grid parameters are mostly hard-coded...
+    Each window is cut out of the map (padded with free space, so windows hanging off the map's edge need no special cases),
+    and each output cell is occupied if any of the map's cells in its block is occupied.
 
     :param x_width: (float or int) meters of x dimension in returned gridmap (-x_width/2, +x_width/2) from agent's center
-    :param x_width: (float or int) meters of y dimension in returned gridmap (-y_width/2, +y_width/2) from agent's center
+    :param y_width: (float or int) meters of y dimension in returned gridmap (-y_width/2, +y_width/2) from agent's center
+    :param grid_cell_size: (float) meters per cell of the returned gridmap (a whole multiple of the map's grid_cell_size)
+    :param ego_frame: (bool) whether to rotate the gridmap so that columns point along the agent's heading (else columns point along global +x)
 
     """
     def __init__(self):
@@ -17,9 +21,11 @@ class OccupancyGridSensor(Sensor):
             print("OccupancyGridSensor won't work without static map enabled (Config.USE_STATIC_MAP)")
             assert(0)
         Sensor.__init__(self)
-        self.x_width = 5
-        self.y_width = 5
-        self.grid_cell_size = 0.01 # currently ignored
+        self.name = 'occupancy_grid'
+        self.x_width = Config.OCCUPANCY_GRID_WIDTH
+        self.y_width = Config.OCCUPANCY_GRID_WIDTH
+        self.grid_cell_size = Config.OCCUPANCY_GRID_CELL_SIZE
+        self.ego_frame = Config.OCCUPANCY_GRID_EGO_FRAME
 
     def sense(self, agents, agent_index, top_down_map):
         """ Use the full top_down_map to compute a smaller occupancy grid centered around agents[agent_index]'s center.
@@ -27,65 +33,96 @@ class OccupancyGridSensor(Sensor):
         Args:
             agents (list): all :class:`~gym_collision_avoidance.envs.agent.Agent` in the environment
             agent_index (int): index of this agent (the one with this sensor) in :code:`agents`
-            top_down_map (2D np array): binary image with 0 if that pixel is free space, 1 if occupied
+            top_down_map (:class:`~gym_collision_avoidance.envs.Map.Map`): map of the environment (containing static objects and other agents)
 
         Returns:
-            resized_og_map (np array): (:code:`self.y_width/top_down_map.grid_cell_size` x :code:`self.x_width/top_down_map.grid_cell_size`) 
+            og_map (np array): (:code:`self.y_width/self.grid_cell_size` x :code:`self.x_width/self.grid_cell_size`)
                 binary 2d array where 0 is free space, 1 is occupied, centered around agent
 
         """
+        return OccupancyGridSensor.gather_grids([self], [agents[agent_index]], top_down_map)[0]
+
+    @staticmethod
+    def sense_all(agents, top_down_map, agent_indices=None):
+        """ Batched :meth:`sense` for every agent in the environment that has an OccupancyGridSensor
+
+        Args:
+            agents (list): all :class:`~gym_collision_avoidance.envs.agent.Agent` in the environment
+            top_down_map (:class:`~gym_collision_avoidance.envs.Map.Map`): map of the environment (containing static objects and other agents)
+            agent_indices (list): which agents sense (defaults to every agent)
+
+        Returns:
+            measurements (dict): {agent_index: og_map} for each of those agents that has an OccupancyGridSensor (see :meth:`sense`)
 
-        # Grab (i,j) coordinates of the upper right and lower left corner of the desired OG map, within the entire map
-        host_agent = agents[agent_index]
-        [map_i_high, map_j_low], _ = top_down_map.world_coordinates_to_map_indices(host_agent.pos_global_frame-np.array([self.x_width/2., self.y_width/2.]))
-        [map_i_low, map_j_high], _ = top_down_map.world_coordinates_to_map_indices(host_agent.pos_global_frame+np.array([self.x_width/2., self.y_width/2.]))
-
-        # Assume areas outside static_map should be filled with zeros
-        og_map = np.zeros((int(self.y_width/top_down_map.grid_cell_size), int(self.x_width/top_down_map.grid_cell_size)), dtype=bool)
-
-        if map_i_low >= top_down_map.map.shape[0] or map_i_high < 0 or map_j_low >= top_down_map.map.shape[1] or map_j_high < 0:
-            # skip rest ==> og_map and top_down_map have no overlap
-            print("*** no overlap btwn og_map and top_down_map ***")
-            print("*** map dims:", map_i_low, map_i_high, map_j_low, map_j_high)
-            return og_map
-
-        # super crappy logic to handle when the OG map partially overlaps with the map 
-        if map_i_low < 0:
-            og_i_low = -map_i_low
-            og_i_high = og_map.shape[0]
-        elif map_i_high >= top_down_map.map.shape[0]:
-            og_i_low = 0
-            og_i_high = og_map.shape[0] - (map_i_high - top_down_map.map.shape[0])
-        else:
-            og_i_low = 0
-            og_i_high = og_map.shape[0]
-
-        if map_j_low < 0:
-            og_j_low = -map_j_low
-            og_j_high = og_map.shape[1]
-        elif map_j_high >= top_down_map.map.shape[1]:
-            og_j_low = 0
-            og_j_high = og_map.shape[1] - (map_j_high - top_down_map.map.shape[1])
-        else:
-            og_j_low = 0
-            og_j_high = og_map.shape[1]
-
-        # Don't grab a map index outside the map's boundaries
-        map_i_low = np.clip(map_i_low, 0, top_down_map.map.shape[0])
-        map_i_high = np.clip(map_i_high, 0, top_down_map.map.shape[0])
-        map_j_low = np.clip(map_j_low, 0, top_down_map.map.shape[1])
-        map_j_high = np.clip(map_j_high, 0, top_down_map.map.shape[1])
-
-        # Fill the correct OG map indices with the section of the map that has been selected
-        og_map[og_i_low:og_i_high, og_j_low:og_j_high] = top_down_map.map[map_i_low:map_i_high, map_j_low:map_j_high]
-        resized_og_map = self.resize(og_map)
-        return resized_og_map
-
-    def resize(self, og_map):
-        """ Currently just copies the gridmap... not sure why this exists.
         """
-        resized_og_map = og_map.copy()
-        return resized_og_map
+        # Sensors with the same window shape can be gathered together
+        groups = {}
+        if agent_indices is None:
+            agent_indices = range(len(agents))
+        for i in agent_indices:
+            for sensor in agents[i].sensors:
+                if isinstance(sensor, OccupancyGridSensor):
+                    key = (sensor.x_width, sensor.y_width, sensor.grid_cell_size, sensor.ego_frame)
+                    groups.setdefault(key, []).append((i, sensor))
+                    break
+
+        measurements = {}
+        for group in groups.values():
+            og_maps = OccupancyGridSensor.gather_grids(
+                [sensor for _, sensor in group], [agents[i] for i, _ in group], top_down_map)
+            for (i, _), og_map in zip(group, og_maps):
+                measurements[i] = og_map
+        return measurements
+
+    @staticmethod
+    def gather_grids(sensors, host_agents, top_down_map):
+        """ Cut the window around each host agent out of top_down_map at once, then downsample it by block reduction
+
+        Without :code:`ego_frame`, the windows come from :meth:`~gym_collision_avoidance.envs.Map.Map.get_windows`
+        (slices of a padded map). With :code:`ego_frame`, the window's cell centers are rotated by each agent's heading
+        (about the same point) and looked up in the map (nearest cell).
+
+        Args:
+            sensors (list): of :class:`OccupancyGridSensor` with identical widths, grid_cell_size and ego_frame
+            host_agents (list): the :class:`~gym_collision_avoidance.envs.agent.Agent` carrying each sensor
+            top_down_map (:class:`~gym_collision_avoidance.envs.Map.Map`): map of the environment (containing static objects and other agents)
+
+        Returns:
+            og_maps (np array): (len(sensors) x :code:`y_width/grid_cell_size` x :code:`x_width/grid_cell_size`) bool
+
+        """
+        sensor = sensors[0]
+        block_size = sensor.grid_cell_size / top_down_map.grid_cell_size
+        if block_size < 1 or abs(block_size - round(block_size)) > 1e-6:
+            raise ValueError("OccupancyGridSensor.grid_cell_size ({}) must be a whole multiple of the map's grid_cell_size ({})".format(
+                sensor.grid_cell_size, top_down_map.grid_cell_size))
+        block_size = int(round(block_size))
+        num_rows = int(round(sensor.y_width / sensor.grid_cell_size))
+        num_cols = int(round(sensor.x_width / sensor.grid_cell_size))
+        # Window size, in map cells
+        window_rows, window_cols = num_rows*block_size, num_cols*block_size
+
+        host_pos = np.array([agent.pos_global_frame for agent in host_agents])
+        gxs, gys, _ = top_down_map.world_coordinates_to_map_indices_arr(host_pos)
+
+        if not sensor.ego_frame:
+            windows = top_down_map.get_windows(gxs - window_rows//2, gys - window_cols//2, window_rows, window_cols)
+        else:
+            # Offsets (in cells) of the window's cell centers from its center, which is the agent's cell's center
+            # (or corner, along an axis with an even number of cells)
+            di = (np.arange(window_rows) - window_rows/2. + 0.5)[np.newaxis, :, np.newaxis]
+            dj = (np.arange(window_cols) - window_cols/2. + 0.5)[np.newaxis, np.newaxis, :]
+            headings = np.array([agent.heading_global_frame for agent in host_agents])
+            cos_headings = np.cos(headings)[:, np.newaxis, np.newaxis]
+            sin_headings = np.sin(headings)[:, np.newaxis, np.newaxis]
+            # Columns point along the heading, rows point to the agent's right (-y in the map's row direction)
+            center_i = (gxs + (window_rows % 2)/2.)[:, np.newaxis, np.newaxis]
+            center_j = (gys + (window_cols % 2)/2.)[:, np.newaxis, np.newaxis]
+            iis = np.floor(center_i + di*cos_headings - dj*sin_headings).astype(int)
+            jjs = np.floor(center_j + dj*cos_headings + di*sin_headings).astype(int)
+            windows = top_down_map.occupied(iis, jjs)
+
+        return windows.reshape(len(sensors), num_rows, block_size, num_cols, block_size).any(axis=(2, 4))
 
 if __name__ == '__main__':
     from gym_collision_avoidance.envs.Map import Map
@@ -99,4 +136,4 @@ if __name__ == '__main__':
     og = OccupancyGridSensor()
     og_map = og.sense(agents, 0, top_down_map)
 
-    print(og_map)
\ No newline at end of file
+    print(og_map)
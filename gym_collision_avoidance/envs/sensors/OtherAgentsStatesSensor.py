@@ -1,7 +1,7 @@
 import numpy as np
 from gym_collision_avoidance.envs.sensors.Sensor import Sensor
 from gym_collision_avoidance.envs import Config
-from gym_collision_avoidance.envs.util import compute_time_to_impact, vec2_l2_norm
+from gym_collision_avoidance.envs.util import compute_time_to_impact, disc_time_to_impact, vec2_l2_norm
 import operator
 
 class OtherAgentsStatesSensor(Sensor):
@@ -16,10 +16,17 @@ class OtherAgentsStatesSensor(Sensor):
         self.name = 'other_agents_states'
         self.max_num_other_agents_observed = max_num_other_agents_observed
         self.agent_sorting_method = agent_sorting_method
+        # Agent indices in the order found on the last call (the "closest" ones first), which the next call starts from
+        self.prev_order = []
 
     def get_clipped_sorted_inds(self, sorting_criteria):
         """ Determine the closest N agents using the desired sorting criteria
 
+        The order barely changes from one timestep to the next, so rather than sorting from scratch, the order found on the
+        last call is repaired: candidates are inserted one by one into a running top-N, in last call's order, so most of them
+        only cost one comparison (against the current N-th closest). If that takes too many moves, it falls back to a full sort.
+        Either way, the result is the same as a (stable) sort of sorting_criteria.
+
         Args:
             sorting_criteria (str): how to sort the list of agents (one of ['closest_last', 'closest_first', 'time_to_impact']). See journal paper.
     
@@ -28,32 +35,225 @@ class OtherAgentsStatesSensor(Sensor):
                 agents sorted by "closeness" ("close" defined by sorting criteria),
 
         """
-
-        # Grab first N agents (where N=Config.MAX_NUM_OTHER_AGENTS_OBSERVED)
+        # (ties go to whichever comes first in sorting_criteria, as in a stable sort)
         if self.agent_sorting_method in ['closest_last', 'closest_first']:
             # where "first" == closest
-            sorted_sorting_criteria = sorted(sorting_criteria, key = lambda x: (x[1], x[2]))
+            keys = {x[0]: (x[1], x[2], rank) for rank, x in enumerate(sorting_criteria)}
         elif self.agent_sorting_method in ['time_to_impact']:
             # where "first" == lowest time-to-impact
-            sorted_sorting_criteria = sorted(sorting_criteria, key = lambda x: (-x[3], -x[1], x[2]))
-        clipped_sorting_criteria = sorted_sorting_criteria[:self.max_num_other_agents_observed]
+            keys = {x[0]: (-x[3], -x[1], x[2], rank) for rank, x in enumerate(sorting_criteria)}
+        else:
+            raise ValueError("Did not supply proper self.agent_sorting_method in Agent.py.")
+
+        # Grab first N agents (where N=Config.MAX_NUM_OTHER_AGENTS_OBSERVED)
+        order = [i for i in self.prev_order if i in keys]
+        if len(order) < len(keys):
+            in_order = set(order)
+            order += [x[0] for x in sorting_criteria if x[0] not in in_order]
+        order = self._repair_top_k(order, keys, self.max_num_other_agents_observed, max_moves=len(order))
+        if order is None:
+            order = sorted(keys, key=keys.get)
+        self.prev_order = order
+        clipped_sorted_inds = order[:self.max_num_other_agents_observed]
 
         # Then sort those N agents by the preferred ordering scheme
+        # (closest_first and time_to_impact already are)
         if self.agent_sorting_method == "closest_last":
             # sort by inverse distance away, then by lateral position
-            sorted_dists = sorted(clipped_sorting_criteria, key = lambda x: (-x[1], x[2]))
-        elif self.agent_sorting_method == "closest_first":
-            # sort by distance away, then by lateral position
-            sorted_dists = sorted(clipped_sorting_criteria, key = lambda x: (x[1], x[2]))
-        elif self.agent_sorting_method == "time_to_impact":
-            # sort by time_to_impact, break ties by distance away, then by lateral position (e.g. in case inf TTC)
-            sorted_dists = sorted(clipped_sorting_criteria, key = lambda x: (-x[3], -x[1], x[2]))
-        else:
-            raise ValueError("Did not supply proper self.agent_sorting_method in Agent.py.")
-
-        clipped_sorted_inds = [x[0] for x in sorted_dists]
+            clipped_sorted_inds = sorted(clipped_sorted_inds, key=lambda i: (-keys[i][0], keys[i][1], keys[i][2]))
         return clipped_sorted_inds
 
+    @staticmethod
+    def _repair_top_k(order, keys, k, max_moves):
+        """ Reorder so the k smallest keys come first (sorted), by insertion into a running top-k
+
+        Args:
+            order (list): every candidate, ideally close to sorted already
+            keys (dict): distinct sort key of each candidate
+            k (int): how many of the smallest to sort
+            max_moves (int): give up after shifting candidates around this many times
+
+        Returns:
+            order (list): the sorted top k followed by the rest (in no particular order), or None if it gave up
+
+        """
+        if k == 0:
+            return order
+        top = []
+        top_keys = []
+        rest = []
+        kth_key = None
+        num_moves = 0
+        for i in order:
+            key = keys[i]
+            if kth_key is not None:
+                if key > kth_key:
+                    rest.append(i)
+                    continue
+                # i bumps the current k-th closest out of the top k
+                rest.append(top.pop())
+                top_keys.pop()
+            slot = len(top)
+            while slot > 0 and key < top_keys[slot - 1]:
+                slot -= 1
+            num_moves += len(top) - slot
+            if num_moves > max_moves:
+                return None
+            top.insert(slot, i)
+            top_keys.insert(slot, key)
+            if len(top) == k:
+                kth_key = top_keys[-1]
+        return top + rest
+
+    @staticmethod
+    def relative_states(pos, vel, radius, ref_prll, ref_orth, host_inds=None):
+        """ Every agent's state relative to every other agent, in the ego frame of the observing agent
+
+        Args:
+            pos (np array): (num_agents x 2) positions in global frame
+            vel (np array): (num_agents x 2) velocities in global frame
+            radius (np array): (num_agents,) radii
+            ref_prll (np array): (num_agents x 2) ego-x-axis of each agent
+            ref_orth (np array): (num_agents x 2) ego-y-axis of each agent
+            host_inds (np array): which agents are observing (one row each), defaults to every agent
+
+        Returns:
+            - **rel_states** (*np array*): (num_hosts x num_agents x 7), where :code:`rel_states[i, j]` is agent j's :code:`[p_parallel_ego_frame, p_orthog_ego_frame, v_parallel_ego_frame, v_orthog_ego_frame, radius, combined_radius, dist_2_other]` as seen by the i-th host
+            - **dist_between_agent_centers** (*np array*): (num_hosts x num_agents) center-to-center distances
+
+        """
+        if host_inds is None:
+            host_inds = np.arange(len(radius))
+        num_hosts, num_agents = len(host_inds), len(radius)
+        rel_pos = pos[np.newaxis, :, :] - pos[host_inds, np.newaxis, :]
+        dist_between_agent_centers = np.sqrt(rel_pos[:, :, 0]**2 + rel_pos[:, :, 1]**2)
+
+        # (num_hosts x 2 x 2), columns are each host's ego-frame axes
+        ego_axes = np.stack([ref_prll[host_inds], ref_orth[host_inds]], axis=2)
+
+        rel_states = np.empty((num_hosts, num_agents, 7))
+        # (matmul, which rounds like the np.dot in sense, so the projections agree to the last bit)
+        rel_states[:, :, 0:2] = np.matmul(rel_pos, ego_axes)
+        rel_states[:, :, 2:4] = np.matmul(vel[np.newaxis, :, :], ego_axes)
+        rel_states[:, :, 4] = radius[np.newaxis, :]
+        rel_states[:, :, 5] = radius[host_inds, np.newaxis] + radius[np.newaxis, :]
+        # (sense uses np.linalg.norm for this one, which also rounds like matmul)
+        norm = np.sqrt(np.matmul(rel_pos[:, :, np.newaxis, :], rel_pos[:, :, :, np.newaxis])[:, :, 0, 0])
+        rel_states[:, :, 6] = norm - radius[host_inds, np.newaxis] - radius[np.newaxis, :]
+        return rel_states, dist_between_agent_centers
+
+    @staticmethod
+    def sense_all(agents, agent_indices=None):
+        """ Batched :meth:`sense` for every agent in the environment that has an OtherAgentsStatesSensor
+
+        Computes the (num_agents x num_agents x 7) relative state tensor once, then picks each agent's
+        closest max_num_other_agents_observed agents (with the same ordering & tie-breaking as :meth:`sense`).
+        Like :meth:`sense`, sets each observing agent's :code:`other_agent_states` and :code:`num_other_agents_observed`.
+
+        Args:
+            agents (list): all :class:`~gym_collision_avoidance.envs.agent.Agent` in the environment
+            agent_indices (list): which agents sense (defaults to every agent), the rest are only observed
+
+        Returns:
+            measurements (dict): {agent_index: other_agents_states} for each of those agents that has an OtherAgentsStatesSensor (see :meth:`sense`)
+
+        """
+        # Agents that use this sensor, grouped by sensor settings (which decide how to sort/clip)
+        groups = {}
+        if agent_indices is None:
+            agent_indices = range(len(agents))
+        host_inds = []
+        for i in agent_indices:
+            for sensor in agents[i].sensors:
+                if isinstance(sensor, OtherAgentsStatesSensor):
+                    key = (sensor.max_num_other_agents_observed, sensor.agent_sorting_method)
+                    # (each group holds rows of the host arrays below)
+                    groups.setdefault(key, []).append(len(host_inds))
+                    host_inds.append(i)
+                    break
+        if len(groups) == 0:
+            return {}
+
+        pos = np.array([agent.pos_global_frame for agent in agents])
+        vel = np.array([agent.vel_global_frame for agent in agents])
+        radius = np.array([agent.radius for agent in agents])
+        ref_prll = np.array([agent.ref_prll for agent in agents])
+        ref_orth = np.array([agent.ref_orth for agent in agents])
+        ids = np.array([agent.id for agent in agents])
+        host_inds = np.array(host_inds)
+        rel_states, dist_between_agent_centers = OtherAgentsStatesSensor.relative_states(pos, vel, radius, ref_prll, ref_orth, host_inds)
+
+        # Which (host, other) pairs can be observed, and the keys to sort them by
+        observable = (ids[host_inds, np.newaxis] != ids[np.newaxis, :]) & ~(dist_between_agent_centers > Config.SENSING_HORIZON)
+        dist_2_other = dist_between_agent_centers - radius[host_inds, np.newaxis] - radius[np.newaxis, :]
+        dist_2_other = np.where(observable, np.round(dist_2_other, 2), np.nan)
+        p_orthog = rel_states[:, :, 1]
+        time_to_impact = None
+
+        measurements = {}
+        for (max_num_other_agents_observed, agent_sorting_method), host_rows in groups.items():
+            host_rows = np.array(host_rows)
+            if agent_sorting_method in ['closest_last', 'closest_first']:
+                sort_keys = [p_orthog[host_rows], dist_2_other[host_rows]]
+            elif agent_sorting_method in ['time_to_impact']:
+                if time_to_impact is None:
+                    time_to_impact = np.where(observable, disc_time_to_impact(
+                        pos[host_inds, np.newaxis] - pos[np.newaxis, :],
+                        vel[host_inds, np.newaxis] - vel[np.newaxis, :],
+                        rel_states[:, :, 5]), np.nan)
+                sort_keys = [p_orthog[host_rows], -dist_2_other[host_rows], -time_to_impact[host_rows]]
+            else:
+                raise ValueError("Did not supply proper self.agent_sorting_method in Agent.py.")
+            clipped_sorted_inds, num_observed = OtherAgentsStatesSensor._clipped_sorted_inds_batch(sort_keys, max_num_other_agents_observed)
+
+            # Then sort those N agents by the preferred ordering scheme
+            if agent_sorting_method == "closest_last":
+                # sort by inverse distance away, then by lateral position
+                hosts = host_rows[:, np.newaxis]
+                order = np.lexsort((np.arange(clipped_sorted_inds.shape[1]) + np.zeros_like(clipped_sorted_inds),
+                                    p_orthog[hosts, clipped_sorted_inds],
+                                    -dist_2_other[hosts, clipped_sorted_inds]), axis=-1)
+                clipped_sorted_inds = np.take_along_axis(clipped_sorted_inds, order, axis=1)
+
+            for row, host_row in enumerate(host_rows):
+                i = host_inds[host_row]
+                other_agents_states = np.zeros((Config.MAX_NUM_OTHER_AGENTS_OBSERVED, 7))
+                other_agents_states[:num_observed[row]] = rel_states[host_row, clipped_sorted_inds[row, :num_observed[row]]]
+                if num_observed[row] > 0:
+                    agents[i].other_agent_states[:] = other_agents_states[0]
+                agents[i].num_other_agents_observed = num_observed[row]
+                measurements[i] = other_agents_states
+        return measurements
+
+    @staticmethod
+    def _clipped_sorted_inds_batch(sort_keys, max_num):
+        """ Row-wise lexicographic top-:code:`max_num` (last key is primary, NaN = not observable, ties go to the lower index)
+
+        Returns:
+            - **clipped_sorted_inds** (*np array*): (num_hosts x min(max_num, num_agents)) column indices, sorted
+            - **num_observed** (*np array*): (num_hosts,) how many leading entries of each row are observable
+
+        """
+        primary = sort_keys[-1]
+        num_hosts, num_agents = primary.shape
+        num_kept = min(max_num, num_agents)
+        if num_kept == 0:
+            return np.zeros((num_hosts, 0), dtype=int), np.zeros(num_hosts, dtype=int)
+
+        # Only the smallest few (incl. ties with the max_num-th smallest) can make the cut, so partition them out first
+        cols = np.broadcast_to(np.arange(num_agents), primary.shape)
+        if num_kept < num_agents:
+            kth_smallest = np.partition(primary, num_kept - 1, axis=1)[:, num_kept - 1:num_kept]
+            num_candidates = max(num_kept, np.max(np.sum(primary <= kth_smallest, axis=1)))
+            if num_candidates < num_agents:
+                cols = np.argpartition(primary, num_candidates - 1, axis=1)[:, :num_candidates]
+
+        keys = [cols] + [np.take_along_axis(key, cols, axis=1) for key in sort_keys]
+        order = np.lexsort(keys, axis=-1)[:, :num_kept]
+        clipped_sorted_inds = np.take_along_axis(cols, order, axis=1)
+        num_observed = np.sum(~np.isnan(np.take_along_axis(primary, clipped_sorted_inds, axis=1)), axis=1)
+        return clipped_sorted_inds, num_observed
+
 
     def sense(self, agents, agent_index, top_down_map=None):
         """ Go through each agent in the environment, and compute its relative position, vel, etc. and put into an array
@@ -74,8 +274,15 @@ class OtherAgentsStatesSensor(Sensor):
         sorted_pairs = sorted(other_agent_dists.items(),
                               key=operator.itemgetter(1))
 
+        candidate_inds = range(len(agents))
+        neighbor_list = host_agent.world_state.neighbor_list
+        if neighbor_list is not None and neighbor_list.num_agents == len(agents) and np.isfinite(Config.SENSING_HORIZON):
+            # Only agents in the neighbor list can be within the sensing horizon
+            candidate_inds = neighbor_list.query(agent_index, Config.SENSING_HORIZON)
+
         sorting_criteria = []
-        for i, other_agent in enumerate(agents):
+        for i in candidate_inds:
+            other_agent = agents[i]
             if other_agent.id == host_agent.id:
                 continue
             # project other elements onto the new reference frame
@@ -0,0 +1,206 @@
+import numpy as np
+
+
+class SpatialHash(object):
+    """ Uniform grid that buckets agents by the cell containing their center, so neighbor queries only look at nearby cells
+
+    Rebuilt from scratch (sort by cell key) each time agents move. Queries return a superset of the agents within
+    the query radius (everyone in the covered cells), so callers still do an exact distance test on the candidates.
+
+    :param cell_size: (float) side length of each grid cell in meters
+
+    """
+    # (ix, iy) cell coords are packed into one int64 key: (ix + offset) * stride + (iy + offset)
+    key_offset = 2**30
+    key_stride = 2**31
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.num_agents = 0
+
+    def rebuild(self, pos, cell_size=None):
+        """ Re-bucket every agent based on its current position.
+
+        Args:
+            pos (np array): (num_agents x 2) agent centers in the global frame
+            cell_size (float): if provided, switch to this cell size before bucketing
+
+        """
+        if cell_size is not None:
+            self.cell_size = cell_size
+        self.num_agents = pos.shape[0]
+        self.cells = np.floor(pos / self.cell_size).astype(np.int64)
+        keys = self._keys(self.cells)
+        self.order = np.argsort(keys, kind='stable')
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(
+            keys[self.order], return_index=True, return_counts=True)
+
+    def query(self, pos, radius):
+        """ Indices of all agents in cells that could contain a point within :code:`radius` of :code:`pos`.
+
+        Args:
+            pos (np array): (2,) query point in the global frame
+            radius (float): query distance in meters
+
+        Returns:
+            inds (np array): sorted agent indices (a superset of the agents within radius of pos)
+
+        """
+        cell = np.floor(np.asarray(pos) / self.cell_size).astype(np.int64)
+        query_cells = cell + self._offsets(radius)
+        _, members = self._gather(np.zeros(len(query_cells), dtype=np.int64), query_cells)
+        return np.sort(members)
+
+    def query_pairs(self, radius):
+        """ Every pair of agents (i, j) with i < j whose cells could be within :code:`radius` of each other.
+
+        Args:
+            radius (float): max center-to-center distance of interest in meters
+
+        Returns:
+            - **i** (*np array*): first index of each candidate pair
+            - **j** (*np array*): second index of each candidate pair (i[k] < j[k])
+
+        """
+        i, j = self.query_neighbors(radius)
+        keep = i < j
+        return i[keep], j[keep]
+
+    def query_neighbors(self, radius):
+        """ Every ordered pair of distinct agents (i, j) whose cells could be within :code:`radius` of each other.
+
+        Args:
+            radius (float): max center-to-center distance of interest in meters
+
+        Returns:
+            - **i** (*np array*): query agent index of each candidate pair
+            - **j** (*np array*): candidate neighbor index of each pair (j != i)
+
+        """
+        offsets = self._offsets(radius)
+        query_cells = (self.cells[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape(-1, 2)
+        query_ids = np.repeat(np.arange(self.num_agents), len(offsets))
+        i, j = self._gather(query_ids, query_cells)
+        keep = i != j
+        return i[keep], j[keep]
+
+    def _offsets(self, radius):
+        # +1 cell of margin, since floor(x/cell) - floor(y/cell) <= ceil(|x-y|/cell) (and round-off)
+        reach = int(np.floor(radius / self.cell_size)) + 1
+        d = np.arange(-reach, reach + 1)
+        return np.stack(np.meshgrid(d, d, indexing='ij'), axis=-1).reshape(-1, 2)
+
+    def _keys(self, cells):
+        return (cells[:, 0] + self.key_offset) * self.key_stride + (cells[:, 1] + self.key_offset)
+
+    def _gather(self, query_ids, query_cells):
+        """ For each (query_id, cell), list every agent in that cell as a (query_id, agent index) pair """
+        if len(self.cell_keys) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        keys = self._keys(query_cells)
+        slots = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = self.cell_keys[slots] == keys
+        counts = np.where(found, self.cell_counts[slots], 0)
+        starts = self.cell_starts[slots]
+
+        # Expand each (query, cell) into one entry per agent in that cell
+        ends = np.cumsum(counts)
+        within_cell = np.arange(ends[-1]) - np.repeat(ends - counts, counts)
+        members = self.order[np.repeat(starts, counts) + within_cell]
+        return np.repeat(query_ids, counts), members
+
+
+class NeighborList(object):
+    """ Verlet list: every pair of agents within :code:`cutoff + skin` of each other, reused across steps
+
+    Agents move at most about :code:`pref_speed * DT` per step, so the pairs change slowly. As long as no agent has moved
+    more than half the skin since the list was built, every pair that is now within :code:`cutoff` is still in the list
+    (each of the two agents moved at most skin/2), and only then is the list rebuilt (through a :class:`SpatialHash`).
+    Like :class:`SpatialHash`, queries return a superset of the agents within the query radius.
+
+    :param skin: (float) extra distance in meters that pairs are kept for beyond :code:`cutoff`
+
+    """
+    def __init__(self, skin):
+        self.skin = skin
+        self.cutoff = None
+        self.num_agents = 0
+        self.num_rebuilds = 0
+        self.spatial_hash = None
+
+    def update(self, pos, cutoff):
+        """ Rebuild the list if agents moved too far since the last rebuild (or if the cutoff changed)
+
+        Args:
+            pos (np array): (num_agents x 2) current agent centers in the global frame
+            cutoff (float): queries up to this radius must be answered from the list
+
+        Returns:
+            rebuilt (bool): whether the list was rebuilt
+
+        """
+        self.pos = pos.copy()
+        if self.cutoff is not None and self.num_agents == pos.shape[0] and cutoff <= self.cutoff:
+            disp = self.pos - self.pos_at_build
+            if np.max(disp[:, 0]**2 + disp[:, 1]**2, initial=0.) <= (0.5 * self.skin)**2:
+                return False
+        self._rebuild(cutoff)
+        return True
+
+    def _rebuild(self, cutoff):
+        self.cutoff = cutoff
+        self.num_agents = self.pos.shape[0]
+        self.num_rebuilds += 1
+        self.pos_at_build = self.pos
+        list_radius = cutoff + self.skin
+        if self.spatial_hash is None:
+            self.spatial_hash = SpatialHash(list_radius)
+        self.spatial_hash.rebuild(self.pos, list_radius)
+        i, j = self.spatial_hash.query_pairs(list_radius)
+        rel_pos = self.pos[i] - self.pos[j]
+        keep = rel_pos[:, 0]**2 + rel_pos[:, 1]**2 <= list_radius**2
+        self.i, self.j = i[keep], j[keep]
+
+        # Each agent's neighbors (both directions of each pair), sorted by index
+        query_ids = np.concatenate([self.i, self.j])
+        neighbor_ids = np.concatenate([self.j, self.i])
+        order = np.lexsort((neighbor_ids, query_ids))
+        self.neighbors = neighbor_ids[order]
+        self.neighbor_starts = np.searchsorted(query_ids[order], np.arange(self.num_agents + 1))
+
+    def query(self, index, radius):
+        """ Indices of all other agents that could be within :code:`radius` of agent :code:`index`
+
+        Args:
+            index (int): query agent
+            radius (float): query distance in meters
+
+        Returns:
+            inds (np array): sorted agent indices (a superset of the agents within radius of agent index, not including it)
+
+        """
+        if radius <= self.cutoff:
+            return self.neighbors[self.neighbor_starts[index]:self.neighbor_starts[index + 1]]
+        # (further than the list reaches: bucket the current positions into a coarser grid instead)
+        spatial_hash = SpatialHash(radius)
+        spatial_hash.rebuild(self.pos)
+        inds = spatial_hash.query(self.pos[index], radius)
+        return inds[inds != index]
+
+    def query_pairs(self, radius):
+        """ Every pair of agents (i, j) with i < j that could be within :code:`radius` of each other.
+
+        Args:
+            radius (float): max center-to-center distance of interest in meters
+
+        Returns:
+            - **i** (*np array*): first index of each candidate pair
+            - **j** (*np array*): second index of each candidate pair (i[k] < j[k])
+
+        """
+        if radius <= self.cutoff:
+            return self.i, self.j
+        spatial_hash = SpatialHash(radius)
+        spatial_hash.rebuild(self.pos)
+        return spatial_hash.query_pairs(radius)
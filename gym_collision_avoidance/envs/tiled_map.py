@@ -0,0 +1,218 @@
+import os
+
+import numpy as np
+import imageio
+import scipy.ndimage
+
+from gym_collision_avoidance.envs.Map import Map, STATIC_MAP_FIELDS, nearest_indices
+
+# Per-cell arrays kept for each resident tile: the static ones (loaded from the tile store) and the agent layer
+TILE_FIELDS = {
+    'static_map': bool,
+    'static_clearance_sq': float,
+    'static_clearance': float,
+    'map': bool,
+    'agent_counts': np.int32,
+}
+
+class TiledMap(Map):
+    """ :class:`~gym_collision_avoidance.envs.Map.Map` of a large world (e.g., a building or campus), split into square tiles
+
+    The preprocessed static map and its clearance fields are stored tile by tile in memory-mapped .npy files in cache_dir.
+    A tile is only copied into memory (and gets its own agent layer) the first time something reads or stamps one of its cells,
+    so memory scales with the area the agents actually visit rather than with the size of the world.
+    Cells are addressed with the same global (gx, gy) indices as in a Map, and every read goes through
+    :meth:`lookup` / :meth:`get_windows`, so collision checks and sensors work unchanged.
+
+    Clearance fields are computed within :code:`halo` cells of each tile, so they are capped at :code:`halo` cells:
+    still exact lower bounds, and wall collision checks are exact for agents with radius up to :code:`halo` cells.
+
+    :param x_width: (float) meters of world covered by the map
+    :param y_width: (float) meters of world covered by the map
+    :param grid_cell_size: (float) meters/grid cell
+    :param map_filename: (str) path of a binary image (black is occupied, white is free), or None for an empty world
+    :param cache_dir: (str) directory where the tile store gets saved the first time map_filename is used (required with a map_filename)
+    :param tile_size: (int) cells along each side of a tile
+    :param halo: (int) cells around each tile that its clearance fields account for
+
+    """
+    def __init__(self, x_width, y_width, grid_cell_size, map_filename=None, cache_dir=None, tile_size=256, halo=64):
+        self.x_width = x_width
+        self.y_width = y_width
+        self.grid_cell_size = grid_cell_size
+        self.dims = (int(self.x_width/self.grid_cell_size),int(self.y_width/self.grid_cell_size))
+        self.origin_coords = np.array([(self.x_width/2.)/self.grid_cell_size, (self.y_width/2.)/self.grid_cell_size])
+        self.tile_size = tile_size
+        self.halo = halo
+        self.num_tiles = (-(-self.dims[0] // tile_size), -(-self.dims[1] // tile_size))
+
+        # There is no dense static_map/map (see self.resident)
+        self.static_map = None
+        self.map = None
+        self.map_static_map = None
+
+        if map_filename is None:
+            self.tile_store = None
+        else:
+            if cache_dir is None:
+                raise ValueError("TiledMap needs a cache_dir to store the tiles of {}".format(map_filename))
+            self.tile_store = self.load_tile_store(map_filename, cache_dir)
+
+        # Resident tiles: tile (ti, tj) is row tile_slots[ti, tj] of each array in self.resident (-1 if not loaded yet)
+        self.tile_slots = np.full(self.num_tiles, -1, dtype=int)
+        self.resident = {field: np.zeros((0, tile_size, tile_size), dtype=dtype) for field, dtype in TILE_FIELDS.items()}
+        self.num_resident_tiles = 0
+
+        self.init_agent_layer()
+
+    def load_tile_store(self, map_filename, cache_dir):
+        """ Memory-map (read-only) the tiles of static_map and its clearance fields, preprocessing map_filename into cache_dir if needed
+
+        Returns:
+            tile_store (dict): {field: (num_tiles[0] x num_tiles[1] x tile_size x tile_size) np.memmap} for each of STATIC_MAP_FIELDS
+
+        """
+        prefix = self.cache_prefix(map_filename, cache_dir, self.tile_size, self.halo)
+        filenames = {field: '{}_{}_tiles.npy'.format(prefix, field) for field in STATIC_MAP_FIELDS}
+        if not all(os.path.isfile(filename) for filename in filenames.values()):
+            # (only readable by this user, as the cached files get memory-mapped as is)
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            self.preprocess_tiles(map_filename, filenames)
+        return {field: np.load(filename, mmap_mode='r') for field, filename in filenames.items()}
+
+    def preprocess_tiles(self, map_filename, filenames):
+        """ Resize/binarize map_filename (like :meth:`~gym_collision_avoidance.envs.Map.Map.load_static_map`) and
+        compute its clearance fields (like :meth:`~gym_collision_avoidance.envs.Map.Map.init_clearance`) one tile at a time,
+        saving them to filenames
+        """
+        image = imageio.imread(map_filename)
+        rows = nearest_indices(image.shape[0], self.dims[0])
+        cols = nearest_indices(image.shape[1], self.dims[1])
+        shape = self.num_tiles + (self.tile_size, self.tile_size)
+        # Write to temp files first so that other processes never memory-map a partial file
+        tmp_filenames = {field: '{}.{}.tmp.npy'.format(filename[:-len('.npy')], os.getpid()) for field, filename in filenames.items()}
+        tiles = {field: np.lib.format.open_memmap(tmp_filenames[field], mode='w+', dtype=TILE_FIELDS[field], shape=shape)
+                 for field in STATIC_MAP_FIELDS}
+
+        halo = self.halo
+        for ti in range(self.num_tiles[0]):
+            for tj in range(self.num_tiles[1]):
+                i_low, i_high = ti*self.tile_size, min((ti+1)*self.tile_size, self.dims[0])
+                j_low, j_high = tj*self.tile_size, min((tj+1)*self.tile_size, self.dims[1])
+                # The tile + halo cells around it (+ 1 more, for the grown map), within the map
+                wi_low, wi_high = max(i_low-halo-1, 0), min(i_high+halo+1, self.dims[0])
+                wj_low, wj_high = max(j_low-halo-1, 0), min(j_high+halo+1, self.dims[1])
+                window = np.invert(image[np.ix_(rows[wi_low:wi_high], cols[wj_low:wj_high])]).astype(bool)
+                grown_window = scipy.ndimage.binary_dilation(window, structure=np.ones((3, 3), dtype=bool))
+                # Crop both to the tile + halo cells
+                hi_low, hi_high = max(i_low-halo, 0) - wi_low, min(i_high+halo, self.dims[0]) - wi_low
+                hj_low, hj_high = max(j_low-halo, 0) - wj_low, min(j_high+halo, self.dims[1]) - wj_low
+                window = window[hi_low:hi_high, hj_low:hj_high]
+                grown_window = grown_window[hi_low:hi_high, hj_low:hj_high]
+                tile = (slice(i_low-wi_low-hi_low, i_high-wi_low-hi_low), slice(j_low-wj_low-hj_low, j_high-wj_low-hj_low))
+
+                # Occupied cells outside the tile + halo are more than halo cells away from every cell of the tile
+                clearance_sq = np.full(window.shape, float(halo**2))
+                if np.any(window):
+                    nearest_i, nearest_j = scipy.ndimage.distance_transform_edt(
+                        np.invert(window), return_distances=False, return_indices=True)
+                    i, j = np.indices(window.shape)
+                    clearance_sq = np.minimum((nearest_i - i)**2 + (nearest_j - j)**2, clearance_sq)
+                clearance = np.full(window.shape, float(halo))
+                if np.any(grown_window):
+                    clearance = np.minimum(scipy.ndimage.distance_transform_edt(np.invert(grown_window)), clearance)
+
+                tiles['static_map'][ti, tj, :i_high-i_low, :j_high-j_low] = window[tile]
+                tiles['static_clearance_sq'][ti, tj, :i_high-i_low, :j_high-j_low] = clearance_sq[tile]
+                tiles['static_clearance'][ti, tj, :i_high-i_low, :j_high-j_low] = clearance[tile] * self.grid_cell_size
+
+        for field in STATIC_MAP_FIELDS:
+            tiles[field].flush()
+            del tiles[field]
+            os.replace(tmp_filenames[field], filenames[field])
+
+    def load_tiles(self, tis, tjs):
+        """ Make tiles (tis[k], tjs[k]) resident (copy them out of the tile store, with no agents on them), if they aren't yet
+        """
+        for ti, tj in set(zip(np.ravel(tis).tolist(), np.ravel(tjs).tolist())):
+            if self.tile_slots[ti, tj] >= 0:
+                continue
+            slot = self.num_resident_tiles
+            if slot == len(self.resident['map']):
+                # Out of room: double the capacity
+                for field, resident in self.resident.items():
+                    self.resident[field] = np.concatenate([resident, np.zeros_like(resident, shape=(max(slot, 1),)+resident.shape[1:])])
+            if self.tile_store is None:
+                self.resident['static_map'][slot] = False
+                self.resident['static_clearance_sq'][slot] = self.halo**2
+                self.resident['static_clearance'][slot] = self.halo * self.grid_cell_size
+            else:
+                for field in STATIC_MAP_FIELDS:
+                    self.resident[field][slot] = self.tile_store[field][ti, tj]
+            self.resident['agent_counts'][slot] = 0
+            self.resident['map'][slot] = self.resident['static_map'][slot]
+            self.tile_slots[ti, tj] = slot
+            self.num_resident_tiles += 1
+
+    def lookup(self, field, gxs, gys):
+        """ Gather a per-cell array (:code:`'map'`, :code:`'static_clearance_sq'` or :code:`'static_clearance'`) at cells (gxs, gys),
+        loading any tiles they fall in that aren't resident yet (see :meth:`~gym_collision_avoidance.envs.Map.Map.lookup`)
+        """
+        tis, tjs = gxs // self.tile_size, gys // self.tile_size
+        slots = self.tile_slots[tis, tjs]
+        if np.any(slots < 0):
+            tis, tjs = np.broadcast_arrays(tis, tjs)
+            self.load_tiles(tis[slots < 0], tjs[slots < 0])
+            slots = self.tile_slots[tis, tjs]
+        return self.resident[field][slots, gxs % self.tile_size, gys % self.tile_size]
+
+    def get_windows(self, i_low, j_low, num_rows, num_cols):
+        """ Cut a (num_rows x num_cols) window out of the map at each upper-left cell (i_low, j_low) (free space off the map)
+
+        (see :meth:`~gym_collision_avoidance.envs.Map.Map.get_windows`)
+        """
+        iis = i_low[:, np.newaxis, np.newaxis] + np.arange(num_rows)[np.newaxis, :, np.newaxis]
+        jjs = j_low[:, np.newaxis, np.newaxis] + np.arange(num_cols)[np.newaxis, np.newaxis, :]
+        return self.occupied(iis, jjs)
+
+    def in_static_collision(self, pos, radius):
+        """ Whether each disc overlaps an occupied cell of the static map (see :meth:`~gym_collision_avoidance.envs.Map.Map.in_static_collision`)
+        """
+        if np.any(np.asarray(radius) > self.halo * self.grid_cell_size):
+            raise ValueError("TiledMap wall checks are only exact for radii up to halo ({} cells)".format(self.halo))
+        return Map.in_static_collision(self, pos, radius)
+
+    def _clear_agents(self):
+        # Resident tiles go back to their static map, with no agents counted anywhere
+        self.resident['agent_counts'][:self.num_resident_tiles] = 0
+        self.resident['map'][:self.num_resident_tiles] = self.resident['static_map'][:self.num_resident_tiles]
+
+    def _refresh_map(self, box):
+        for slot, tile_box, _ in self._tile_pieces(box):
+            self.resident['map'][slot][tile_box] = self.resident['static_map'][slot][tile_box] | (self.resident['agent_counts'][slot][tile_box] > 0)
+
+    def _stamp_agent(self, gx, gy, radius, count):
+        stencil, box, stencil_box = self._get_stencil(gx, gy, radius)
+        stencil = stencil[stencil_box]
+        for slot, tile_box, box_part in self._tile_pieces(box):
+            self.resident['agent_counts'][slot][tile_box] += count*stencil[box_part]
+        return box
+
+    def _tile_pieces(self, box):
+        """ Split box (slices of global cells) along tile boundaries, making those tiles resident
+
+        Yields:
+            slot (int): the tile's row in self.resident
+            tile_box (tuple): slices of the piece within the tile
+            box_part (tuple): slices of the piece within box
+        """
+        rows, cols = box
+        for ti in range(rows.start // self.tile_size, (rows.stop-1) // self.tile_size + 1):
+            for tj in range(cols.start // self.tile_size, (cols.stop-1) // self.tile_size + 1):
+                self.load_tiles([ti], [tj])
+                i_low, i_high = max(rows.start, ti*self.tile_size), min(rows.stop, (ti+1)*self.tile_size)
+                j_low, j_high = max(cols.start, tj*self.tile_size), min(cols.stop, (tj+1)*self.tile_size)
+                tile_box = (slice(i_low - ti*self.tile_size, i_high - ti*self.tile_size),
+                            slice(j_low - tj*self.tile_size, j_high - tj*self.tile_size))
+                box_part = (slice(i_low - rows.start, i_high - rows.start), slice(j_low - cols.start, j_high - cols.start))
+                yield self.tile_slots[ti, tj], tile_box, box_part
@@ -20,67 +20,42 @@ def l2norm(x, y):
 def l2normsq(x, y):
     return (x[0]-y[0])**2 + (x[1]-y[1])**2
 
+def pairwise_dists(pos, radius):
+    # pos: (n,2) disc centers, radius: (n,) disc radii
+    # returns (n,n) center-to-center distances and (n,n) sums of radii
+    rel = pos[:, np.newaxis, :] - pos[np.newaxis, :, :]
+    dists = np.sqrt(rel[:, :, 0]**2 + rel[:, :, 1]**2)
+    combined_radii = radius[:, np.newaxis] + radius[np.newaxis, :]
+    return dists, combined_radii
+
+def disc_time_to_impact(rel_pos, rel_vel, combined_radius):
+    # Time until two discs touch if both keep their current velocity, for any number of pairs at once
+    # rel_pos: (...,2) host pos - other pos, rel_vel: (...,2) host vel - other vel, combined_radius: (...) sum of radii
+    # returns (...) first t >= 0 where |rel_pos + t*rel_vel| = combined_radius
+    # (0 if the discs already overlap, inf if they never touch, e.g., moving apart, passing by or not moving relative to each other)
+    a = rel_vel[..., 0]**2 + rel_vel[..., 1]**2
+    b = rel_pos[..., 0]*rel_vel[..., 0] + rel_pos[..., 1]*rel_vel[..., 1]
+    c = rel_pos[..., 0]**2 + rel_pos[..., 1]**2 - combined_radius**2
+    discriminant = b**2 - a*c
+    # Only discs that are approaching each other (b < 0) can start touching
+    approaching = (b < 0) & (discriminant >= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # smaller root of a*t**2 + 2*b*t + c = 0, written to avoid cancellation
+        t = np.where(approaching, c / (-b + np.sqrt(np.where(approaching, discriminant, 0.))), np.inf)
+    return np.where(c <= 0, 0., t)
+
+def swept_disc_time_of_impact(rel_pos, rel_disp, combined_radius):
+    # Discs moving in straight lines over one step: at fraction s of the step, their center offset is rel_pos + s*rel_disp
+    # rel_pos: (...,2) center offset at the start of the step, rel_disp: (...,2) change of that offset over the step
+    # returns (...) first s in [0,1] where the discs touch (0 if already overlapping, inf if they never touch in the step)
+    s = disc_time_to_impact(rel_pos, rel_disp, combined_radius)
+    return np.where(s <= 1, s, np.inf)
+
 def compute_time_to_impact(host_pos, other_pos, host_vel, other_vel, combined_radius):
-    # http://www.ambrsoft.com/TrigoCalc/Circles2/CirclePoint/CirclePointDistance.htm
-    v_rel = host_vel - other_vel
-    coll_cone_vec1, coll_cone_vec2 = tangent_vecs_from_external_pt(host_pos[0],
-                                                                        host_pos[1],
-                                                                        other_pos[0],
-                                                                        other_pos[1],
-                                                                        combined_radius)
-
-    if coll_cone_vec1 is None:
-        # collision already occurred ==> collision cone isn't meaningful anymore
-        return 0.0
-    else: 
-        # check if v_rel btwn coll_cone_vecs
-        # (B btwn A, C): https://stackoverflow.com/questions/13640931/how-to-determine-if-a-vector-is-between-two-other-vectors)
-
-        if (np.cross(coll_cone_vec1, v_rel) * np.cross(coll_cone_vec1, coll_cone_vec2) >= 0 and 
-            np.cross(coll_cone_vec2, v_rel) * np.cross(coll_cone_vec2, coll_cone_vec1) >= 0):
-            # quadratic eqn for soln to line from host agent pos along v_rel vector to collision circle
-            # circle: (x-a)**2 + (y-b)**2 = r**2
-            # line: y = v1/v0 *(x-px) + py
-            # solve for x: (x-a)**2 + ((v1/v0)*(x-px)+py-a)**2 = r**2
-            v0, v1 = v_rel
-            if abs(v0) < 1e-5 and abs(v1) < 1e-5:
-                # agents aren't moving toward each other ==> inf TTC
-                return np.inf
-
-            px, py = host_pos
-            a, b = other_pos
-            r = combined_radius
-            if abs(v0) < 1e-5: # vertical v_rel (solve for y, x known)
-                print("[warning] v0=0, and not yet handled")
-                x1 = x2 = px
-                A = 1
-                B = -2*b
-                C = b**2+(px-a)**2-r**2
-                y1 = (-B + np.sqrt(B**2 - 4*A*C)) / (2*A)
-                y2 = (-B - np.sqrt(B**2 - 4*A*C)) / (2*A)
-            else: # non-vertical v_rel (solve for x)
-                A = 1+(v1/v0)**2
-                B = -2*a + 2*(v1/v0)*(py-b-(v1/v0)*px)
-                C = a**2 - r**2 + ((v1/v0)*px - (py-b))**2
-
-                det = B**2 - 4*A*C
-                if det == 0:
-                    print("[warning] det == 0, so only one tangent pt")
-                elif det < 0:
-                    print("[warning] det < 0, so no tangent pts...")
-
-                x1 = (-B + np.sqrt(B**2 - 4*A*C)) / (2*A)
-                x2 = (-B - np.sqrt(B**2 - 4*A*C)) / (2*A)
-                y1 = (v1/v0)*(x1-px) + py
-                y2 = (v1/v0)*(x2-px) + py
-
-            d1 = np.linalg.norm([x1-px, y1-py])
-            d2 = np.linalg.norm([x2-px, y2-py])
-            d = min(d1, d2)
-            spd = np.linalg.norm(v_rel)
-            return d / spd 
-        else:
-            return np.inf
+    # Time until host and other touch if both keep their current velocity (0 if already in collision, inf if never)
+    return float(disc_time_to_impact(np.asarray(host_pos) - np.asarray(other_pos),
+                                     np.asarray(host_vel) - np.asarray(other_vel),
+                                     combined_radius))
 
 def tangent_vecs_from_external_pt(xp, yp, a, b, r):
     # http://www.ambrsoft.com/TrigoCalc/Circles2/CirclePoint/CirclePointDistance.htm
@@ -145,6 +120,19 @@ def wrap(angle):
         angle += 2*np.pi
     return angle
 
+# same as wrap, for each element of an array (bit-for-bit the same result)
+def wrap_array(angles):
+    angles = np.array(angles, dtype=np.float64)
+    too_big = angles >= np.pi
+    while np.any(too_big):
+        angles[too_big] -= 2*np.pi
+        too_big = angles >= np.pi
+    too_small = angles < -np.pi
+    while np.any(too_small):
+        angles[too_small] += 2*np.pi
+        too_small = angles < -np.pi
+    return angles
+
 def find_nearest(array,value):
     # array is a 1D np array
     # value is an scalar or 1D np array
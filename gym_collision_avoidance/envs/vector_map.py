@@ -0,0 +1,295 @@
+import numpy as np
+import yaml
+from matplotlib.path import Path
+
+from gym_collision_avoidance.envs.Map import Map
+
+def load_obstacles(obstacles_filename):
+    """ Read line segments and polygons from a yaml file, e.g.::
+
+        x_width: 16 # meters (optional, see Map.read_map_metadata)
+        y_width: 16
+        grid_cell_size: 0.1
+        segments: # walls, as [[x1, y1], [x2, y2]] in meters
+          - [[-8, 3], [8, 3]]
+        polygons: # solid obstacles, as [[x1, y1], [x2, y2], ...] vertices (closed automatically)
+          - [[1, -1], [2, -1], [2, 0], [1, 0]]
+
+    Returns:
+        segments (np array): (num_segments x 2 x 2) every wall segment and polygon edge
+        polygons (list): of (num_vertices x 2) np arrays
+
+    """
+    with open(obstacles_filename, 'r') as f:
+        obstacles = yaml.safe_load(f) or {}
+    polygons = [np.array(polygon, dtype=float).reshape(-1, 2) for polygon in obstacles.get('polygons') or []]
+    segments = [np.array(obstacles.get('segments') or [], dtype=float).reshape(-1, 2, 2)]
+    for polygon in polygons:
+        segments.append(np.stack([polygon, np.roll(polygon, -1, axis=0)], axis=1))
+    return np.concatenate(segments), polygons
+
+def cross(a, b):
+    # z-component of the cross product of (..., 2) arrays
+    return a[...,0]*b[...,1] - a[...,1]*b[...,0]
+
+def ray_segment_distances(origins, directions, segments):
+    """ Distance along each ray (origins[k] + t*directions[k], t >= 0, unit directions) to segments[k] (inf if they don't cross)
+    """
+    edges = segments[:,1] - segments[:,0]
+    denom = cross(directions, edges)
+    rel = segments[:,0] - origins
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = cross(rel, edges) / denom
+        s = cross(rel, directions) / denom
+    # (rays parallel to a segment never hit it, they'd graze its end points first)
+    return np.where((denom != 0) & (t >= 0) & (s >= 0) & (s <= 1), t, np.inf)
+
+def point_segment_distances(points, segments):
+    """ Distance from each points[k] to segments[k]
+    """
+    edges = segments[:,1] - segments[:,0]
+    edge_length_sq = np.sum(edges**2, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.clip(np.sum((points - segments[:,0])*edges, axis=-1) / edge_length_sq, 0, 1)
+    s = np.where(edge_length_sq > 0, s, 0)
+    return np.linalg.norm(segments[:,0] + s[:,np.newaxis]*edges - points, axis=-1)
+
+class SegmentBVH(object):
+    """ Bounding volume hierarchy (binary tree of axis-aligned boxes) over line segments, queried for many rays/discs at once
+
+    Built top-down by splitting each node's segments at the median of their midpoints along the longer axis.
+    Queries walk the tree one level at a time for all (query, node) pairs still alive, so each level is a few
+    vectorized operations, and only the segments in leaves whose boxes a query reaches get tested exactly.
+
+    :param segments: (np array) (num_segments x 2 x 2) line segments [[x1, y1], [x2, y2]]
+    :param leaf_size: (int) max segments per leaf
+
+    """
+    def __init__(self, segments, leaf_size=4):
+        self.leaf_size = leaf_size
+        self.node_min, self.node_max, self.node_left, self.node_right, self.node_start, self.node_count = [], [], [], [], [], []
+        order = np.arange(len(segments))
+        if len(segments) > 0:
+            self._build(segments, order, 0, len(segments))
+        self.segments = segments[order].reshape(-1, 2, 2)
+        self.node_min = np.array(self.node_min).reshape(-1, 2)
+        self.node_max = np.array(self.node_max).reshape(-1, 2)
+        self.node_left = np.array(self.node_left, dtype=int)
+        self.node_right = np.array(self.node_right, dtype=int)
+        self.node_start = np.array(self.node_start, dtype=int)
+        self.node_count = np.array(self.node_count, dtype=int)
+
+    def _build(self, segments, order, start, stop):
+        # Add the node over segments[order[start:stop]] (reordering them so each node's segments are contiguous), return its index
+        node = len(self.node_min)
+        node_segments = segments[order[start:stop]]
+        self.node_min.append(node_segments.min(axis=(0, 1)))
+        self.node_max.append(node_segments.max(axis=(0, 1)))
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        self.node_start.append(start)
+        self.node_count.append(stop - start)
+        if stop - start > self.leaf_size:
+            midpoints = node_segments.mean(axis=1)
+            axis = np.argmax(np.ptp(midpoints, axis=0))
+            order[start:stop] = order[start:stop][np.argsort(midpoints[:, axis], kind='stable')]
+            middle = (start + stop) // 2
+            self.node_left[node] = self._build(segments, order, start, middle)
+            self.node_right[node] = self._build(segments, order, middle, stop)
+            self.node_count[node] = 0
+        return node
+
+    def _leaf_pairs(self, queries, nodes):
+        # Expand (query, leaf node) pairs into (query, segment index) pairs
+        counts = self.node_count[nodes]
+        pair_queries = np.repeat(queries, counts)
+        first = np.repeat(self.node_start[nodes] - np.cumsum(counts) + counts, counts)
+        return pair_queries, first + np.arange(len(pair_queries))
+
+    def intersect_rays(self, origins, directions, max_range):
+        """ Distance to the nearest segment along each ray
+
+        Args:
+            origins (np array): (N x 2) ray start points
+            directions (np array): (N x 2) unit ray directions
+            max_range (float): rays stop here
+
+        Returns:
+            ranges (np array): (N,) distance to the first segment each ray crosses (max_range if none within it)
+
+        """
+        ranges = np.full(len(origins), float(max_range))
+        if len(self.node_min) == 0:
+            return ranges
+        with np.errstate(divide='ignore'):
+            inv_directions = 1. / directions
+        queries = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=int)
+        while len(queries) > 0:
+            # Slab test: does the ray reach the node's box before its nearest hit so far?
+            t_low = (self.node_min[nodes] - origins[queries]) * inv_directions[queries]
+            t_high = (self.node_max[nodes] - origins[queries]) * inv_directions[queries]
+            # (0 * inf is nan for rays along a box face, which the nan-ignoring min/max treat as no constraint)
+            t_enter = np.fmax(np.fmax(np.fmin(t_low[:,0], t_high[:,0]), np.fmin(t_low[:,1], t_high[:,1])), 0)
+            t_exit = np.fmin(np.fmax(t_low[:,0], t_high[:,0]), np.fmax(t_low[:,1], t_high[:,1]))
+            reached = t_enter <= np.minimum(t_exit, ranges[queries])
+            queries, nodes = queries[reached], nodes[reached]
+
+            leaf = self.node_left[nodes] < 0
+            pair_queries, pair_segments = self._leaf_pairs(queries[leaf], nodes[leaf])
+            if len(pair_queries) > 0:
+                np.minimum.at(ranges, pair_queries, ray_segment_distances(
+                    origins[pair_queries], directions[pair_queries], self.segments[pair_segments]))
+            queries, nodes = np.tile(queries[~leaf], 2), np.concatenate([self.node_left[nodes[~leaf]], self.node_right[nodes[~leaf]]])
+        return ranges
+
+    def segments_near(self, centers, radius):
+        """ Candidate (disc, segment) pairs: segments whose leaf's box is within radius of each disc center
+
+        Args:
+            centers (np array): (N x 2) disc centers
+            radius (np array): (N,) disc radii
+
+        Returns:
+            discs (np array): disc index of each pair
+            segments (np array): (num_pairs x 2 x 2) segment of each pair
+
+        """
+        queries = np.arange(len(centers))
+        nodes = np.zeros(len(centers), dtype=int)
+        if len(self.node_min) == 0:
+            return queries[:0], self.segments
+        radius = np.broadcast_to(radius, (len(centers),))
+        all_queries, all_segments = [], []
+        while len(queries) > 0:
+            gap = np.maximum(self.node_min[nodes] - centers[queries], 0) + np.maximum(centers[queries] - self.node_max[nodes], 0)
+            reached = np.sum(gap**2, axis=1) <= radius[queries]**2
+            queries, nodes = queries[reached], nodes[reached]
+            leaf = self.node_left[nodes] < 0
+            pair_queries, pair_segments = self._leaf_pairs(queries[leaf], nodes[leaf])
+            all_queries.append(pair_queries)
+            all_segments.append(pair_segments)
+            queries, nodes = np.tile(queries[~leaf], 2), np.concatenate([self.node_left[nodes[~leaf]], self.node_right[nodes[~leaf]]])
+        return np.concatenate(all_queries), self.segments[np.concatenate(all_segments)]
+
+class VectorMap(Map):
+    """ :class:`~gym_collision_avoidance.envs.Map.Map` whose static obstacles are line segments and polygons (see :func:`load_obstacles`)
+
+    Wall collision checks (:meth:`in_static_collision`) and laserscans (:meth:`cast_rays`) are exact, using a :class:`SegmentBVH`
+    over the obstacles' edges and the agents' circles. The obstacles are also rasterized into static_map, so grid-based
+    sensors (e.g., :class:`~gym_collision_avoidance.envs.sensors.OccupancyGridSensor.OccupancyGridSensor`) work unchanged.
+
+    :param x_width: (float) meters of world covered by the (rasterized) map
+    :param y_width: (float) meters of world covered by the (rasterized) map
+    :param grid_cell_size: (float) meters/grid cell of the rasterized map
+    :param map_filename: (str) path of the obstacles yaml file
+    :param cache_dir: (str) unused (the obstacles are rasterized when loaded)
+
+    """
+    def __init__(self, x_width, y_width, grid_cell_size, map_filename=None, cache_dir=None):
+        Map.__init__(self, x_width, y_width, grid_cell_size)
+        if map_filename is None:
+            self.segments, self.polygons = np.zeros((0, 2, 2)), []
+        else:
+            self.segments, self.polygons = load_obstacles(map_filename)
+        self.bvh = SegmentBVH(self.segments)
+        self.polygon_paths = [Path(polygon) for polygon in self.polygons]
+        self.polygon_bounds = np.array([[polygon.min(axis=0), polygon.max(axis=0)] for polygon in self.polygons]).reshape(-1, 2, 2)
+        # Exact positions/radii of the agents as of the last add_agents_to_map
+        self.agent_positions = np.zeros((0, 2))
+        self.agent_radii = np.zeros((0,))
+
+        self.static_map = self.rasterize()
+        self.init_clearance()
+
+    def rasterize(self):
+        """ Grid cells that some segment passes through (sampled every quarter cell) or whose center is inside a polygon
+
+        Returns:
+            static_map (np array): bool, with the same dims as a Map of the same size
+        """
+        static_map = np.zeros(self.dims, dtype=bool)
+        lengths = np.linalg.norm(self.segments[:,1] - self.segments[:,0], axis=-1)
+        num_samples = np.ceil(lengths / (self.grid_cell_size/4.)).astype(int) + 1
+        s = np.concatenate([np.linspace(0, 1, n) for n in num_samples] + [np.zeros(0)])
+        segment_inds = np.repeat(np.arange(len(self.segments)), num_samples)
+        points = self.segments[segment_inds,0] + s[:,np.newaxis]*(self.segments[segment_inds,1] - self.segments[segment_inds,0])
+        gxs, gys, in_map = self.world_coordinates_to_map_indices_arr(points)
+        static_map[gxs[in_map], gys[in_map]] = True
+
+        gxs, gys = np.indices(self.dims)
+        cell_centers = np.stack([(gys.ravel() + 0.5 - self.origin_coords[1])*self.grid_cell_size,
+                                 (self.origin_coords[0] - gxs.ravel() - 0.5)*self.grid_cell_size], axis=-1)
+        static_map |= self.in_polygon(cell_centers).reshape(self.dims)
+        return static_map
+
+    def in_polygon(self, points):
+        """ Whether each point is inside any of the polygons
+        """
+        inside = np.zeros(len(points), dtype=bool)
+        for path, bounds in zip(self.polygon_paths, self.polygon_bounds):
+            candidates = np.nonzero(np.all((points >= bounds[0]) & (points <= bounds[1]), axis=1))[0]
+            if len(candidates) > 0:
+                inside[candidates] |= path.contains_points(points[candidates])
+        return inside
+
+    def in_static_collision(self, pos, radius):
+        """ Whether each disc overlaps a segment or polygon (exactly, wherever the disc is)
+
+        Args:
+            pos (np array): (N x 2) disc centers in the global frame
+            radius (np array): (N,) disc radii in meters
+
+        Returns:
+            in_collision (np array): (N,) bool
+
+        """
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), (len(pos),))
+        discs, segments = self.bvh.segments_near(pos, radius)
+        touching = point_segment_distances(pos[discs], segments) < radius[discs]
+        in_collision = np.zeros(len(pos), dtype=bool)
+        in_collision[discs[touching]] = True
+        # Discs entirely inside a polygon don't touch any edge
+        in_collision[~in_collision] = self.in_polygon(pos[~in_collision])
+        return in_collision
+
+    def add_agents_to_map(self, agents):
+        """ Keep the agents' exact circles (for :meth:`cast_rays`), then stamp them into the grid like :meth:`~gym_collision_avoidance.envs.Map.Map.add_agents_to_map`
+        """
+        self.agent_positions = np.array([agent.pos_global_frame for agent in agents], dtype=float).reshape(-1, 2)
+        self.agent_radii = np.array([agent.radius for agent in agents], dtype=float)
+        Map.add_agents_to_map(self, agents)
+
+    def cast_rays(self, origins, directions, max_range, host_indices):
+        """ Exact distance along each ray to the nearest segment, polygon edge or agent circle (other than its host's)
+
+        Args:
+            origins (np array): (N x 2) ray start points
+            directions (np array): (N x 2) unit ray directions
+            max_range (float): rays stop here
+            host_indices (np array): (N,) index (in the agents of the last :meth:`add_agents_to_map`) of each ray's host agent
+
+        Returns:
+            ranges (np array): (N,) meters (max_range if nothing within it; 0 for rays starting inside another agent)
+
+        """
+        ranges = self.bvh.intersect_rays(origins, directions, max_range)
+
+        # Each host only needs the agents that could be within max_range of it
+        hosts = np.unique(host_indices)
+        rel = self.agent_positions[np.newaxis, :, :] - self.agent_positions[hosts, np.newaxis, :]
+        near = np.sum(rel**2, axis=-1) < (max_range + self.agent_radii)**2
+        near[np.arange(len(hosts)), hosts] = False
+        host_slots = np.searchsorted(hosts, host_indices)
+        rays, others = np.nonzero(near[host_slots])
+        if len(rays) > 0:
+            offsets = origins[rays] - self.agent_positions[others]
+            b = np.sum(offsets*directions[rays], axis=-1)
+            c = np.sum(offsets**2, axis=-1) - self.agent_radii[others]**2
+            discriminant = b**2 - c
+            with np.errstate(invalid='ignore'):
+                t = -b - np.sqrt(discriminant)
+            t = np.where(c <= 0, 0., np.where((discriminant >= 0) & (t >= 0), t, np.inf))
+            np.minimum.at(ranges, rays, t)
+        return ranges
@@ -0,0 +1,98 @@
+import numpy as np
+
+# Bits of WorldState.status (one uint8 per agent)
+AT_GOAL = 1 << 0
+WAS_AT_GOAL_ALREADY = 1 << 1
+IN_COLLISION = 1 << 2
+WAS_IN_COLLISION_ALREADY = 1 << 3
+RAN_OUT_OF_TIME = 1 << 4
+IS_DONE = 1 << 5
+
+
+class WorldState(object):
+    """ Structure-of-arrays storage for the dynamic state of every :class:`~gym_collision_avoidance.envs.agent.Agent` in the environment
+
+    Row :code:`i` of each array belongs to the agent bound at index :code:`i`. Agents read/write their state through
+    properties that index into these arrays, so the environment can operate on the whole crowd at once
+    (e.g., :code:`world_state.pos_global_frame` is the (num_agents x 2) array of every agent's position).
+
+    :param num_agents: (int) number of rows to allocate
+    :param neighbor_list: (:class:`~gym_collision_avoidance.envs.spatial_hash.NeighborList`) nearby pairs of agents (from :code:`pos_global_frame`), kept up to date by the env for large crowds (None otherwise)
+    :param policy_coordinators: (dict) objects that one type of policy shares across all of its agents in this env (e.g., a single RVO simulator), keyed by their class
+
+    """
+
+    # Every per-agent array (used when copying an agent's state between WorldStates)
+    fields = (
+        'pos_global_frame',
+        'vel_global_frame',
+        'goal_global_frame',
+        'radius',
+        'pref_speed',
+        'heading_global_frame',
+        'speed_global_frame',
+        'delta_heading_global_frame',
+        'turning_dir',
+        'dist_to_goal',
+        'ref_prll',
+        'ref_orth',
+        'heading_ego_frame',
+        'vel_ego_frame',
+        't',
+        'time_remaining_to_reach_goal',
+        'status',
+    )
+
+    def __init__(self, num_agents):
+        self.num_agents = num_agents
+
+        self.pos_global_frame = np.zeros((num_agents, 2))
+        self.vel_global_frame = np.zeros((num_agents, 2))
+        self.goal_global_frame = np.zeros((num_agents, 2))
+        self.radius = np.zeros((num_agents,))
+        self.pref_speed = np.zeros((num_agents,))
+        self.heading_global_frame = np.zeros((num_agents,))
+        self.speed_global_frame = np.zeros((num_agents,))
+        self.delta_heading_global_frame = np.zeros((num_agents,))
+        self.turning_dir = np.zeros((num_agents,))
+        # Ego frame (x-axis ref_prll points from the agent to its goal), refreshed by the Dynamics after every step
+        self.dist_to_goal = np.zeros((num_agents,))
+        self.ref_prll = np.zeros((num_agents, 2))
+        self.ref_orth = np.zeros((num_agents, 2))
+        self.heading_ego_frame = np.zeros((num_agents,))
+        self.vel_ego_frame = np.zeros((num_agents, 2))
+        self.t = np.zeros((num_agents,))
+        self.time_remaining_to_reach_goal = np.zeros((num_agents,))
+        self.status = np.zeros((num_agents,), dtype=np.uint8)
+
+        self.neighbor_list = None
+        self.policy_coordinators = {}
+
+    def bind_agents(self, agents):
+        """ Move each agent's current state into this WorldState (agent :code:`i` -> row :code:`i`) and make the agent a view onto it.
+
+        Args:
+            agents (list): of :class:`~gym_collision_avoidance.envs.agent.Agent` objects (len must equal :code:`num_agents`)
+
+        """
+        assert len(agents) == self.num_agents
+        for i, agent in enumerate(agents):
+            agent.bind_world_state(self, i)
+
+    def copy_row(self, index, other, other_index):
+        """ Overwrite row :code:`index` of this WorldState with row :code:`other_index` of :code:`other`. """
+        for field in self.fields:
+            getattr(self, field)[index] = getattr(other, field)[other_index]
+
+    def flag(self, bits):
+        """ Boolean array, True for each agent that has any of :code:`bits` set in its status. """
+        return (self.status & bits) != 0
+
+    def set_flag(self, bits, mask):
+        """ Set :code:`bits` in the status of every agent where :code:`mask` is True (leave others untouched). """
+        self.status[mask] |= bits
+
+    def assign_flag(self, bits, mask):
+        """ Set :code:`bits` where :code:`mask` is True and clear them where it is False. """
+        self.status &= ~np.uint8(bits)
+        self.status[mask] |= bits
@@ -52,10 +52,45 @@ class MultiagentFlattenDictWrapper(gym.ObservationWrapper):
 
         self.obs_shape = (size,)
 
+    def native_observation_array(self):
+        """The env's own flat observation array, if it already has this
+        wrapper's layout (see Config.USE_FLAT_OBSERVATION_BUFFER), else None.
+
+        This is a zero-copy view of the latest observation: the env overwrites
+        it in place on the next step() (or reset()), so copy it to keep it.
+        observation() returns such a copy.
+        """
+        env = self.env.unwrapped
+        if not getattr(env, "use_flat_observation_buffer", False):
+            return None
+        if list(self.dict_keys) != list(env.observation_slices.keys()):
+            return None
+        if self.max_num_agents > env.observation_array.shape[0]:
+            return None
+        return env.observation_array[: self.max_num_agents].reshape(self.obs_shape)
+
+    def agentObservationArray(self, observation_array, agent):
+        # (..., obs_length) -> this agent's part of the last axis
+        return observation_array
+
+    def keyView(self, observation_array, agent, key):
+        # Zero-copy view of one agent's key (leading axes, e.g. envs, are kept)
+        low, high = self.observation_indices[agent][key]
+        agent_obs = self.agentObservationArray(observation_array, agent)
+        return agent_obs[..., low:high].reshape(
+            agent_obs.shape[:-1]
+            + self.env.observation_space.spaces[agent][key].shape
+        )
+
     def observation(self, observation):
         # Turn multiagent dict obs into a really long 1d array
         # with all agents & states concatenated
         assert isinstance(observation, dict)
+        native_observation_array = self.native_observation_array()
+        if native_observation_array is not None:
+            # Env already wrote every agent's obs in this layout
+            # (copied, since the env overwrites it on the next step)
+            return native_observation_array.copy()
         obs = []
         for agent in range(self.max_num_agents):
             for key in self.dict_keys:
@@ -69,11 +104,7 @@ class MultiagentFlattenDictWrapper(gym.ObservationWrapper):
         for agent in range(self.max_num_agents):
             obs[agent] = {}
             for key in self.dict_keys:
-                obs[agent][key] = observation_array[
-                    self.observation_indices[agent][key][
-                        0
-                    ] : self.observation_indices[agent][key][1]
-                ]
+                obs[agent][key] = self.keyView(observation_array, agent, key)
         return obs
 
     def multiEnvObservationArrayToDict(self, observation_array):
@@ -83,21 +114,15 @@ class MultiagentFlattenDictWrapper(gym.ObservationWrapper):
         dict_obs = np.empty((num_envs, self.max_num_agents), dtype=dict)
         for env in range(num_envs):
             for agent in range(self.max_num_agents):
-                key = "use_ppo"
-                ppo = observation_array[env][
-                    self.observation_indices[agent][key][
-                        0
-                    ] : self.observation_indices[agent][key][1]
-                ]
-                if ppo == False:
-                    continue
+                if "use_ppo" in self.dict_keys:
+                    ppo = self.keyView(observation_array[env], agent, "use_ppo")
+                    if ppo == False:
+                        continue
                 dict_obs[env][agent] = {}
                 for key in self.dict_keys:
-                    dict_obs[env][agent][key] = observation_array[env][
-                        self.observation_indices[agent][key][
-                            0
-                        ] : self.observation_indices[agent][key][1]
-                    ].reshape(self.env.observation_space.spaces[key].shape)
+                    dict_obs[env][agent][key] = self.keyView(
+                        observation_array[env], agent, key
+                    )
         return dict_obs
 
     def singleAgentObservationArrayToDict(self, observation_array, agent):
@@ -108,12 +133,7 @@ class MultiagentFlattenDictWrapper(gym.ObservationWrapper):
         for env in range(observation_array.shape[0]):
             obs.append({})
             for key in self.dict_keys:
-                obs[env][key] = observation_array[
-                    env,
-                    self.observation_indices[agent][key][
-                        0
-                    ] : self.observation_indices[agent][key][1],
-                ].reshape(self.env.observation_space.spaces[key].shape)
+                obs[env][key] = self.keyView(observation_array[env], agent, key)
         return obs
 
     def keyToArrayInds(self, key):
@@ -161,10 +181,19 @@ class MultiagentDictToMultiagentArrayWrapper(MultiagentFlattenDictWrapper):
 
         self.obs_shape = (max_num_agents, size)
 
+    def agentObservationArray(self, observation_array, agent):
+        # (..., max_num_agents, num_states_per_agent) -> this agent's row
+        return observation_array[..., agent, :]
+
     def observation(self, observation):
         # Turn multiagent dict obs into a 2d array
         # with shape (max_num_agents, num_states_per_agent)
         assert isinstance(observation, dict)
+        native_observation_array = self.native_observation_array()
+        if native_observation_array is not None:
+            # Env already wrote every agent's obs in this layout
+            # (copied, since the env overwrites it on the next step)
+            return native_observation_array.copy()
         obs = np.zeros(shape=self.obs_shape)
         for agent in range(self.max_num_agents):
             for key in self.dict_keys:
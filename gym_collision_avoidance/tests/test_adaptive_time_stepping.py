@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs.agent import Agent
+from gym_collision_avoidance.envs.collision_avoidance_env import (
+    CollisionAvoidanceEnv,
+)
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import UnicycleDynamics
+from gym_collision_avoidance.envs.policies.NonCooperativePolicy import NonCooperativePolicy
+from gym_collision_avoidance.envs.sensors.OtherAgentsStatesSensor import OtherAgentsStatesSensor
+
+
+def run_episode(adaptive_time_stepping):
+    adaptive, store_history, reward_time_step = Config.ADAPTIVE_TIME_STEPPING, Config.STORE_HISTORY, Config.REWARD_TIME_STEP
+    # (a time step penalty, so every step earns something)
+    Config.ADAPTIVE_TIME_STEPPING, Config.STORE_HISTORY, Config.REWARD_TIME_STEP = adaptive_time_stepping, True, -0.1
+    try:
+        env = CollisionAvoidanceEnv()
+        env.plot_episodes = False
+        # Two agents on parallel lanes (never within interaction range of each other), and one crossing both of them
+        env.set_agents([
+            Agent(-10.0, 0.0, 10.0, 0.0, 0.5, 1.0, 0.0, NonCooperativePolicy, UnicycleDynamics, [OtherAgentsStatesSensor], 0),
+            Agent(-10.0, 8.0, 10.0, 8.0, 0.5, 1.0, 0.0, NonCooperativePolicy, UnicycleDynamics, [OtherAgentsStatesSensor], 1),
+            Agent(6.0, -10.0, 6.0, 14.0, 0.5, 1.0, np.pi / 2, NonCooperativePolicy, UnicycleDynamics, [OtherAgentsStatesSensor], 2),
+        ])
+        env.reset()
+        num_calls = 0
+        total_rewards = np.zeros(len(env.agents))
+        game_over = False
+        while not game_over:
+            _, rewards, game_over, _, _ = env.step({})
+            total_rewards += rewards
+            num_calls += 1
+        return env, num_calls, total_rewards
+    finally:
+        Config.ADAPTIVE_TIME_STEPPING, Config.STORE_HISTORY, Config.REWARD_TIME_STEP = adaptive, store_history, reward_time_step
+
+
+class TestAdaptiveTimeStepping(unittest.TestCase):
+    def test_matches_nominal_steps(self):
+        nominal_env, nominal_calls, nominal_rewards = run_episode(False)
+        adaptive_env, adaptive_calls, adaptive_rewards = run_episode(True)
+        self.assertLess(adaptive_calls, nominal_calls / 2)
+        self.assertEqual(adaptive_env.episode_step_number, nominal_env.episode_step_number)
+        # Each macro step's reward includes the steps it coasted through
+        np.testing.assert_allclose(adaptive_rewards, nominal_rewards, rtol=1e-9)
+        for nominal_agent, adaptive_agent in zip(nominal_env.agents, adaptive_env.agents):
+            self.assertEqual(adaptive_agent.is_at_goal, nominal_agent.is_at_goal)
+            self.assertEqual(adaptive_agent.in_collision, nominal_agent.in_collision)
+            # Histories are still filled in at every DT
+            self.assertEqual(adaptive_agent.step_num, nominal_agent.step_num)
+            np.testing.assert_allclose(
+                adaptive_agent.global_state_history[:adaptive_agent.step_num],
+                nominal_agent.global_state_history[:nominal_agent.step_num], atol=1e-6)
+            np.testing.assert_allclose(
+                adaptive_agent.ego_state_history[:adaptive_agent.step_num],
+                nominal_agent.ego_state_history[:nominal_agent.step_num], atol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import itertools
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs import test_cases as tc
+from gym_collision_avoidance.envs.agent import Agent
+from gym_collision_avoidance.envs.collision_avoidance_env import (
+    CollisionAvoidanceEnv,
+)
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import UnicycleDynamics
+from gym_collision_avoidance.envs.policies.NonCooperativePolicy import NonCooperativePolicy
+from gym_collision_avoidance.envs.sensors.OtherAgentsStatesSensor import OtherAgentsStatesSensor
+from gym_collision_avoidance.envs.util import l2norm
+
+
+def reference_check_for_collisions(agents):
+    # Original pair-by-pair implementation
+    collision_with_agent = [False for _ in agents]
+    dist_btwn_nearest_agent = [np.inf for _ in agents]
+    for i, j in itertools.combinations(range(len(agents)), 2):
+        dist_btwn = l2norm(agents[i].pos_global_frame, agents[j].pos_global_frame)
+        combined_radius = agents[i].radius + agents[j].radius
+        dist_btwn_nearest_agent[i] = min(dist_btwn_nearest_agent[i], dist_btwn - combined_radius)
+        dist_btwn_nearest_agent[j] = min(dist_btwn_nearest_agent[j], dist_btwn - combined_radius)
+        if dist_btwn <= combined_radius:
+            collision_with_agent[i] = True
+            collision_with_agent[j] = True
+    return collision_with_agent, dist_btwn_nearest_agent
+
+
+class TestCollisions(unittest.TestCase):
+    def make_env(self, num_agents):
+        env = CollisionAvoidanceEnv()
+        env.plot_episodes = False
+        env.set_agents(
+            tc.get_testcase_random(
+                num_agents=num_agents, side_length=30.0, policies="noncoop"
+            )
+        )
+        env.reset()
+        return env
+
+    def test_matches_pairwise_loop(self):
+        np.random.seed(0)
+        for num_agents in [1, 2, 5, 40]:
+            env = self.make_env(num_agents)
+            for _ in range(20):
+                side = np.random.uniform(1, 10)
+                env.world_state.pos_global_frame[:] = np.random.uniform(-side, side, (num_agents, 2))
+                env.world_state.radius[:] = np.random.uniform(0.2, 0.8, num_agents)
+                collision_with_agent, _, _, dist_btwn_nearest_agent = env._check_for_collisions()
+                ref_collision, ref_dist = reference_check_for_collisions(env.agents)
+                self.assertEqual(list(collision_with_agent), ref_collision)
+                self.assertEqual(list(dist_btwn_nearest_agent), ref_dist)
+
+    def test_neighbor_list_matches_pairwise_loop(self):
+        np.random.seed(1)
+        min_num_agents = Config.SPATIAL_HASH_MIN_NUM_AGENTS
+        Config.SPATIAL_HASH_MIN_NUM_AGENTS = 1
+        try:
+            env = self.make_env(60)
+            for _ in range(20):
+                side = np.random.uniform(1, 20)
+                env.world_state.pos_global_frame[:] = np.random.uniform(-side, side, (60, 2))
+                env.world_state.radius[:] = np.random.uniform(0.2, 0.8, 60)
+                collision_with_agent, _, _, dist_btwn_nearest_agent = env._check_for_collisions()
+                self.assertIsNotNone(env.world_state.neighbor_list)
+                ref_collision, ref_dist = reference_check_for_collisions(env.agents)
+                self.assertEqual(list(collision_with_agent), ref_collision)
+                # The list only reports nearest-agent gaps within getting_close_range
+                ref_dist = np.array(ref_dist)
+                close = ref_dist < env.getting_close_range
+                np.testing.assert_array_equal(dist_btwn_nearest_agent[close], ref_dist[close])
+                self.assertTrue(np.all(dist_btwn_nearest_agent[~close] >= env.getting_close_range))
+        finally:
+            Config.SPATIAL_HASH_MIN_NUM_AGENTS = min_num_agents
+
+    def test_neighbor_list_reused_while_agents_move_a_little(self):
+        np.random.seed(2)
+        min_num_agents = Config.SPATIAL_HASH_MIN_NUM_AGENTS
+        Config.SPATIAL_HASH_MIN_NUM_AGENTS = 1
+        try:
+            env = self.make_env(60)
+            env.world_state.pos_global_frame[:] = np.random.uniform(-8, 8, (60, 2))
+            env.world_state.radius[:] = np.random.uniform(0.2, 0.5, 60)
+            vel = np.random.uniform(-1, 1, (60, 2))
+            for _ in range(50):
+                env.world_state.pos_global_frame[:] += 0.1 * vel
+                collision_with_agent, _, _, dist_btwn_nearest_agent = env._check_for_collisions()
+                ref_collision, ref_dist = reference_check_for_collisions(env.agents)
+                self.assertEqual(list(collision_with_agent), ref_collision)
+                ref_dist = np.array(ref_dist)
+                close = ref_dist < env.getting_close_range
+                np.testing.assert_array_equal(dist_btwn_nearest_agent[close], ref_dist[close])
+            # Each agent moves at most ~0.14m per step, so the list lasts a few steps between rebuilds
+            self.assertLess(env.world_state.neighbor_list.num_rebuilds, 20)
+        finally:
+            Config.SPATIAL_HASH_MIN_NUM_AGENTS = min_num_agents
+
+    def test_touching_agents_collide(self):
+        env = self.make_env(2)
+        env.world_state.pos_global_frame[:] = [[0.0, 0.0], [1.0, 0.0]]
+        env.world_state.radius[:] = [0.5, 0.5]
+        collision_with_agent, _, _, dist_btwn_nearest_agent = env._check_for_collisions()
+        self.assertTrue(np.all(collision_with_agent))
+        self.assertTrue(np.all(dist_btwn_nearest_agent == 0.0))
+
+    def test_continuous_collision_detection_catches_tunneling(self):
+        # Two fast agents head straight at each other, and would pass through each other within one (large) step
+        def make_agents():
+            return [
+                Agent(-1.0, 0.0, 10.0, 0.0, 0.2, 2.0, 0.0, NonCooperativePolicy, UnicycleDynamics, [OtherAgentsStatesSensor], 0),
+                Agent(1.0, 0.0, -10.0, 0.0, 0.2, 2.0, np.pi, NonCooperativePolicy, UnicycleDynamics, [OtherAgentsStatesSensor], 1),
+            ]
+
+        continuous_collision_detection = Config.CONTINUOUS_COLLISION_DETECTION
+        try:
+            for enabled in [False, True]:
+                Config.CONTINUOUS_COLLISION_DETECTION = enabled
+                env = CollisionAvoidanceEnv()
+                env.plot_episodes = False
+                env.set_agents(make_agents())
+                env.reset()
+                _, rewards, _, _, info = env.step({}, dt=1.0)
+                if not enabled:
+                    self.assertFalse(any(agent.in_collision for agent in env.agents))
+                    continue
+                # They touch once they're 0.4m apart, 0.4s into the step, and stop there
+                self.assertTrue(all(agent.in_collision for agent in env.agents))
+                np.testing.assert_allclose(list(info["time_of_impact"].values()), [0.4, 0.4])
+                np.testing.assert_allclose(env.agents[0].pos_global_frame, [-0.2, 0.0], atol=1e-12)
+                np.testing.assert_allclose(env.agents[1].pos_global_frame, [0.2, 0.0], atol=1e-12)
+                np.testing.assert_allclose([agent.t for agent in env.agents], [0.4, 0.4])
+                np.testing.assert_array_equal(rewards, env.reward_collision_with_agent)
+        finally:
+            Config.CONTINUOUS_COLLISION_DETECTION = continuous_collision_detection
+
+
+if __name__ == "__main__":
+    unittest.main()
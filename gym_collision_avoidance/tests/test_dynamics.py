@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs.agent import Agent
+from gym_collision_avoidance.envs.dynamics.Dynamics import Dynamics
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import UnicycleDynamics
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamicsMaxTurnRate import UnicycleDynamicsMaxTurnRate
+from gym_collision_avoidance.envs.policies.NonCooperativePolicy import NonCooperativePolicy
+from gym_collision_avoidance.envs.util import wrap
+from gym_collision_avoidance.envs.world_state import WorldState
+
+
+def reference_step(state, action, dt, max_turn_rate=None):
+    # Original one-agent-at-a-time UnicycleDynamics(MaxTurnRate).step
+    selected_speed = action[0]
+    if max_turn_rate is None:
+        selected_heading = wrap(action[1] + state['heading'])
+    else:
+        turning_rate = np.clip(action[1]/dt, -max_turn_rate, max_turn_rate)
+        selected_heading = wrap(turning_rate*dt + state['heading'])
+    state['pos'] = state['pos'] + np.array([selected_speed * np.cos(selected_heading) * dt,
+                                            selected_speed * np.sin(selected_heading) * dt])
+    state['vel'] = np.array([selected_speed * np.cos(selected_heading), selected_speed * np.sin(selected_heading)])
+    state['delta_heading'] = wrap(selected_heading - state['heading'])
+    state['heading'] = selected_heading
+    if max_turn_rate is None:
+        if abs(state['turning_dir']) < 1e-5:
+            state['turning_dir'] = 0.11 * np.sign(selected_heading)
+        elif state['turning_dir'] * selected_heading < 0:
+            state['turning_dir'] = max(-np.pi, min(np.pi, -state['turning_dir'] + selected_heading))
+        else:
+            state['turning_dir'] = np.sign(state['turning_dir']) * max(0.0, abs(state['turning_dir'])-0.1)
+
+
+def reference_ego_frame(state, goal):
+    goal_direction = goal - state['pos']
+    dist_to_goal = np.sqrt(goal_direction[0]**2 + goal_direction[1]**2)
+    ref_prll = goal_direction / dist_to_goal if dist_to_goal > 1e-8 else goal_direction
+    heading_ego_frame = wrap(state['heading'] - np.arctan2(ref_prll[1], ref_prll[0]))
+    speed = np.sqrt(state['vel'][0]**2 + state['vel'][1]**2)
+    return dist_to_goal, ref_prll, heading_ego_frame, speed * np.array([np.cos(heading_ego_frame), np.sin(heading_ego_frame)])
+
+
+class TestDynamics(unittest.TestCase):
+    def make_agents(self, dynamics_model, num_agents):
+        agents = []
+        for i in range(num_agents):
+            start, goal = np.random.uniform(-10, 10, (2, 2))
+            agents.append(Agent(start[0], start[1], goal[0], goal[1], 0.5, 1.0, np.random.uniform(-np.pi, np.pi),
+                                NonCooperativePolicy, dynamics_model, [], i))
+        # The last agent sits on its goal
+        agents[-1].pos_global_frame = agents[-1].goal_global_frame
+        WorldState(num_agents).bind_agents(agents)
+        return agents
+
+    def check_step_batch(self, dynamics_model):
+        np.random.seed(0)
+        dt = 0.1
+        agents = self.make_agents(dynamics_model, 20)
+        world_state = agents[0].world_state
+        indices = list(range(len(agents)))
+        for _ in range(10):
+            # Some headings wrap around more than once
+            actions = np.random.uniform([0., -20.], [1.5, 20.], (len(agents), 2)).astype(np.float32)
+            states = [dict(pos=a.pos_global_frame.copy(), heading=a.heading_global_frame, turning_dir=a.turning_dir)
+                      for a in agents]
+            agents[0].dynamics_model.step_batch(agents, indices, actions, dt)
+            Dynamics.update_ego_frames(world_state, indices)
+            for agent, state, action in zip(agents, states, actions):
+                reference_step(state, action, dt, getattr(agent.dynamics_model, 'max_turn_rate', None))
+                np.testing.assert_array_equal(agent.pos_global_frame, state['pos'])
+                np.testing.assert_array_equal(agent.vel_global_frame, state['vel'])
+                self.assertEqual(agent.heading_global_frame, state['heading'])
+                self.assertEqual(agent.delta_heading_global_frame, state['delta_heading'])
+                self.assertEqual(agent.speed_global_frame, action[0])
+                if dynamics_model is UnicycleDynamics:
+                    self.assertEqual(agent.turning_dir, state['turning_dir'])
+                dist_to_goal, ref_prll, heading_ego_frame, vel_ego_frame = reference_ego_frame(
+                    state, agent.goal_global_frame)
+                self.assertAlmostEqual(agent.dist_to_goal, dist_to_goal, places=12)
+                np.testing.assert_allclose(agent.ref_prll, ref_prll, atol=1e-12)
+                np.testing.assert_allclose(agent.ref_orth, [-ref_prll[1], ref_prll[0]], atol=1e-12)
+                self.assertAlmostEqual(agent.heading_ego_frame, heading_ego_frame, places=12)
+                np.testing.assert_allclose(agent.vel_ego_frame, vel_ego_frame, atol=1e-12)
+
+    def test_unicycle_step_batch(self):
+        self.check_step_batch(UnicycleDynamics)
+
+    def test_unicycle_max_turn_rate_step_batch(self):
+        self.check_step_batch(UnicycleDynamicsMaxTurnRate)
+
+
+if __name__ == "__main__":
+    unittest.main()
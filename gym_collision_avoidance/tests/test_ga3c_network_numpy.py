@@ -0,0 +1,72 @@
+import glob
+import os
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs.policies.GA3C_CADRL import network
+from gym_collision_avoidance.envs.policies.GA3CCADRLPolicy import GA3CCADRLPolicy
+from gym_collision_avoidance.envs.policies.GA3C_CADRL.network_numpy import (
+    NetworkVP_rnn_numpy,
+)
+
+checkpt_dir = os.path.dirname(network.__file__) + "/checkpoints/"
+
+
+def random_obs(num_rows, max_num_other_agents):
+    # [num_other_agents, dist_to_goal, heading_ego_frame, pref_speed, radius, other_agents_states...]
+    obs = np.zeros((num_rows, 5 + 7 * max_num_other_agents))
+    obs[:, 0] = np.random.randint(0, max_num_other_agents + 1, num_rows)
+    obs[:, 1] = np.random.uniform(0.0, 10.0, num_rows)
+    obs[:, 2] = np.random.uniform(-np.pi, np.pi, num_rows)
+    obs[:, 3] = np.random.uniform(0.5, 1.5, num_rows)
+    obs[:, 4] = np.random.uniform(0.2, 0.8, num_rows)
+    for row in range(num_rows):
+        n = int(obs[row, 0])
+        other_agents_states = np.random.uniform(-5.0, 5.0, (n, 7))
+        obs[row, 5 : 5 + 7 * n] = other_agents_states.ravel()
+    return obs
+
+
+class TestGA3CNetworkNumpy(unittest.TestCase):
+    def test_matches_tensorflow(self):
+        np.random.seed(0)
+        checkpt_paths = [path[: -len(".npz")] for path in sorted(glob.glob(checkpt_dir + "*/*.npz"))]
+        self.assertGreater(len(checkpt_paths), 0)
+        for checkpt_path in checkpt_paths:
+            tf_nn = network.NetworkVP_rnn("/cpu:0", "network", None)
+            tf_nn.simple_load(checkpt_path)
+            np_nn = NetworkVP_rnn_numpy("/cpu:0", "network", None)
+            np_nn.simple_load(checkpt_path)
+
+            # A batch whose rows see different numbers of other agents (incl. none and the max),
+            # given as a longer/shorter vector than the network takes, like GA3CCADRLPolicy can
+            obs = random_obs(64, np_nn.max_num_other_agents)
+            for x in [obs, obs[:, :-3], np.hstack([obs, np.ones((64, 5))]), obs[:1]]:
+                p, v = np_nn.predict_p_and_v(x)
+                np.testing.assert_allclose(p, tf_nn.predict_p(x), rtol=1e-4, atol=1e-6)
+                np.testing.assert_allclose(v, np.reshape(tf_nn.predict_v(x), -1), rtol=1e-4, atol=1e-4)
+                np.testing.assert_array_equal(np.argmax(p, axis=1), np.argmax(tf_nn.predict_p(x), axis=1))
+                np.testing.assert_array_equal(np_nn.predict_p(x), p)
+            tf_nn.sess.close()
+
+    def test_batch_key_matches_network(self):
+        numpy_network = Config.GA3C_CADRL_NUMPY_NETWORK
+        policies = []
+        try:
+            for use_numpy_network in [True, True, False]:
+                Config.GA3C_CADRL_NUMPY_NETWORK = use_numpy_network
+                policy = GA3CCADRLPolicy()
+                policy.initialize_network()
+                policies.append(policy)
+        finally:
+            Config.GA3C_CADRL_NUMPY_NETWORK = numpy_network
+        # Same checkpoint, but only policies sharing a network get batched together
+        self.assertIs(policies[0].nn, policies[1].nn)
+        self.assertEqual(policies[0].batch_key(), policies[1].batch_key())
+        self.assertNotEqual(policies[0].batch_key(), policies[2].batch_key())
+
+
+if __name__ == "__main__":
+    unittest.main()
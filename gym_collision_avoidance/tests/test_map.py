@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs.agent import Agent
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import UnicycleDynamics
+from gym_collision_avoidance.envs.Map import Map, STATIC_MAP_FIELDS, read_map_metadata
+from gym_collision_avoidance.envs.policies.NonCooperativePolicy import NonCooperativePolicy
+from gym_collision_avoidance.envs.sensors.LaserScanSensor import LaserScanSensor
+
+world_maps_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'envs', 'world_maps')
+
+
+def reference_in_static_collision(static_map, pos, radius):
+    # Original full-grid disc mask test from CollisionAvoidanceEnv._check_for_collisions
+    [pi, pj], in_map = static_map.world_coordinates_to_map_indices(pos)
+    mask = static_map.get_agent_map_indices([pi, pj], radius)
+    return in_map and np.any(static_map.static_map[mask])
+
+
+def reference_laserscan(sensor, agents, agent_index, top_down_map):
+    # Original LaserScanSensor.sense: check every range sample of every beam (taking each beam's first hit)
+    host_agent = agents[agent_index]
+    angles = sensor.angles + host_agent.heading_global_frame
+    angles_ranges = np.dstack(np.meshgrid(angles, sensor.ranges))
+    beam_coords = np.tile(host_agent.pos_global_frame, (len(angles), len(sensor.ranges), 1)).astype(np.float64)
+    beam_coords[:, :, 0] += (angles_ranges[:, :, 1]*np.cos(angles_ranges[:, :, 0])).T
+    beam_coords[:, :, 1] += (angles_ranges[:, :, 1]*np.sin(angles_ranges[:, :, 0])).T
+    iis, jjs, in_maps = top_down_map.world_coordinates_to_map_indices_vec(beam_coords)
+    ego_agent_mask = top_down_map.get_agent_mask(host_agent.pos_global_frame, host_agent.radius)
+    lidar_hits = np.logical_and.reduce((top_down_map.map[iis, jjs], np.invert(ego_agent_mask[iis, jjs]), in_maps))
+    return np.where(np.any(lidar_hits, axis=1), sensor.ranges[np.argmax(lidar_hits, axis=1)], sensor.max_range)
+
+
+def reference_agents_map(static_map, agents):
+    # Original Map.add_agents_to_map: copy static_map, then draw each agent's full-map disc mask
+    full_map = static_map.static_map.copy()
+    for agent in agents:
+        full_map[static_map.get_agent_mask(agent.pos_global_frame, agent.radius)] = 255
+    return full_map
+
+
+class TestMap(unittest.TestCase):
+    def make_maps(self):
+        random_map = Map(10, 10, 0.1)
+        random_map.static_map = np.random.uniform(size=random_map.static_map.shape) < 0.01
+        random_map.init_clearance()
+        return [Map(50, 50, 0.1, os.path.join(world_maps_dir, '001.png')), random_map, Map(10, 10, 0.1)]
+
+    def test_clearance_matches_disc_masks(self):
+        np.random.seed(0)
+        for static_map in self.make_maps():
+            static_map.add_agents_to_map([])
+            pos = np.random.uniform(-6, 6, (300, 2))
+            radius = np.random.uniform(0.05, 1.0, 300)
+            in_collision = static_map.in_static_collision(pos, radius)
+            for k in range(300):
+                self.assertEqual(in_collision[k], reference_in_static_collision(static_map, pos[k], radius[k]))
+
+    def test_incremental_agents_map_matches_redraw(self):
+        np.random.seed(2)
+        for top_down_map in self.make_maps():
+            agents = [Agent(0., 0., 0., 0., np.random.uniform(0.05, 0.5), 1.0, 0., NonCooperativePolicy, UnicycleDynamics, [], i)
+                      for i in range(10)]
+            pos = np.random.uniform(-5, 5, (10, 2))
+            for step in range(30):
+                # Some agents stand still, some move a bit and some jump (possibly outside the map or onto each other)
+                pos += np.random.choice([0., 0.05, 3.], (10, 1)) * np.random.uniform(-1, 1, (10, 2))
+                for agent, p in zip(agents, pos):
+                    agent.pos_global_frame = p.copy()
+                if step == 20:
+                    agents[0].radius = 0.8
+                num_agents = 10 if step < 25 else 6
+                top_down_map.add_agents_to_map(agents[:num_agents])
+                np.testing.assert_array_equal(top_down_map.map, reference_agents_map(top_down_map, agents[:num_agents]))
+
+    def test_batched_laserscan_matches_every_sample(self):
+        np.random.seed(1)
+        use_static_map = Config.USE_STATIC_MAP
+        Config.USE_STATIC_MAP = True
+        try:
+            for top_down_map in self.make_maps():
+                agents = []
+                for i in range(8):
+                    x, y = np.random.uniform(-5, 5, 2)
+                    agents.append(Agent(x, y, 0., 0., np.random.uniform(0.2, 0.5), 1.0, np.random.uniform(-np.pi, np.pi),
+                                        NonCooperativePolicy, UnicycleDynamics, [], i))
+                for i, agent in enumerate(agents):
+                    # (the last agent has no laser)
+                    agent.sensors = [LaserScanSensor()] if i < 7 else []
+                history = {i: [] for i in range(7)}
+                for step in range(4):
+                    top_down_map.add_agents_to_map(agents)
+                    # One agent alone must get the same scan as in the batch
+                    single_sensor = LaserScanSensor()
+                    single = single_sensor.sense(agents, 0, top_down_map)
+                    measurements = LaserScanSensor.sense_all(agents, top_down_map)
+                    self.assertEqual(sorted(measurements.keys()), list(range(7)))
+                    np.testing.assert_array_equal(single[0], measurements[0][0])
+                    for i in range(7):
+                        history[i].insert(0, reference_laserscan(agents[i].sensors[0], agents, i, top_down_map))
+                        # Newest scan first, padded with the first scan
+                        expected = (history[i] + [history[i][-1]]*3)[:Config.LASERSCAN_NUM_PAST]
+                        np.testing.assert_array_equal(measurements[i], expected)
+                    for agent in agents:
+                        agent.pos_global_frame = agent.pos_global_frame + np.random.uniform(-0.3, 0.3, 2)
+                        agent.heading_global_frame = agent.heading_global_frame + 0.1
+        finally:
+            Config.USE_STATIC_MAP = use_static_map
+
+    def test_cached_map_matches_image(self):
+        map_filename = os.path.join(world_maps_dir, '001.png')
+        self.assertEqual(read_map_metadata(map_filename), {'x_width': 16, 'y_width': 16, 'grid_cell_size': 0.1})
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # (the first two have the same dims, but their clearances [m] differ)
+            for x_width, y_width, grid_cell_size in [(16, 16, 0.1), (32, 32, 0.2), (50, 50, 0.1), (20, 12, 0.05)]:
+                static_map = Map(x_width, y_width, grid_cell_size, map_filename)
+                # First map preprocesses the image, the second one only memory-maps the result
+                for _ in range(2):
+                    cached_map = Map(x_width, y_width, grid_cell_size, map_filename, cache_dir=cache_dir)
+                    for field in STATIC_MAP_FIELDS:
+                        self.assertIsInstance(getattr(cached_map, field), np.memmap)
+                        np.testing.assert_array_equal(getattr(cached_map, field), getattr(static_map, field))
+                self.assertTrue(np.any(cached_map.static_map))
+            self.assertEqual(len(os.listdir(cache_dir)), 4*len(STATIC_MAP_FIELDS))
+
+            # A cache dir that doesn't exist yet is only made accessible to this user
+            new_cache_dir = os.path.join(cache_dir, 'maps')
+            Map(16, 16, 0.1, map_filename, cache_dir=new_cache_dir)
+            self.assertEqual(os.stat(new_cache_dir).st_mode & 0o777, 0o700)
+
+
+if __name__ == "__main__":
+    unittest.main()
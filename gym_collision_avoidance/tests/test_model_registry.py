@@ -0,0 +1,63 @@
+import gc
+import threading
+import unittest
+
+from gym_collision_avoidance.envs.policies.model_registry import ModelRegistry
+
+
+class Owner(object):
+    pass
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_shared_and_reference_counted(self):
+        registry = ModelRegistry()
+        loaded, closed = [], []
+
+        def load():
+            loaded.append(object())
+            return loaded[-1]
+
+        a = registry.acquire(("policy", "ckpt"), load, close=closed.append)
+        b = registry.acquire(("policy", "ckpt"), load, close=closed.append)
+        c = registry.acquire(("policy", "other_ckpt"), load, close=closed.append)
+        self.assertEqual(len(loaded), 2)
+        self.assertIs(a.model, b.model)
+        self.assertIsNot(a.model, c.model)
+        self.assertEqual(registry.num_references(("policy", "ckpt")), 2)
+
+        a.release()
+        a.release()  # a handle only counts once
+        self.assertEqual(closed, [])
+        b.release()
+        self.assertEqual(closed, [loaded[0]])
+        self.assertNotIn(("policy", "ckpt"), registry)
+        self.assertIn(("policy", "other_ckpt"), registry)
+
+    def test_released_with_owner(self):
+        registry = ModelRegistry()
+        owners = [Owner() for _ in range(3)]
+        for owner in owners:
+            registry.acquire_for(owner, "key", object)
+        self.assertEqual(registry.num_references("key"), 3)
+        del owner, owners
+        gc.collect()
+        self.assertNotIn("key", registry)
+
+    def test_loaded_once_across_threads(self):
+        registry = ModelRegistry()
+        loaded = []
+        handles = []
+
+        def acquire():
+            handles.append(registry.acquire("key", lambda: loaded.append(1) or object()))
+
+        threads = [threading.Thread(target=acquire) for _ in range(8)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(registry.num_references("key"), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
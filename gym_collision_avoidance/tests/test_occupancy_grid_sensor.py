@@ -0,0 +1,84 @@
+import os
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs.agent import Agent
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import UnicycleDynamics
+from gym_collision_avoidance.envs.Map import Map
+from gym_collision_avoidance.envs.policies.NonCooperativePolicy import NonCooperativePolicy
+from gym_collision_avoidance.envs.sensors.OccupancyGridSensor import OccupancyGridSensor
+
+world_maps_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'envs', 'world_maps')
+
+
+def reference_og_map(sensor, agent, top_down_map):
+    # Window of top_down_map.map around the agent's cell (free space off the map), at the map's resolution
+    num_rows = int(round(sensor.y_width/top_down_map.grid_cell_size))
+    num_cols = int(round(sensor.x_width/top_down_map.grid_cell_size))
+    [gx, gy], _ = top_down_map.world_coordinates_to_map_indices(agent.pos_global_frame)
+    og_map = np.zeros((num_rows, num_cols), dtype=bool)
+    for r in range(num_rows):
+        for c in range(num_cols):
+            i, j = gx - num_rows//2 + r, gy - num_cols//2 + c
+            if 0 <= i < top_down_map.map.shape[0] and 0 <= j < top_down_map.map.shape[1]:
+                og_map[r, c] = top_down_map.map[i, j]
+    return og_map
+
+
+class TestOccupancyGridSensor(unittest.TestCase):
+    def setUp(self):
+        self.use_static_map = Config.USE_STATIC_MAP
+        Config.USE_STATIC_MAP = True
+
+    def tearDown(self):
+        Config.USE_STATIC_MAP = self.use_static_map
+
+    def make_agents(self, top_down_map, num_agents):
+        agents = []
+        for i in range(num_agents):
+            # Some agents are near (or past) the map's edge
+            x, y = np.random.uniform(-1.2*top_down_map.x_width/2, 1.2*top_down_map.x_width/2, 2)
+            agent = Agent(x, y, 0., 0., 0.4, 1.0, np.random.uniform(-np.pi, np.pi), NonCooperativePolicy, UnicycleDynamics, [], i)
+            agent.sensors = [OccupancyGridSensor()]
+            agents.append(agent)
+        agents[-1].pos_global_frame = np.array([100., -100.])
+        top_down_map.add_agents_to_map(agents)
+        return agents
+
+    def test_batched_grids_match_windows(self):
+        np.random.seed(0)
+        top_down_map = Map(50, 50, 0.1, os.path.join(world_maps_dir, '001.png'))
+        agents = self.make_agents(top_down_map, 30)
+        for x_width, y_width, grid_cell_size in [(5., 5., 0.1), (4.1, 2.3, 0.1), (6., 3., 0.3)]:
+            for agent in agents:
+                agent.sensors[0].set_args({'x_width': x_width, 'y_width': y_width, 'grid_cell_size': grid_cell_size})
+            measurements = OccupancyGridSensor.sense_all(agents, top_down_map)
+            block_size = int(round(grid_cell_size/top_down_map.grid_cell_size))
+            for i, agent in enumerate(agents):
+                expected = reference_og_map(agent.sensors[0], agent, top_down_map)
+                expected = expected.reshape(expected.shape[0]//block_size, block_size, -1, block_size).any(axis=(1, 3))
+                np.testing.assert_array_equal(measurements[i], expected)
+                np.testing.assert_array_equal(agent.sensors[0].sense(agents, i, top_down_map), expected)
+            self.assertFalse(np.any(measurements[len(agents)-1]))
+
+    def test_ego_frame_rotates_window(self):
+        np.random.seed(1)
+        top_down_map = Map(50, 50, 0.1, os.path.join(world_maps_dir, '001.png'))
+        agents = self.make_agents(top_down_map, 10)
+        for agent in agents:
+            agent.sensors[0].set_args({'x_width': 4., 'y_width': 4., 'grid_cell_size': 0.2})
+        global_frame = OccupancyGridSensor.sense_all(agents, top_down_map)
+        for agent in agents:
+            agent.sensors[0].ego_frame = True
+        for heading, quarter_turns in [(0., 0), (np.pi/2, -1), (np.pi, 2), (-np.pi/2, 1)]:
+            for agent in agents:
+                agent.heading_global_frame = heading
+            ego_frame = OccupancyGridSensor.sense_all(agents, top_down_map)
+            for i in range(len(agents)):
+                np.testing.assert_array_equal(ego_frame[i], np.rot90(global_frame[i], quarter_turns))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs import test_cases as tc
+from gym_collision_avoidance.envs.collision_avoidance_env import (
+    CollisionAvoidanceEnv,
+)
+from gym_collision_avoidance.envs.policies import orca
+
+EPSILON = 1e-5
+
+
+def det(a, b):
+    return a[0] * b[1] - a[1] * b[0]
+
+
+def reference_linear_program1(lines, line_no, radius, opt_velocity, direction_opt, result):
+    # Line-by-line port of RVO2's linearProgram1
+    point, direction = lines[line_no]
+    dot_product = np.dot(point, direction)
+    discriminant = dot_product ** 2 + radius ** 2 - np.dot(point, point)
+    if discriminant < 0:
+        return False, result
+    sqrt_discriminant = np.sqrt(discriminant)
+    t_left = -dot_product - sqrt_discriminant
+    t_right = -dot_product + sqrt_discriminant
+    for i in range(line_no):
+        denominator = det(direction, lines[i][1])
+        numerator = det(lines[i][1], point - lines[i][0])
+        if abs(denominator) <= EPSILON:
+            if numerator < 0:
+                return False, result
+            continue
+        t = numerator / denominator
+        if denominator >= 0:
+            t_right = min(t_right, t)
+        else:
+            t_left = max(t_left, t)
+        if t_left > t_right:
+            return False, result
+    if direction_opt:
+        t = t_right if np.dot(opt_velocity, direction) > 0 else t_left
+    else:
+        t = np.clip(np.dot(direction, opt_velocity - point), t_left, t_right)
+    return True, point + t * direction
+
+
+def reference_linear_program2(lines, radius, opt_velocity, direction_opt):
+    if direction_opt:
+        result = opt_velocity * radius
+    elif np.dot(opt_velocity, opt_velocity) > radius ** 2:
+        result = opt_velocity / np.linalg.norm(opt_velocity) * radius
+    else:
+        result = opt_velocity.copy()
+    for i, (point, direction) in enumerate(lines):
+        if det(direction, point - result) > 0:
+            feasible, result = reference_linear_program1(lines, i, radius, opt_velocity, direction_opt, result)
+            if not feasible:
+                return i, result
+    return len(lines), result
+
+
+def reference_linear_program3(lines, begin_line, radius, result):
+    distance = 0.0
+    for i in range(begin_line, len(lines)):
+        point, direction = lines[i]
+        if det(direction, point - result) > distance:
+            proj_lines = []
+            for j in range(i):
+                determinant = det(direction, lines[j][1])
+                if abs(determinant) <= EPSILON:
+                    if np.dot(direction, lines[j][1]) > 0:
+                        continue
+                    proj_point = 0.5 * (point + lines[j][0])
+                else:
+                    proj_point = point + (det(lines[j][1], point - lines[j][0]) / determinant) * direction
+                proj_direction = lines[j][1] - direction
+                proj_lines.append((proj_point, proj_direction / np.linalg.norm(proj_direction)))
+            line_fail, proj_result = reference_linear_program2(
+                proj_lines, radius, np.array([-direction[1], direction[0]]), True)
+            if line_fail >= len(proj_lines):
+                result = proj_result
+            distance = det(direction, point - result)
+    return result
+
+
+def reference_new_velocity(pos, vel, pref_vel, radius, max_speed, collab_coeff, i,
+                           neighbor_dist, max_neighbors, time_horizon, dt):
+    # Port of RVO2's Agent::computeNewVelocity (no obstacles) for agent i
+    dists = [(np.dot(pos[j] - pos[i], pos[j] - pos[i]), j) for j in range(len(pos)) if j != i]
+    neighbors = [j for dist_sq, j in sorted(dists) if dist_sq < neighbor_dist ** 2][:max_neighbors]
+    lines = []
+    for j in neighbors:
+        rel_pos = pos[j] - pos[i]
+        rel_vel = vel[i] - vel[j]
+        dist_sq = np.dot(rel_pos, rel_pos)
+        combined_radius = radius[i] + radius[j]
+        if dist_sq > combined_radius ** 2:
+            w = rel_vel - rel_pos / time_horizon
+            w_length_sq = np.dot(w, w)
+            dot_product1 = np.dot(w, rel_pos)
+            if dot_product1 < 0 and dot_product1 ** 2 > combined_radius ** 2 * w_length_sq:
+                unit_w = w / np.sqrt(w_length_sq)
+                direction = np.array([unit_w[1], -unit_w[0]])
+                u = (combined_radius / time_horizon - np.sqrt(w_length_sq)) * unit_w
+            else:
+                leg = np.sqrt(dist_sq - combined_radius ** 2)
+                if det(rel_pos, w) > 0:
+                    direction = np.array([
+                        rel_pos[0] * leg - rel_pos[1] * combined_radius,
+                        rel_pos[0] * combined_radius + rel_pos[1] * leg]) / dist_sq
+                else:
+                    direction = -np.array([
+                        rel_pos[0] * leg + rel_pos[1] * combined_radius,
+                        -rel_pos[0] * combined_radius + rel_pos[1] * leg]) / dist_sq
+                u = np.dot(rel_vel, direction) * direction - rel_vel
+        else:
+            w = rel_vel - rel_pos / dt
+            unit_w = w / np.linalg.norm(w)
+            direction = np.array([unit_w[1], -unit_w[0]])
+            u = (combined_radius / dt - np.linalg.norm(w)) * unit_w
+        lines.append((vel[i] + collab_coeff * u, direction))
+
+    line_fail, result = reference_linear_program2(lines, max_speed[i], pref_vel[i], False)
+    if line_fail < len(lines):
+        result = reference_linear_program3(lines, line_fail, max_speed[i], result)
+    return result
+
+
+class TestORCA(unittest.TestCase):
+    def test_matches_reference(self):
+        np.random.seed(0)
+        for num_agents in [1, 2, 5, 12, 30]:
+            for spread in [1.5, 4.0, 10.0]:
+                # Small spreads pack agents densely enough that some overlap / have infeasible programs
+                pos = np.random.uniform(-spread, spread, (num_agents, 2))
+                vel = np.random.uniform(-1, 1, (num_agents, 2))
+                pref_vel = np.random.uniform(-1.5, 1.5, (num_agents, 2))
+                radius = np.random.uniform(0.2, 0.6, num_agents)
+                max_speed = np.random.uniform(0.5, 1.5, num_agents)
+                agent_indices = np.random.permutation(num_agents)[: max(1, num_agents // 2)]
+                collab_coeff = np.random.choice([0.0, 0.5, 1.0], len(agent_indices))
+                for neighbor_dist, max_neighbors in [(np.inf, 50), (3.0, 50), (np.inf, 3)]:
+                    new_vel = orca.compute_new_velocities(
+                        pos, vel, pref_vel, radius, max_speed, collab_coeff, agent_indices,
+                        neighbor_dist, max_neighbors, 5.0, 0.1)
+                    for k, i in enumerate(agent_indices):
+                        expected = reference_new_velocity(
+                            pos, vel, pref_vel, radius, max_speed, collab_coeff[k], i,
+                            neighbor_dist, max_neighbors, 5.0, 0.1)
+                        np.testing.assert_allclose(new_vel[k], expected, rtol=1e-9, atol=1e-9)
+
+    def test_rvo_agents_avoid_collisions(self):
+        rvo_backend = Config.RVO_BACKEND
+        Config.RVO_BACKEND = "numpy"
+        try:
+            for seed in range(3):
+                np.random.seed(seed)
+                env = CollisionAvoidanceEnv()
+                env.plot_episodes = False
+                env.set_agents(tc.get_testcase_random(num_agents=6, side_length=6.0, policies="RVO"))
+                env.reset()
+                terminated = False
+                while not terminated:
+                    _, _, terminated, _, _ = env.step({})
+                    self.assertFalse(any(agent.in_collision for agent in env.agents))
+                self.assertTrue(any(agent.is_at_goal for agent in env.agents))
+        finally:
+            Config.RVO_BACKEND = rvo_backend
+
+
+if __name__ == "__main__":
+    unittest.main()
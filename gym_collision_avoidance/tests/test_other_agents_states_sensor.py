@@ -0,0 +1,225 @@
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs import test_cases as tc
+from gym_collision_avoidance.envs.collision_avoidance_env import (
+    CollisionAvoidanceEnv,
+)
+from gym_collision_avoidance.envs.sensors.OtherAgentsStatesSensor import (
+    OtherAgentsStatesSensor,
+)
+from gym_collision_avoidance.envs.util import disc_time_to_impact, tangent_vecs_from_external_pt
+
+
+def reference_time_to_impact(host_pos, other_pos, host_vel, other_vel, combined_radius):
+    # Original collision-cone implementation of util.compute_time_to_impact
+    v_rel = host_vel - other_vel
+    coll_cone_vec1, coll_cone_vec2 = tangent_vecs_from_external_pt(
+        host_pos[0], host_pos[1], other_pos[0], other_pos[1], combined_radius)
+    if coll_cone_vec1 is None:
+        return 0.0
+    if not (np.cross(coll_cone_vec1, v_rel) * np.cross(coll_cone_vec1, coll_cone_vec2) >= 0 and
+            np.cross(coll_cone_vec2, v_rel) * np.cross(coll_cone_vec2, coll_cone_vec1) >= 0):
+        return np.inf
+    v0, v1 = v_rel
+    if abs(v0) < 1e-5 and abs(v1) < 1e-5:
+        return np.inf
+    px, py = host_pos
+    a, b = other_pos
+    r = combined_radius
+    if abs(v0) < 1e-5:
+        x1 = x2 = px
+        B = -2*b
+        C = b**2+(px-a)**2-r**2
+        y1 = (-B + np.sqrt(B**2 - 4*C)) / 2
+        y2 = (-B - np.sqrt(B**2 - 4*C)) / 2
+    else:
+        A = 1+(v1/v0)**2
+        B = -2*a + 2*(v1/v0)*(py-b-(v1/v0)*px)
+        C = a**2 - r**2 + ((v1/v0)*px - (py-b))**2
+        x1 = (-B + np.sqrt(B**2 - 4*A*C)) / (2*A)
+        x2 = (-B - np.sqrt(B**2 - 4*A*C)) / (2*A)
+        y1 = (v1/v0)*(x1-px) + py
+        y2 = (v1/v0)*(x2-px) + py
+    d = min(np.linalg.norm([x1-px, y1-py]), np.linalg.norm([x2-px, y2-py]))
+    return d / np.linalg.norm(v_rel)
+
+
+def reference_clipped_sorted_inds(sorting_criteria, agent_sorting_method, max_num_other_agents_observed):
+    # Original (sort from scratch, twice) OtherAgentsStatesSensor.get_clipped_sorted_inds
+    if agent_sorting_method in ['closest_last', 'closest_first']:
+        sorted_sorting_criteria = sorted(sorting_criteria, key=lambda x: (x[1], x[2]))
+    else:
+        sorted_sorting_criteria = sorted(sorting_criteria, key=lambda x: (-x[3], -x[1], x[2]))
+    clipped_sorting_criteria = sorted_sorting_criteria[:max_num_other_agents_observed]
+    if agent_sorting_method == "closest_last":
+        sorted_dists = sorted(clipped_sorting_criteria, key=lambda x: (-x[1], x[2]))
+    elif agent_sorting_method == "closest_first":
+        sorted_dists = sorted(clipped_sorting_criteria, key=lambda x: (x[1], x[2]))
+    else:
+        sorted_dists = sorted(clipped_sorting_criteria, key=lambda x: (-x[3], -x[1], x[2]))
+    return [x[0] for x in sorted_dists]
+
+
+class TestOtherAgentsStatesSensor(unittest.TestCase):
+    def make_env(self, num_agents, agent_sorting_method):
+        env = CollisionAvoidanceEnv()
+        env.plot_episodes = False
+        env.set_agents(
+            tc.get_testcase_random(
+                num_agents=num_agents,
+                side_length=12.0,
+                policies="noncoop",
+                agents_sensors=["other_agents_states"],
+            )
+        )
+        env.reset()
+        for agent in env.agents:
+            agent.sensors = [
+                OtherAgentsStatesSensor(
+                    # fewer than the number of other agents, so some get clipped
+                    max_num_other_agents_observed=3,
+                    agent_sorting_method=agent_sorting_method,
+                )
+            ]
+        return env
+
+    def test_sense_all_matches_sense(self):
+        np.random.seed(0)
+        sensing_horizon = Config.SENSING_HORIZON
+        try:
+            for agent_sorting_method in ["closest_first", "closest_last", "time_to_impact"]:
+                for sensing_horizon_ in [np.inf, 3.0]:
+                    Config.SENSING_HORIZON = sensing_horizon_
+                    for num_agents in [1, 2, 5, 7, 12]:
+                        env = self.make_env(num_agents, agent_sorting_method)
+                        env.world_state.pos_global_frame[:] = np.random.uniform(-4, 4, (num_agents, 2))
+                        env.world_state.vel_global_frame[:] = np.random.uniform(-1, 1, (num_agents, 2))
+                        if num_agents % 2 == 0:
+                            # Positions/velocities on a coarse lattice, so there are plenty of ties to break
+                            env.world_state.pos_global_frame[:] = np.round(env.world_state.pos_global_frame * 2) / 2
+                            env.world_state.vel_global_frame[:] = np.round(env.world_state.vel_global_frame * 2) / 2
+
+                        expected = []
+                        for i, agent in enumerate(env.agents):
+                            other_agents_states = agent.sensors[0].sense(env.agents, i)
+                            expected.append((other_agents_states, agent.num_other_agents_observed))
+
+                        measurements = OtherAgentsStatesSensor.sense_all(env.agents)
+                        for i, agent in enumerate(env.agents):
+                            np.testing.assert_array_equal(measurements[i], expected[i][0])
+                            self.assertEqual(agent.num_other_agents_observed, expected[i][1])
+
+                        # Only some agents sense (but all of them can be observed)
+                        agent_indices = [i for i in range(num_agents) if i % 3 != 1]
+                        measurements = OtherAgentsStatesSensor.sense_all(env.agents, agent_indices)
+                        self.assertEqual(sorted(measurements.keys()), agent_indices)
+                        for i in agent_indices:
+                            np.testing.assert_array_equal(measurements[i], expected[i][0])
+        finally:
+            Config.SENSING_HORIZON = sensing_horizon
+
+    def run_env(self, config, policies, policy_distr):
+        # A few steps of a random scene, with some Config attributes overridden
+        saved_config = {key: getattr(Config, key) for key in config}
+        try:
+            for key, value in config.items():
+                setattr(Config, key, value)
+            np.random.seed(3)
+            env = CollisionAvoidanceEnv()
+            env.plot_episodes = False
+            agents = tc.get_testcase_random(
+                num_agents=4,
+                side_length=6.0,
+                policies=policies,
+                policy_distr=policy_distr,
+                policy_to_ensure=policies[0],
+            )
+            for agent in agents:
+                if agent.policy.str == "GA3C_CADRL":
+                    agent.policy.initialize_network()
+            env.set_agents(agents)
+            env.reset()
+            for _ in range(5):
+                obs = env.step({})[0]
+            return env, obs
+        finally:
+            for key, value in saved_config.items():
+                setattr(Config, key, value)
+
+    def test_env_only_senses_agents_whose_policy_uses_obs(self):
+        policies, policy_distr = ["GA3C_CADRL", "noncoop", "static"], [0.4, 0.3, 0.3]
+        env, obs = self.run_env({}, policies, policy_distr)
+        recording_env, recorded_obs = self.run_env({"RECORD_ALL_OBSERVATIONS": True}, policies, policy_distr)
+
+        observing_agents = env.observing_agents
+        self.assertEqual(observing_agents, [i for i, agent in enumerate(env.agents) if agent.policy.str == "GA3C_CADRL"])
+        self.assertTrue(0 < len(observing_agents) < len(env.agents))
+        self.assertEqual(recording_env.observing_agents, list(range(len(env.agents))))
+        for i in range(len(env.agents)):
+            for state in Config.STATES_IN_OBS:
+                if i in observing_agents:
+                    np.testing.assert_array_equal(obs[i][state], recorded_obs[i][state])
+                else:
+                    self.assertFalse(np.any(obs[i][state]))
+
+    def test_env_skips_sensing_by_default(self):
+        # (with the default Config, e.g. D4RL on, nobody in a scene of policies that ignore their obs gets sensed)
+        env, obs = self.run_env({}, ["RVO", "noncoop", "static"], [0.4, 0.3, 0.3])
+        self.assertEqual(env.observing_agents, [])
+        for i in range(len(env.agents)):
+            for state in Config.STATES_IN_OBS:
+                self.assertFalse(np.any(obs[i][state]))
+
+    def test_env_observes_every_agent_when_recording_observations(self):
+        # (RVO ignores its obs, but a D4RL dataset stores everybody's)
+        env, obs = self.run_env({"RECORD_ALL_OBSERVATIONS": True}, ["RVO"], [1.0])
+        self.assertEqual(env.observing_agents, list(range(len(env.agents))))
+        for i in range(len(env.agents)):
+            self.assertTrue(np.any(obs[i]["dist_to_goal"]))
+            self.assertTrue(np.any(obs[i]["other_agents_states"]))
+
+    def test_incremental_sort_matches_full_sort(self):
+        np.random.seed(2)
+        for agent_sorting_method in ["closest_first", "closest_last", "time_to_impact"]:
+            for max_num_other_agents_observed in [0, 1, 3, 10, 40]:
+                sensor = OtherAgentsStatesSensor(max_num_other_agents_observed, agent_sorting_method)
+                pos = np.random.uniform(-5, 5, (30, 2))
+                for step in range(40):
+                    if step % 10 == 9:
+                        # Big shuffle every now and then
+                        pos = np.random.uniform(-5, 5, (30, 2))
+                    pos += np.random.uniform(-0.1, 0.1, pos.shape)
+                    # Agents come and go, and distances are rounded (like in sense), so there are ties
+                    visible = np.flatnonzero(np.random.uniform(size=30) < 0.9)
+                    sorting_criteria = [
+                        [i, round(np.linalg.norm(pos[i]), 1), np.round(pos[i, 1], 1), np.random.choice([1.0, 2.0, np.inf])]
+                        for i in visible
+                    ]
+                    self.assertEqual(
+                        sensor.get_clipped_sorted_inds(sorting_criteria),
+                        reference_clipped_sorted_inds(sorting_criteria, agent_sorting_method, max_num_other_agents_observed))
+
+    def test_time_to_impact_matches_collision_cone(self):
+        np.random.seed(1)
+        host_pos = np.random.uniform(-4, 4, (2000, 2))
+        other_pos = np.random.uniform(-4, 4, (2000, 2))
+        host_vel = np.random.uniform(-1, 1, (2000, 2))
+        other_vel = np.random.uniform(-1, 1, (2000, 2))
+        # Some pairs not moving relative to each other, or moving straight along the y-axis
+        other_vel[:100] = host_vel[:100]
+        other_vel[100:200, 0] = host_vel[100:200, 0]
+        combined_radius = np.random.uniform(0.4, 2.0, 2000)
+        time_to_impact = disc_time_to_impact(host_pos - other_pos, host_vel - other_vel, combined_radius)
+        for k in range(2000):
+            expected = reference_time_to_impact(host_pos[k], other_pos[k], host_vel[k], other_vel[k], combined_radius[k])
+            if np.isinf(expected):
+                self.assertTrue(np.isinf(time_to_impact[k]))
+            else:
+                self.assertAlmostEqual(time_to_impact[k], expected, places=8)
+
+
+if __name__ == "__main__":
+    unittest.main()
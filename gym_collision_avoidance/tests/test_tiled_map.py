@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs.agent import Agent
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import UnicycleDynamics
+from gym_collision_avoidance.envs.Map import Map
+from gym_collision_avoidance.envs.policies.NonCooperativePolicy import NonCooperativePolicy
+from gym_collision_avoidance.envs.sensors.LaserScanSensor import LaserScanSensor
+from gym_collision_avoidance.envs.sensors.OccupancyGridSensor import OccupancyGridSensor
+from gym_collision_avoidance.envs.tiled_map import TiledMap
+
+world_maps_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'envs', 'world_maps')
+
+
+class TestTiledMap(unittest.TestCase):
+    def setUp(self):
+        self.use_static_map = Config.USE_STATIC_MAP
+        Config.USE_STATIC_MAP = True
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        Config.USE_STATIC_MAP = self.use_static_map
+        self.cache_dir.cleanup()
+
+    def make_maps(self, map_filename):
+        # (tiles don't evenly divide the 500 x 500 cell map)
+        dense_map = Map(50, 50, 0.1, map_filename)
+        tiled_map = TiledMap(50, 50, 0.1, map_filename, cache_dir=self.cache_dir.name, tile_size=64, halo=20)
+        return dense_map, tiled_map
+
+    def test_matches_dense_map(self):
+        np.random.seed(0)
+        for map_filename in [os.path.join(world_maps_dir, '001.png'), None]:
+            dense_map, tiled_map = self.make_maps(map_filename)
+
+            pos = np.random.uniform(-26, 26, (300, 2))
+            radius = np.random.uniform(0.05, 2.0, 300)
+            np.testing.assert_array_equal(tiled_map.in_static_collision(pos, radius), dense_map.in_static_collision(pos, radius))
+            # Clearance is capped at halo, but is exact below it
+            np.testing.assert_array_equal(tiled_map.clearance_lower_bound(pos),
+                                          np.minimum(dense_map.clearance_lower_bound(pos), 20*0.1))
+
+            agents = []
+            for i in range(12):
+                x, y = np.random.uniform(-22, 22, 2)
+                agent = Agent(x, y, 0., 0., np.random.uniform(0.2, 0.5), 1.0, np.random.uniform(-np.pi, np.pi),
+                              NonCooperativePolicy, UnicycleDynamics, [], i)
+                agent.sensors = [LaserScanSensor(), OccupancyGridSensor()]
+                agent.sensors[1].set_args({'grid_cell_size': 0.5, 'ego_frame': i % 2 == 0})
+                agents.append(agent)
+            for step in range(3):
+                for top_down_map in [dense_map, tiled_map]:
+                    top_down_map.add_agents_to_map(agents)
+                gxs, gys = np.indices(dense_map.dims)
+                np.testing.assert_array_equal(tiled_map.occupied(gxs, gys), dense_map.map)
+                # (both scans go into the same history, so compare the newest one)
+                dense_scans = LaserScanSensor.sense_all(agents, dense_map)
+                tiled_scans = LaserScanSensor.sense_all(agents, tiled_map)
+                dense_grids = OccupancyGridSensor.sense_all(agents, dense_map)
+                tiled_grids = OccupancyGridSensor.sense_all(agents, tiled_map)
+                for i in range(len(agents)):
+                    np.testing.assert_array_equal(tiled_scans[i][0], dense_scans[i][0])
+                    np.testing.assert_array_equal(tiled_grids[i], dense_grids[i])
+                for agent in agents:
+                    agent.pos_global_frame = agent.pos_global_frame + np.random.uniform(-1, 1, 2)
+
+    def test_cell_sizes_get_their_own_tiles(self):
+        np.random.seed(1)
+        map_filename = os.path.join(world_maps_dir, '001.png')
+        pos = np.random.uniform(-24, 24, (300, 2))
+        # (same dims, so only grid_cell_size tells the two tile stores apart, and clearances [m] differ)
+        for x_width, grid_cell_size in [(50, 0.1), (100, 0.2)]:
+            dense_map = Map(x_width, x_width, grid_cell_size, map_filename)
+            tiled_map = TiledMap(x_width, x_width, grid_cell_size, map_filename, cache_dir=self.cache_dir.name, tile_size=64, halo=20)
+            scaled_pos = pos * x_width / 50.
+            np.testing.assert_array_equal(tiled_map.clearance_lower_bound(scaled_pos),
+                                          np.minimum(dense_map.clearance_lower_bound(scaled_pos), 20*grid_cell_size))
+
+    def test_only_visited_tiles_are_loaded(self):
+        _, tiled_map = self.make_maps(os.path.join(world_maps_dir, '001.png'))
+        agents = [Agent(-22. + 0.5*i, 20., 0., 0., 0.3, 1.0, 0., NonCooperativePolicy, UnicycleDynamics, [], i) for i in range(4)]
+        tiled_map.add_agents_to_map(agents)
+        tiled_map.in_static_collision(np.array([agent.pos_global_frame for agent in agents]), 0.3)
+        self.assertEqual(tiled_map.num_resident_tiles, 1)
+        self.assertLess(tiled_map.num_resident_tiles, tiled_map.tile_slots.size)
+
+        # A second map of the same file only memory-maps the preprocessed tiles
+        num_files = len(os.listdir(self.cache_dir.name))
+        _, tiled_map = self.make_maps(os.path.join(world_maps_dir, '001.png'))
+        self.assertIsInstance(tiled_map.tile_store['static_map'], np.memmap)
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), num_files)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import unittest
+
+import numpy as np
+from matplotlib.path import Path
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs.agent import Agent
+from gym_collision_avoidance.envs.dynamics.UnicycleDynamics import UnicycleDynamics
+from gym_collision_avoidance.envs.policies.NonCooperativePolicy import NonCooperativePolicy
+from gym_collision_avoidance.envs.sensors.LaserScanSensor import LaserScanSensor
+from gym_collision_avoidance.envs.vector_map import SegmentBVH, VectorMap
+
+world_maps_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'envs', 'world_maps')
+
+
+def reference_ray_distance(origin, direction, segments, circles, max_range):
+    # Solve origin + t*direction = a + s*(b-a) for every segment, and |origin + t*direction - c| = R for every circle
+    best = max_range
+    for a, b in segments:
+        matrix = np.array([direction, a - b]).T
+        if abs(np.linalg.det(matrix)) < 1e-12:
+            continue
+        t, s = np.linalg.solve(matrix, a - origin)
+        if t >= 0 and 0 <= s <= 1:
+            best = min(best, t)
+    for center, radius in circles:
+        if np.linalg.norm(origin - center) <= radius:
+            return 0.
+        roots = np.roots([1., 2*np.dot(origin - center, direction), np.dot(origin - center, origin - center) - radius**2])
+        roots = roots[np.isreal(roots)].real
+        if len(roots) > 0 and np.min(roots) >= 0:
+            best = min(best, np.min(roots))
+    return best
+
+
+def reference_in_static_collision(vector_map, pos, radius):
+    for a, b in vector_map.segments:
+        s = np.clip(np.dot(pos - a, b - a) / np.dot(b - a, b - a), 0, 1)
+        if np.linalg.norm(a + s*(b - a) - pos) < radius:
+            return True
+    return any(Path(polygon).contains_point(pos) for polygon in vector_map.polygons)
+
+
+class TestVectorMap(unittest.TestCase):
+    def test_bvh_rays_match_every_segment(self):
+        np.random.seed(0)
+        starts = np.random.uniform(-10, 10, (200, 2))
+        segments = np.stack([starts, starts + np.random.uniform(-2, 2, (200, 2))], axis=1)
+        # Some rays are axis-aligned
+        angles = np.concatenate([np.random.uniform(-np.pi, np.pi, 300), np.arange(-2, 2) * np.pi/2])
+        origins = np.random.uniform(-12, 12, (len(angles), 2))
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+        ranges = SegmentBVH(segments).intersect_rays(origins, directions, 8.)
+        for k in range(len(angles)):
+            self.assertAlmostEqual(ranges[k], reference_ray_distance(origins[k], directions[k], segments, [], 8.), places=9)
+
+    def test_disc_collisions_match_brute_force(self):
+        np.random.seed(1)
+        vector_map = VectorMap(16, 16, 0.1, os.path.join(world_maps_dir, 'corridor.yaml'))
+        pos = np.random.uniform(-6, 6, (400, 2))
+        radius = np.random.uniform(0.05, 1.0, 400)
+        in_collision = vector_map.in_static_collision(pos, radius)
+        for k in range(len(pos)):
+            self.assertEqual(in_collision[k], reference_in_static_collision(vector_map, pos[k], radius[k]))
+        # A disc inside a polygon (not touching its edges) and the raster of that polygon
+        self.assertTrue(vector_map.in_static_collision(np.array([[0., 1.5]]), 0.1)[0])
+        [gx, gy], _ = vector_map.world_coordinates_to_map_indices(np.array([0., 1.5]))
+        self.assertTrue(vector_map.static_map[gx, gy])
+
+    def test_laserscan_matches_brute_force(self):
+        np.random.seed(2)
+        use_static_map = Config.USE_STATIC_MAP
+        Config.USE_STATIC_MAP = True
+        try:
+            vector_map = VectorMap(16, 16, 0.1, os.path.join(world_maps_dir, 'corridor.yaml'))
+            agents = []
+            for i in range(6):
+                x, y = np.random.uniform([-6, -2], [6, 2])
+                agent = Agent(x, y, 0., 0., np.random.uniform(0.2, 0.5), 1.0, np.random.uniform(-np.pi, np.pi),
+                              NonCooperativePolicy, UnicycleDynamics, [], i)
+                agent.sensors = [LaserScanSensor()]
+                agents.append(agent)
+            vector_map.add_agents_to_map(agents)
+            measurements = LaserScanSensor.sense_all(agents, vector_map)
+            for i, agent in enumerate(agents):
+                sensor = agent.sensors[0]
+                circles = [(other.pos_global_frame, other.radius) for other in agents if other is not agent]
+                for beam in range(0, sensor.num_beams, 8):
+                    angle = sensor.angles[beam] + agent.heading_global_frame
+                    expected = reference_ray_distance(agent.pos_global_frame, np.array([np.cos(angle), np.sin(angle)]),
+                                                      vector_map.segments, circles, sensor.max_range)
+                    self.assertAlmostEqual(measurements[i][0][beam], expected, places=9)
+        finally:
+            Config.USE_STATIC_MAP = use_static_map
+
+
+if __name__ == "__main__":
+    unittest.main()
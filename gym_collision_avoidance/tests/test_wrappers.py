@@ -0,0 +1,104 @@
+import unittest
+
+import numpy as np
+
+from gym_collision_avoidance.envs import Config
+from gym_collision_avoidance.envs import test_cases as tc
+from gym_collision_avoidance.envs.collision_avoidance_env import (
+    CollisionAvoidanceEnv,
+)
+from gym_collision_avoidance.envs.wrappers import (
+    FlattenDictWrapper,
+    MultiagentDictToMultiagentArrayWrapper,
+)
+
+
+class TestWrappers(unittest.TestCase):
+    def setUp(self):
+        # (noncoop agents ignore their obs, so they're only sensed if observations are recorded)
+        self.record_all_observations = Config.RECORD_ALL_OBSERVATIONS
+        Config.RECORD_ALL_OBSERVATIONS = True
+
+    def tearDown(self):
+        Config.RECORD_ALL_OBSERVATIONS = self.record_all_observations
+
+    def make_env(self, use_flat_observation_buffer):
+        flat = Config.USE_FLAT_OBSERVATION_BUFFER
+        Config.USE_FLAT_OBSERVATION_BUFFER = use_flat_observation_buffer
+        try:
+            env = CollisionAvoidanceEnv()
+        finally:
+            Config.USE_FLAT_OBSERVATION_BUFFER = flat
+        env.plot_episodes = False
+        np.random.seed(0)
+        env.set_agents(
+            tc.get_testcase_random(
+                num_agents=3, side_length=6.0, policies="noncoop"
+            )
+        )
+        return env
+
+    def test_flat_observation_buffer(self):
+        dict_env = self.make_env(use_flat_observation_buffer=False)
+        flat_env = self.make_env(use_flat_observation_buffer=True)
+        wrapped_dict_env = MultiagentDictToMultiagentArrayWrapper(
+            dict_env,
+            dict_keys=Config.STATES_IN_OBS,
+            max_num_agents=Config.MAX_NUM_AGENTS_IN_ENVIRONMENT,
+        )
+        wrapped_flat_env = MultiagentDictToMultiagentArrayWrapper(
+            flat_env,
+            dict_keys=Config.STATES_IN_OBS,
+            max_num_agents=Config.MAX_NUM_AGENTS_IN_ENVIRONMENT,
+        )
+        wrapped_dict_env.reset()
+        wrapped_flat_env.reset()
+        all_dict_obs, all_flat_obs = [], []
+        for _ in range(3):
+            dict_obs = wrapped_dict_env.step({})[0]
+            flat_obs = wrapped_flat_env.step({})[0]
+            all_dict_obs.append(dict_obs)
+            all_flat_obs.append(flat_obs)
+
+            # The wrapper hands back a copy of the env's own array (which is also available without copying),
+            # with the same layout as the per-key path
+            self.assertFalse(np.shares_memory(flat_obs, flat_env.observation_array))
+            self.assertTrue(np.shares_memory(wrapped_flat_env.native_observation_array(), flat_env.observation_array))
+            np.testing.assert_array_equal(wrapped_flat_env.native_observation_array(), flat_obs)
+            np.testing.assert_allclose(flat_obs, dict_obs.astype(np.float32))
+
+            # Converting back to a dict gives views, shaped like the env's dict obs
+            obs = wrapped_flat_env.observationArrayToDict(flat_obs)
+            for agent in range(len(flat_env.agents)):
+                for key in Config.STATES_IN_OBS:
+                    self.assertTrue(np.shares_memory(obs[agent][key], flat_obs))
+                    np.testing.assert_array_equal(
+                        obs[agent][key], flat_env.observation[agent][key]
+                    )
+
+            multi_env_obs = wrapped_flat_env.multiEnvObservationArrayToDict(
+                flat_obs[np.newaxis]
+            )
+            np.testing.assert_array_equal(
+                multi_env_obs[0][1]["other_agents_states"],
+                flat_env.observation[1]["other_agents_states"],
+            )
+
+        # Observations kept from earlier steps (e.g., in a dataset) aren't overwritten by later steps
+        for dict_obs, flat_obs in zip(all_dict_obs, all_flat_obs):
+            np.testing.assert_allclose(flat_obs, dict_obs.astype(np.float32))
+        self.assertFalse(np.array_equal(all_flat_obs[0], all_flat_obs[-1]))
+
+    def test_flatten_dict_wrapper(self):
+        env = FlattenDictWrapper(
+            self.make_env(use_flat_observation_buffer=True),
+            dict_keys=Config.STATES_IN_OBS,
+        )
+        obs = env.reset()[0]
+        self.assertEqual(obs.shape, env.observation_space.shape)
+        self.assertFalse(np.shares_memory(obs, env.unwrapped.observation_array))
+        np.testing.assert_array_equal(obs, env.native_observation_array())
+
+
+if __name__ == "__main__":
+    unittest.main()